@@ -1,6 +1,5 @@
-from displaymanager import DisplayManager, BusTracker, WeatherTracker, Screen
-import time
-import datetime
+from displaymanager import DisplayManager, BusTracker, WeatherTracker, Screen, Scheduler, DwellPolicy, ConfigWatcher, Recorder, loadConfig, currentDayPart, secondsToNextDayPart
+from lib.waveshare_epd import epdmetrics
 from dotenv import load_dotenv
 import os
 
@@ -11,92 +10,98 @@ load_dotenv()
 weather_api_key = os.getenv('OPEN_WEATHER_MAP_API_KEY')
 news_api_key = os.getenv('NEWS_API_KEY')
 bus_api_key = os.getenv('CTA_BUS_API_KEY')
-lat = os.getenv('LAT')
-lon = os.getenv('LON')
+
+# tracked stops, location, day parts and refresh budget, reloaded on change
+config_path = os.getenv('DISPLAY_CONFIG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'display.toml'))
+config = loadConfig(config_path)
+
+def location(config):
+    return config.location or (os.getenv('LAT'), os.getenv('LON'))
+
+# per-stage timings, from the first init on
+epdmetrics.enable()
+if config.metrics.get('listen'):
+    epdmetrics.serve(config.metrics['listen'])
 
 displayManager = DisplayManager()
 
-weatherTracker = WeatherTracker(displayManager, weather_api_key, lat, lon)
-
-tracked_buses = [{"route": "X9",
-                  "stop_id": "6024",
-                  "stop_number": "X9",
-                  "stop_name": "Ashland & Division",
-                  "direction": "Southbound"},
-
-                 {"route": "9",
-                  "stop_id": "14619",
-                  "stop_number": "9",
-                  "stop_name": "Ashland & Blackhawk",
-                  "direction": "Southbound"},
-
-                  {"route": "72",
-                  "stop_id": "903",
-                  "stop_number": "72",
-                  "stop_name": "North & Bosworth",
-                  "direction": "Eastbound"}]
-
-busTracker = BusTracker(displayManager, bus_api_key, tracked_buses=tracked_buses)
-
-def queueScreensMorning():
-    message = 'I love you\n        - Alan'
-    displayManager.addScreenToQueue(Screen(displayManager.textScreen, message, partial=False, display_time=5))
-    busTracker.queueTrackedBusScreens(5)
-    weatherTracker.queueWeatherScreens(5)
-
-def queueScreensAfternoon():
-    busTracker.queueTrackedBusScreens(10)
-    weatherTracker.queueWeatherScreens(10)
-    
-def queueScreensEvening():
-    busTracker.queueTrackedBusScreens(10)
-    weatherTracker.queueWeatherScreens(10)
-
-def queueScreensNight():
-    message = 'Get some sleep,\n    good night! Zzz'
-    displayManager.addScreenToQueue(Screen(displayManager.textScreen, message, partial=False, display_time=10))
-    weatherTracker.queueWeatherScreens(10)
-
-last_weather_execution_time = time.time()  # Set initial value to trigger first execution
-last_queue_execution_time = time.time() - 3600  # Set initial value to trigger first execution
-
-while True:
-    current_time = time.time()
-    if current_time - last_weather_execution_time >= 180:
-        weatherTracker.update()
-        last_weather_execution_time = current_time
-
-    now = datetime.datetime.now().time()
-
-    # Define the time ranges for each block
-    morning_start = datetime.time(6, 30)
-    afternoon_start = datetime.time(12, 0)
-    evening_start = datetime.time(18, 0)
-    night_end = datetime.time(22, 0)
-
-    if morning_start <= now < afternoon_start:
-        if current_time - last_queue_execution_time >= 300:
-            print('Refreshing queue, checking for bus alerts')
-            displayManager.clearQueue()
-            queueScreensMorning()
-            last_queue_execution_time = current_time
-    elif afternoon_start <= now < evening_start:
-        if current_time - last_queue_execution_time >= 300:
-            print('Refreshing queue, checking for bus alerts')
-            displayManager.clearQueue()
-            queueScreensAfternoon()
-            last_queue_execution_time = current_time
-    elif evening_start <= now < night_end:
-        if current_time - last_queue_execution_time >= 300:
-            print('Refreshing queue, checking for bus alerts')
-            displayManager.clearQueue()
-            queueScreensEvening()
-            last_queue_execution_time = current_time
-    else:
-        if current_time - last_queue_execution_time >= 300:
-            print('Refreshing queue, checking for bus alerts')
-            displayManager.clearQueue()
-            queueScreensNight()
-            last_queue_execution_time = current_time
-
-    displayManager.displayQueue()
\ No newline at end of file
+# from before the first fetch, so a recording replays from the start
+if config.recording.get('dir'):
+    Recorder(config.recording['dir'], int(config.recording.get('segment_mb', 8) * 2**20),
+             config.recording.get('keep', 20)).start(displayManager)
+
+# unchanged screens are skipped or cut short, refreshes kept to the budget
+displayManager.main.dwell = DwellPolicy(refreshes_per_hour=config.refreshes_per_hour)
+
+weatherTracker = WeatherTracker(displayManager, weather_api_key, *location(config))
+
+busTracker = BusTracker(displayManager, bus_api_key, tracked_buses=config.buses)
+
+# screen sources a day part can name, one for each of displaymanager.SCREENS
+sources = {
+    'message': lambda part: displayManager.addScreenToQueue(
+        Screen(displayManager.textScreen, part.message, display_time=part.display_time)),
+    'buses': lambda part: busTracker.queueTrackedBusScreens(part.display_time),
+    'weather': lambda part: weatherTracker.queueWeatherScreens(part.display_time),
+}
+
+scheduler = Scheduler()
+
+def refreshQueue():
+    part = currentDayPart(config.day_parts)
+    print(f'Refreshing queue for the {part.name}, checking for bus alerts')
+    displayManager.clearQueue()
+    for source in part.screens:
+        sources[source](part)
+    displayManager.startRotation(scheduler)
+
+# switch screens as soon as a new part of the day starts
+def dayPartChanged():
+    global day_part_job
+    refreshQueue()
+    day_part_job = scheduler.after(secondsToNextDayPart(config.day_parts), dayPartChanged)
+
+# Apply an edited config without a restart, touching only what changed:
+# removed stops leave the queue and added ones join it, a new location
+# fetches the weather again, and the queue is only rebuilt when the
+# current day part itself changed.
+def reloadConfig():
+    global config, day_part_job
+    try:
+        new = loadConfig(config_path)
+    except (OSError, ValueError) as e:
+        print(f'Keeping the old config, {config_path}: {e}')
+        return
+    old, config = config, new
+    print(f'Reloaded {config_path}')
+    part = currentDayPart(config.day_parts)
+
+    if config.refreshes_per_hour != old.refreshes_per_hour:
+        displayManager.main.dwell.refreshes_per_hour = config.refreshes_per_hour
+    added = busTracker.setTrackedBuses(config.buses)
+    moved = weatherTracker.moveTo(*location(config))
+
+    if config.day_parts != old.day_parts:
+        day_part_job.cancel()
+        day_part_job = scheduler.after(secondsToNextDayPart(config.day_parts), dayPartChanged)
+        if part != currentDayPart(old.day_parts):
+            refreshQueue()
+            return
+    if 'buses' in part.screens:
+        for bus in added:
+            busTracker.queueBusScreens(bus, part.display_time)
+    if moved and 'weather' in part.screens:
+        # moveTo() dropped the screens drawn for the old location
+        weatherTracker.queueWeatherScreens(part.display_time)
+    displayManager.startRotation(scheduler)
+
+if config.metrics.get('file'):
+    interval = config.metrics.get('interval', 60)
+    scheduler.every(interval, epdmetrics.write, config.metrics['file'], first=interval)
+scheduler.every(180, weatherTracker.update, first=180)
+scheduler.every(300, refreshQueue)
+day_part_job = scheduler.after(secondsToNextDayPart(config.day_parts), dayPartChanged)
+# the header clock changes on the minute, not only when a screen is drawn
+displayManager.startClock(scheduler)
+ConfigWatcher(config_path, reloadConfig, scheduler).start()
+scheduler.run()
@@ -1,54 +1,846 @@
 import time
-from lib.waveshare_epd import epd2in13_V3
-from PIL import Image, ImageDraw, ImageFont, ImageOps
-from datetime import datetime
-import requests
+import importlib
+import inspect
+from lib import waveshare_epd
+from lib.waveshare_epd import epdconfig, epdseq, epdmetrics
+from datetime import datetime, timedelta, time as dt_time
 from io import BytesIO
 import json
 import threading
+import collections
+import heapq
+import itertools
+from concurrent.futures import Future, ThreadPoolExecutor
 import signal
 import sys
-import xml.etree.ElementTree as ET
-
+import os
+import ctypes
+import ctypes.util
+import struct
+import gzip
+import base64
+import glob
+import urllib.parse
+try:
+    import tomllib
+except ImportError:
+    # Python before 3.11
+    import tomli as tomllib
+
+# seconds spent on each startup step, reported when the first screen goes up
+startup_times = {}
+_started = time.perf_counter()
+
+
+class _LazyModule:
+    # stands in for a heavy module until one of its attributes is used
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            start = time.perf_counter()
+            self._module = importlib.import_module(self._name)
+            startup_times['import ' + self._name] = time.perf_counter() - start
+        return getattr(self._module, attr)
+
+
+Image = _LazyModule('PIL.Image')
+ImageDraw = _LazyModule('PIL.ImageDraw')
+ImageFont = _LazyModule('PIL.ImageFont')
+ImageOps = _LazyModule('PIL.ImageOps')
+requests = _LazyModule('requests')
+ET = _LazyModule('xml.etree.ElementTree')
+
+
+# a Recorder while a session is recorded, see Recorder.start()
+recorder = None
+
+
+# requests.get, timed per upstream as epd_fetch_seconds
+def fetch(upstream, url, **kwargs):
+    started = time.time()
+    start = time.perf_counter()
+    response = error = None
+    try:
+        with epdmetrics.span('fetch', upstream=upstream):
+            response = requests.get(url, **kwargs)
+        return response
+    except IOError as e:
+        error = e
+        raise
+    finally:
+        if recorder is not None:
+            recorder.fetched(upstream, url, kwargs.get('params'), response, error,
+                             started, time.perf_counter() - start)
+
+
+def startupReport():
+    print('Startup times:')
+    for step, seconds in startup_times.items():
+        print(f'  {step:<32}{seconds:7.3f}s')
+
+
+# A part of the day and what to show during it, from start until the next
+# part starts. screens name the sources queued, in order, each screen is
+# up for display_time seconds; message is for the 'message' source.
+DayPart = collections.namedtuple('DayPart', 'name start screens display_time message', defaults=(None,))
+
+
+# the part now falls in, parts sorted by start time; before the first
+# start it is still the last part, so night runs past midnight
+def currentDayPart(parts, now=None):
+    now = now or datetime.now()
+    current = parts[-1]
+    for part in parts:
+        if part.start <= now.time():
+            current = part
+    return current
+
+
+# seconds from now until the next part starts
+def secondsToNextDayPart(parts, now=None):
+    now = now or datetime.now()
+    starts = [datetime.combine(now.date(), part.start) for part in parts]
+    starts.append(datetime.combine(now.date() + timedelta(days=1), parts[0].start))
+    return min((start - now).total_seconds() for start in starts if start > now)
+
+
+# What display.py reads from its config file: location is (lat, lon) or
+# None to use LAT/LON from .env, buses the tracked stops, day_parts sorted
+# by start, refreshes_per_hour the main panel's refresh budget (None: no
+# limit), metrics the [metrics] table and recording the [recording] table
+# as dicts.
+Config = collections.namedtuple('Config', 'location buses day_parts refreshes_per_hour metrics recording')
+
+BUS_FIELDS = ('route', 'stop_id', 'stop_number', 'stop_name', 'direction')
+# screen sources a day part can name, see sources in display.py
+SCREENS = ('message', 'buses', 'weather')
+
+
+# Read a TOML config file, see display.toml. Raises OSError when it cannot
+# be read and ValueError when it is not valid.
+def loadConfig(path):
+    with open(path, 'rb') as f:
+        data = tomllib.load(f)
+    try:
+        location = data.get('location')
+        if location is not None:
+            location = (float(location['lat']), float(location['lon']))
+        buses = []
+        for bus in data.get('buses', []):
+            buses.append({field: str(bus[field]) for field in BUS_FIELDS})
+        day_parts = []
+        for part in data['day_parts']:
+            if not isinstance(part['start'], dt_time):
+                raise ValueError(f"day part {part['name']}: start is not a time of day")
+            unknown = [screen for screen in part['screens'] if screen not in SCREENS]
+            if unknown:
+                raise ValueError(f"day part {part['name']}: unknown screens {', '.join(map(str, unknown))},"
+                                 f" choose from {', '.join(SCREENS)}")
+            if 'message' in part['screens'] and not part.get('message'):
+                raise ValueError(f"day part {part['name']}: shows a message but has none")
+            day_parts.append(DayPart(part['name'], part['start'], tuple(part['screens']),
+                                     part['display_time'], part.get('message')))
+        if not day_parts:
+            raise ValueError('no day parts')
+        refreshes_per_hour = data.get('rotation', {}).get('refreshes_per_hour')
+        metrics = dict(data.get('metrics', {}))
+        recording = dict(data.get('recording', {}))
+    except (KeyError, TypeError) as e:
+        raise ValueError(f'missing or wrong setting {e}')
+    return Config(location, buses, sorted(day_parts, key=lambda part: part.start), refreshes_per_hour, metrics,
+                  recording)
+
+
+class ConfigWatcher:
+    # Calls changed() on the scheduler's thread when the file at path is
+    # written or replaced (editors save by renaming a new file over it),
+    # once per burst of writes settle seconds apart. Watches the directory
+    # with inotify; where there is none it checks the file's mtime every
+    # poll seconds instead.
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self, path, changed, scheduler, settle=0.5, poll=5) -> None:
+        self.path = os.path.abspath(path)
+        self.changed = changed
+        self.scheduler = scheduler
+        self.settle = settle
+        self.poll = poll
+        self.job = None
+        self.mtime = self._mtime()
+
+    def start(self):
+        try:
+            fd = self._inotify()
+        except (OSError, AttributeError) as e:
+            print(f'No inotify ({e}), checking {self.path} every {self.poll}s')
+            self.scheduler.every(self.poll, self._check, first=self.poll)
+            return
+        threading.Thread(target=self._watch, args=(fd,), name='config', daemon=True).start()
+
+    def _inotify(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if libc.inotify_add_watch(fd, os.fsencode(os.path.dirname(self.path)), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, 'inotify_add_watch failed')
+        return fd
+
+    def _watch(self, fd):
+        name = os.fsencode(os.path.basename(self.path))
+        while True:
+            data = os.read(fd, 4096)
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = self.EVENT.unpack_from(data, offset)
+                offset += self.EVENT.size
+                if data[offset:offset + length].rstrip(b'\0') == name:
+                    self._settle()
+                offset += length
+
+    def _settle(self):
+        if self.job is not None:
+            self.job.cancel()
+        self.job = self.scheduler.after(self.settle, self.changed)
+
+    def _mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _check(self):
+        mtime = self._mtime()
+        if mtime != self.mtime:
+            self.mtime = mtime
+            self.changed()
+
+
+class Recorder:
+    # Records a running display so replay.py can run it again: each
+    # upstream response, rendered image and frame sent to a panel, with
+    # the wall-clock time it started and how long it took. Records are
+    # JSON lines in gzip files in directory, a new file once one holds
+    # segment_bytes (uncompressed), and only the newest keep files stay.
+    # API keys are left out of the recorded URLs and parameters.
+    SECRETS = ('key', 'appid')
+
+    def __init__(self, directory, segment_bytes=8 << 20, keep=20) -> None:
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.keep = keep
+        self.lock = threading.Lock()
+        self.file = None
+        self.written = 0
+        self.session = None
+
+    # record from now on what manager and its panels do
+    def start(self, manager):
+        global recorder
+        os.makedirs(self.directory, exist_ok=True)
+        self.session = {
+            'kind': 'session',
+            't': time.time(),
+            'utcoffset': datetime.now().astimezone().utcoffset().total_seconds(),
+            'panels': [{'name': panel.name, 'driver': panel.driver, 'orientation': panel.orientation}
+                       for panel in manager.panels.values()],
+        }
+        with self.lock:
+            self._rotate()
+        recorder = self
+
+    def stop(self):
+        global recorder
+        if recorder is self:
+            recorder = None
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def _rotate(self):
+        if self.file is not None:
+            self.file.close()
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        path = os.path.join(self.directory, f'session-{stamp}.jsonl.gz')
+        self.file = gzip.open(path, 'wb')
+        self.written = 0
+        # each file starts with the session, so it replays on its own
+        self._write(self.session)
+        for old in sorted(glob.glob(os.path.join(self.directory, 'session-*.jsonl.gz')))[:-self.keep]:
+            os.remove(old)
+
+    def _write(self, record):
+        line = (json.dumps(record, separators=(',', ':')) + '\n').encode()
+        self.file.write(line)
+        self.written += len(line)
+
+    def record(self, record, flush=False):
+        with self.lock:
+            if self.file is None:
+                return
+            if self.written >= self.segment_bytes:
+                self._rotate()
+            self._write(record)
+            if flush:
+                self.file.flush()
+
+    @classmethod
+    def redact(cls, url, params):
+        parts = urllib.parse.urlsplit(url)
+        query = [(name, '' if name in cls.SECRETS else value)
+                 for name, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)]
+        url = urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query)))
+        if params is not None:
+            params = {name: '' if name in cls.SECRETS else value for name, value in params.items()}
+        return url, params
+
+    @staticmethod
+    def screenId(screen):
+        try:
+            args = json.loads(json.dumps(screen.content_args))
+        except (TypeError, ValueError):
+            args = None
+        return {'screen': screen.content_func.__qualname__, 'args': args}
+
+    def fetched(self, upstream, url, params, response, error, started, seconds):
+        url, params = self.redact(url, params)
+        record = {'kind': 'fetch', 't': started, 'ms': seconds * 1000.0,
+                  'upstream': upstream, 'url': url, 'params': params}
+        if response is None:
+            record['error'] = f'{type(error).__name__}: {error}'
+        else:
+            record['status'] = response.status_code
+            record['content'] = base64.b64encode(response.content).decode('ascii')
+        self.record(record)
+
+    def rendered(self, screen, started, seconds):
+        png = BytesIO()
+        screen._image.save(png, 'PNG')
+        record = {'kind': 'render', 't': started, 'ms': seconds * 1000.0,
+                  'image': base64.b64encode(png.getvalue()).decode('ascii')}
+        record.update(self.screenId(screen))
+        self.record(record)
+
+    # a frame sent to panel; window is the (x_start, y_start, x_end, y_end)
+    # of a windowed partial, None for a whole frame
+    def refreshed(self, panel, screen, mode, buf, window, started, seconds):
+        record = {'kind': 'frame', 't': started, 'ms': seconds * 1000.0, 'panel': panel.name,
+                  'mode': mode, 'window': window, 'buf': base64.b64encode(bytes(buf)).decode('ascii')}
+        if screen is not None:
+            record.update(self.screenId(screen))
+            record['partial'] = screen.partial
+        # frames are what matters most when a unit goes down, keep them on disk
+        self.record(record, flush=True)
+
+
+# the records in the recording files at paths, in the order they were made
+def readRecording(paths):
+    for path in sorted(paths):
+        with gzip.open(path, 'rt') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # the last line of a file cut short by a power loss
+                    break
+
+
+class Job:
+    def __init__(self, func, args, interval=None) -> None:
+        self.func = func
+        self.args = args
+        self.interval = interval
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler:
+    # jobs on a timer heap, run() sleeps until the next one is due, so
+    # nothing runs between events. Jobs run one at a time on the thread
+    # that called run(); other threads may add jobs at any time.
+    def __init__(self) -> None:
+        self.heap = []
+        self.counter = itertools.count()
+        self.changed = threading.Condition()
+
+    # run func(*args) at time.monotonic() when, every interval seconds after that if given
+    def at(self, when, func, *args, interval=None):
+        job = Job(func, args, interval)
+        self._push(when, job)
+        return job
+
+    def after(self, delay, func, *args):
+        return self.at(time.monotonic() + delay, func, *args)
+
+    def every(self, interval, func, *args, first=0):
+        return self.at(time.monotonic() + first, func, *args, interval=interval)
+
+    def _push(self, when, job):
+        with self.changed:
+            heapq.heappush(self.heap, (when, next(self.counter), job))
+            self.changed.notify()
+
+    def run(self):
+        while True:
+            with self.changed:
+                while True:
+                    wait = self.heap[0][0] - time.monotonic() if self.heap else None
+                    if wait is not None and wait <= 0:
+                        break
+                    self.changed.wait(wait)
+                when, _, job = heapq.heappop(self.heap)
+            if job.cancelled:
+                continue
+            try:
+                job.func(*job.args)
+            except Exception as e:
+                print(e)
+            if job.interval is not None and not job.cancelled:
+                # a late run does not bunch up the ones after it
+                self._push(max(when + job.interval, time.monotonic()), job)
+
+
+class PanelPower:
+    # Power state of one panel: awake (None), powered off (epdseq.LIGHT,
+    # panels with standby()) or in deep sleep (epdseq.DEEP). rest() gets
+    # the time.monotonic() of the next refresh and goes to the deepest
+    # state whose wake-up costs at most 1/ratio of the gap, deep sleep
+    # only for gaps of deep_after seconds or more. wake() brings the panel
+    # back before it is drawn to and measures what that took; the guesses
+    # only stand in until the first wake of each kind. init is what brings
+    # back drivers without wake(), eink.init by default.
+    WAKE_GUESS = {epdseq.LIGHT: 0.1, epdseq.DEEP: 1.5}
+    LEVELS = {epdseq.LIGHT: 'light', epdseq.DEEP: 'deep'}
+
+    def __init__(self, eink, ratio=10, deep_after=60, init=None) -> None:
+        self.eink = eink
+        self.init = init or eink.init
+        self.ratio = ratio
+        self.deep_after = deep_after
+        self.state = None
+        self.cost = dict(self.WAKE_GUESS)
+        self.measured = set()
+
+    def measuredWake(self, level, seconds):
+        if level in self.measured:
+            self.cost[level] = 0.7 * self.cost[level] + 0.3 * seconds
+        else:
+            self.cost[level] = seconds
+            self.measured.add(level)
+
+    def rest(self, until):
+        gap = until - time.monotonic()
+        if gap >= max(self.deep_after, self.ratio * self.cost[epdseq.DEEP]):
+            self.sleep()
+        elif hasattr(self.eink, 'standby') and gap >= self.ratio * self.cost[epdseq.LIGHT]:
+            if self.state is None:
+                with epdmetrics.panel_span('sleep', level='light'):
+                    self.eink.standby()
+                self.state = epdseq.LIGHT
 
-class DisplayManager:
+    def sleep(self):
+        if self.state != epdseq.DEEP:
+            with epdmetrics.panel_span('sleep', level='deep'):
+                self.eink.sleep()
+            self.state = epdseq.DEEP
+
+    # returns the level the panel woke from, None when it was awake
+    def wake(self):
+        level = self.state
+        if level is None:
+            return None
+        start = time.monotonic()
+        with epdmetrics.panel_span('wake', level=self.LEVELS[level]):
+            # drivers without wake() come back through a full init()
+            if hasattr(self.eink, 'wake'):
+                self.eink.wake()
+            else:
+                self.init()
+        self.measuredWake(level, time.monotonic() - start)
+        self.state = None
+        return level
+
+
+# the driver's frame method of those names, if it takes just the frame
+def _frameMethod(eink, *names):
+    for name in names:
+        method = getattr(eink, name, None)
+        if method is not None and [p for p in inspect.signature(method).parameters if p != 'wait'] == ['image']:
+            return method
+    return None
+
+
+# what init() takes to load each waveform, None when it takes nothing
+def _initArgs(eink):
+    params = list(inspect.signature(eink.init).parameters)
+    if not params:
+        return None
+    if hasattr(eink, 'lut_full_update') and hasattr(eink, 'lut_partial_update'):
+        return {'full': eink.lut_full_update, 'partial': eink.lut_partial_update}
+    if hasattr(eink, 'FULL_UPDATE') and hasattr(eink, 'PART_UPDATE'):
+        return {'full': eink.FULL_UPDATE, 'partial': eink.PART_UPDATE}
+    if params[0] == 'isPartial':
+        return {'full': False, 'partial': True}
+    return {'full': 0, 'partial': 1}
+
+
+class RefreshModes:
+    # The refreshes a driver offers, found by what its methods are called:
+    #  full     display(), or the base image call (displayPartBaseImage,
+    #           display_Base) when there is a partial mode, so the
+    #           controller's previous-frame RAM always holds the glass
+    #  partial  displayPartial/DisplayPartial/display_Partial/displayPart,
+    #           or display() after init() loaded the partial waveform
+    #           (older drivers)
+    #  fast     display_Fast, after init_Fast() where there is one
+    def __init__(self, eink) -> None:
+        self.eink = eink
+        self.init_args = _initArgs(eink)
+        self.methods = {'full': eink.display}
+        partial = _frameMethod(eink, 'displayPartial', 'DisplayPartial', 'display_Partial', 'displayPart')
+        if partial is not None:
+            self.methods['partial'] = partial
+        elif self.init_args is not None:
+            self.methods['partial'] = eink.display
+        fast = _frameMethod(eink, 'display_Fast')
+        if fast is not None:
+            self.methods['fast'] = fast
+        self.base = None
+        if 'partial' in self.methods:
+            self.base = _frameMethod(eink, 'displayPartBaseImage', 'display_Base')
+        # waveform init() loaded last
+        self.loaded = None
+
+    def init(self, mode='full'):
+        if self.init_args is not None:
+            result = self.eink.init(self.init_args.get(mode, self.init_args['full']))
+        elif mode == 'fast' and hasattr(self.eink, 'init_Fast'):
+            result = self.eink.init_Fast()
+        else:
+            result = self.eink.init()
+        self.loaded = mode
+        return result
+
+    def _switches(self, mode):
+        if self.init_args is not None:
+            return mode in self.init_args
+        return mode == 'fast' and hasattr(self.eink, 'init_Fast')
+
+    # make sure init() last loaded the waveform for mode
+    def load(self, mode):
+        wanted = mode if self._switches(mode) else 'full'
+        if self.loaded is not None and self.loaded != wanted:
+            self.init(wanted)
+
+    # start a refresh in mode, with wait=False where the driver takes it
+    def start(self, mode, buf):
+        self.load(mode)
+        method = self.base if mode == 'full' and self.base is not None else self.methods[mode]
+        return _start(method, buf)
+
+
+# share of the pixels that differ between two packed frames
+def changedFraction(old, new):
+    diff = int.from_bytes(old, 'little') ^ int.from_bytes(new, 'little')
+    return bin(diff).count('1') / (len(new) * 8.0)
+
+
+# The window, in panel pixels, that holds every byte differing between
+# two packed frames, as (x_start, y_start, x_end, y_end) inclusive with x
+# on byte boundaries; None when the frames are the same
+def changedWindow(old, new, width):
+    linewidth = (width + 7) // 8
+    first, last, rows = linewidth, -1, []
+    for y in range(len(new) // linewidth):
+        row = slice(y * linewidth, (y + 1) * linewidth)
+        if old[row] == new[row]:
+            continue
+        rows.append(y)
+        columns = [i for i in range(linewidth) if old[row.start + i] != new[row.start + i]]
+        first = min(first, columns[0])
+        last = max(last, columns[-1])
+    if not rows:
+        return None
+    return first * 8, rows[0], last * 8 + 7, rows[-1]
+
+
+class RefreshPolicy:
+    # Picks the refresh for each frame, the quickest that will not leave
+    # ghosts behind:
+    #  partial  up to partial_below of the pixels changed, and fewer than
+    #           max_partials partial or fast refreshes since the last full
+    #  fast     up to full_above changed, on drivers with a fast waveform
+    #  full     anything else, the first frame and the one after a clear
+    #           or deep sleep (the controller no longer holds the glass)
+    # During quiet hours twice as many partials go between full
+    # refreshes, there is less flashing at night. A Screen's partial flag
+    # (True/False) overrides the choice, None leaves it to the policy.
+    def __init__(self, partial_below=0.25, full_above=0.6, max_partials=5,
+                 quiet=(dt_time(22, 0), dt_time(6, 30))) -> None:
+        self.partial_below = partial_below
+        self.full_above = full_above
+        self.max_partials = max_partials
+        self.quiet = quiet
+
+    def limit(self, now=None):
+        now = (now or datetime.now()).time()
+        start, end = self.quiet
+        quiet = start <= now or now < end if start > end else start <= now < end
+        return self.max_partials * 2 if quiet else self.max_partials
+
+    def choose(self, modes, old, new, partials, hint=None, now=None):
+        if old is None or hint is False:
+            return 'full'
+        if hint is True and 'partial' in modes:
+            return 'partial'
+        if partials >= self.limit(now):
+            return 'full'
+        changed = changedFraction(old, new)
+        if changed <= self.partial_below and 'partial' in modes:
+            return 'partial'
+        if changed <= self.full_above and 'fast' in modes:
+            return 'fast'
+        return 'full'
+
+
+# Screen priorities. Within a rotation round higher priorities go first,
+# URGENT screens also preempt the screen on the glass.
+NORMAL = 0
+HIGH = 5
+URGENT = 10
+
+
+# Digest of what an image shows for DwellPolicy, without the header
+# clock: a screen drawn again in a new minute is still unchanged, and the
+# clock on the glass is kept current by tickClock() anyway.
+def contentDigest(image):
+    if 'clock' in image.info:
+        image = image.copy()
+        ImageDraw.Draw(image).rectangle(image.info['clock'][0], fill=255)
+    return hash(image.tobytes())
+
+
+class DwellPolicy:
+    # How long screens stay up in a rotation:
+    #  - a screen whose image is the one on the glass stays up without a refresh
+    #  - one unchanged since it was last shown is skipped, up to max_skips
+    #    times in a row, then shown for unchanged_factor of its time
+    #  - a screen's weight scales its display_time (bus screens near a
+    #    departure), clamped to min_time..max_time seconds
+    #  - refreshes are paced to refreshes_per_hour (None: no limit), with
+    #    up to burst of them back to back; urgent screens still go up at
+    #    once but use up the budget of the ones after them
+    def __init__(self, refreshes_per_hour=None, burst=4, max_skips=3, unchanged_factor=0.5,
+                 min_time=2, max_time=120) -> None:
+        self.refreshes_per_hour = refreshes_per_hour
+        self.burst = burst
+        self.max_skips = max_skips
+        self.unchanged_factor = unchanged_factor
+        self.min_time = min_time
+        self.max_time = max_time
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    # 'hold', 'skip' or 'show' for a screen rendered to digest
+    def decide(self, screen, digest, glass):
+        if digest == glass:
+            return 'hold'
+        if digest == screen.last_digest and screen.skipped < self.max_skips and not screen.once:
+            return 'skip'
+        return 'show'
+
+    def dwell(self, screen, changed=True):
+        seconds = screen.dwellTime()
+        if not changed:
+            seconds *= self.unchanged_factor
+        return min(max(seconds, self.min_time), self.max_time)
+
+    def _refill(self, now):
+        if self.refreshes_per_hour:
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.refreshes_per_hour / 3600.0)
+        self.stamp = now
+
+    def refreshed(self, now=None):
+        self._refill(now or time.monotonic())
+        self.tokens -= 1
+
+    # earliest time.monotonic() the budget allows the next refresh
+    def nextRefresh(self, now=None):
+        now = now or time.monotonic()
+        self._refill(now)
+        if not self.refreshes_per_hour or self.tokens >= 1:
+            return now
+        return now + (1 - self.tokens) * 3600.0 / self.refreshes_per_hour
+
+
+class ScreenQueue:
+    # Screens in rotation order: the fewest times shown first, then the
+    # highest priority, then the earliest deadline. Urgent screens and
+    # screens with a deadline are shown once, screens past their expiry
+    # or deadline are dropped. Safe to use from fetcher threads.
     def __init__(self) -> None:
-        # queue to hold screens
-        self.queue = []
+        self.lock = threading.Lock()
+        self.entries = []    # [times shown, order added, screen]
+        self.counter = itertools.count()
+        # the screens the last clear() dropped, for the ones pushed again
+        self.retired = []
+
+    @staticmethod
+    def _order(entry):
+        shown, added, screen = entry
+        return (shown, -screen.priority, screen.deadline or datetime.max, added)
+
+    # a screen with the key of a queued one replaces it, new screens join
+    # the current round instead of running ahead of it; either way it
+    # takes over what the one with its key before it had, in the queue
+    # or dropped by the last rebuild
+    def push(self, screen):
+        with self.lock:
+            for entry in self.entries:
+                if entry[2].key == screen.key:
+                    screen.inherit(entry[2])
+                    entry[2] = screen
+                    return
+            for old in self.retired:
+                if old.key == screen.key:
+                    screen.inherit(old)
+                    self.retired.remove(old)
+                    break
+            shown = min((entry[0] for entry in self.entries), default=0)
+            self.entries.append([shown, next(self.counter), screen])
+
+    # the screen to show now, None when there is none left
+    def next(self, now=None):
+        now = now or datetime.now()
+        with self.lock:
+            self.entries = [entry for entry in self.entries if not entry[2].expired(now)]
+            if not self.entries:
+                return None
+            entry = min(self.entries, key=self._order)
+            if entry[2].once:
+                self.entries.remove(entry)
+            else:
+                entry[0] += 1
+            return entry[2]
+
+    # drop the queued screens match(screen) is true for
+    def remove(self, match):
+        with self.lock:
+            self.entries = [entry for entry in self.entries if not match(entry[2])]
+            self.retired = [screen for screen in self.retired if not match(screen)]
+
+    # a queue rebuild keeps the screens still waiting for their one
+    # showing; the others are kept aside until the next rebuild, for
+    # push() to hand on to the screens that take their place
+    def clear(self):
+        with self.lock:
+            self.retired = [entry[2] for entry in self.entries if not entry[2].once]
+            self.entries = [entry for entry in self.entries if entry[2].once]
+
+    def __len__(self):
+        return len(self.entries)
+
+    # the queued screens in the order they would be shown
+    def __iter__(self):
+        with self.lock:
+            return iter([entry[2] for entry in sorted(self.entries, key=self._order)])
+
+
+class Panel:
+    # one e-paper panel with its own queue and refresh thread, so several
+    # panels on one Pi refresh at the same time
+    def __init__(self, driver='epd2in13_V3', orientation=90, pins=None, spi=(0, 1), name=None) -> None:
+        self.name = name or driver
+        self.driver = driver
+
+        # degrees screens are turned counter-clockwise onto the panel,
+        # 90/270 draw landscape and 0/180 portrait
+        self.orientation = orientation
 
-        # set up a font for general use
-        self.body = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', 24)
+        # queue to hold screens
+        self.queue = ScreenQueue()
+
+        # rotation state: the scheduler it runs on, whether a screen is
+        # booked, and which booking is current
+        self.scheduler = None
+        self.rotating = False
+        self.generation = 0
+
+        # display times and refresh budget for the rotation; the frame on
+        # the glass, its digest, and partial refreshes since the last full
+        self.dwell = DwellPolicy()
+        self.frame = None
+        self.glass = None
+        self.partials = 0
+        # the image on the glass, and when the rotation next refreshes
+        self.shown = None
+        self.rest_until = None
+
+        # refreshes are triggered on the calling thread, the wait for the
+        # panel to go idle runs here so the next screen can be prepared
+        self.refresh_executor = ThreadPoolExecutor(max_workers=1)
+        self.pending_refresh = None
 
         # initialize and clear the display, store the display object
         try:
             # Display init, clear
-            print('Initializing display')
-            self.eink = epd2in13_V3.EPD()
-            self.eink.init()
+            print('Initializing display', self.name)
+            start = time.perf_counter()
+            # pins (lib.waveshare_epd.epdconfig.PinSet) and spi (bus, device)
+            # put a second or third panel on its own lines
+            self.eink = waveshare_epd.panel(driver, pins, spi)
+            # not every driver takes the colour to clear to
+            self.clear_color = bool(inspect.signature(self.eink.Clear).parameters)
+            startup_times['driver ' + driver] = time.perf_counter() - start
+            start = time.perf_counter()
+            # full, partial and fast refreshes the driver offers, and which
+            # to use for each frame
+            self.modes = RefreshModes(self.eink)
+            self.refresh = RefreshPolicy()
+            self.modes.init()
+            # sleeps the panel between refreshes, a cold init is what a
+            # wake from deep sleep costs
+            self.power = PanelPower(self.eink, init=self.modes.init)
+            self.power.measuredWake(epdseq.DEEP, time.perf_counter() - start)
             self.eink.Clear()
-            self.w = self.eink.height
-            self.h = self.eink.width
+            startup_times['init and clear ' + self.name] = time.perf_counter() - start
+            if orientation in (0, 180):
+                self.w = self.eink.width
+                self.h = self.eink.height
+            else:
+                self.w = self.eink.height
+                self.h = self.eink.width
             print('width:', self.w)
             print('height:', self.h)
         except IOError as e:
             print(e)
 
-        # make sure we close gracefully
-        signal.signal(signal.SIGINT, self._graceful_exit)
-        signal.signal(signal.SIGTERM, self._graceful_exit)
-
-    def _graceful_exit(self, signal, frame):
-        print("\nQuitting")
-        time.sleep(3)
-        self.clear()
-        self.sleep()
-        print("Program exited")
-        sys.exit(0)  # Exit the program
-
     # function to clear the display
     def clear(self, color = "white"):
+        self.waitForRefresh()
+        self.frame = None
+        self.glass = None
+        self.partials = 0
+        self.shown = None
         try:
-            if color == "white":
+            self.power.wake()
+            self.modes.load('full')
+            if not self.clear_color:
+                self.eink.Clear()
+                print('Display cleared')
+            elif color == "white":
                 self.eink.Clear(0xFF)
                 print('Display cleared')
             else:
@@ -59,41 +851,363 @@ class DisplayManager:
 
     # function to put the display to sleep
     def sleep(self):
+        self.waitForRefresh()
         try:
-            self.eink.sleep()
+            self.power.sleep()
             print('Display sleeping')
         except IOError as e:
             print(e)
 
     def showScreen(self, screen):
+        image = screen.render()
+        self.refreshScreen(screen, self.pack(image), image)
+        self.waitForRefresh()
+
+    # send a screen and trigger its refresh without waiting for the panel,
+    # returns a future that resolves to the time.monotonic() it went idle;
+    # image is what buf was packed from, the screen's last render with the
+    # current clock when not given
+    def refreshScreen(self, screen, buf=None, image=None):
+        if image is None:
+            image = screen.clocked()
+        if buf is None:
+            buf = self.pack(image)
+        self.waitForRefresh()
+        started = time.time()
+        start = time.perf_counter()
         try:
-            if screen.partial == True:
-                self.eink.displayPartial(self.eink.getbuffer(screen.image))
-            else:
-                self.eink.display(self.eink.getbuffer(screen.image))
+            if self.power.wake() == epdseq.DEEP:
+                self.frame = None
+            mode = self.refresh.choose(self.modes.methods, self.frame, buf, self.partials, screen.partial)
+            self.modes.start(mode, buf)
+        except IOError as e:
+            self.frame = None
+            self.glass = None
+            future = Future()
+            future.set_exception(e)
+        else:
+            epdmetrics.count('refreshes', panel=self.name, mode=mode)
+            if recorder is not None:
+                recorder.refreshed(self, screen, mode, buf, None, started, time.perf_counter() - start)
+            self.partials = 0 if mode == 'full' else self.partials + 1
+            self.frame = bytes(buf)
+            self.glass = contentDigest(image)
+            self.shown = image
+            future = self.refresh_executor.submit(self._waitIdle)
+        self.pending_refresh = future
+        if 'first screen' not in startup_times:
+            startup_times['first screen'] = time.perf_counter() - _started
+            startupReport()
+        return future
+
+    # Send only the bytes of image that differ from the glass, as one
+    # windowed partial refresh; for small changes to what is shown, such
+    # as the header clock. Needs a driver with displayPartialWindow and a
+    # controller that still holds the frame (not after a clear or deep
+    # sleep). Returns the refresh future, None when nothing was sent.
+    def patch(self, image):
+        if not hasattr(self.eink, 'displayPartialWindow'):
+            return None
+        self.waitForRefresh()
+        if self.frame is None or self.power.state == epdseq.DEEP:
+            return None
+        buf = self.pack(image)
+        window = changedWindow(self.frame, buf, self.eink.width)
+        if window is None:
+            return None
+        started = time.time()
+        start = time.perf_counter()
+        try:
+            self.power.wake()
+            _start(self.eink.displayPartialWindow, buf, *window)
+        except IOError as e:
+            self.frame = None
+            self.glass = None
+            future = Future()
+            future.set_exception(e)
+        else:
+            epdmetrics.count('refreshes', panel=self.name, mode='window')
+            if recorder is not None:
+                recorder.refreshed(self, None, 'window', buf, window, started, time.perf_counter() - start)
+            self.partials += 1
+            self.frame = bytes(buf)
+            self.glass = contentDigest(image)
+            self.shown = image
+            future = self.refresh_executor.submit(self._waitIdle)
+            # back to rest until the rotation's next refresh, as booked when
+            # the tick went out; a rotation step since makes it stale
+            if self.scheduler is not None and self.rest_until is not None:
+                future.add_done_callback(lambda f, until=self.rest_until, generation=self.generation:
+                                         self.scheduler.after(0, self._rest, until, generation))
+        self.pending_refresh = future
+        return future
+
+    # the driver's frame buffer for image, timed as epd_getbuffer_seconds
+    def pack(self, image):
+        with epdmetrics.span('getbuffer', panel=self.name):
+            return self.eink.getbuffer(image, self.orientation)
+
+    def _waitIdle(self):
+        self.eink.ReadBusy()
+        return time.monotonic()
+
+    # block until the refresh in progress is done, returns when it went idle
+    def waitForRefresh(self):
+        future, self.pending_refresh = self.pending_refresh, None
+        if future is None:
+            return None
+        try:
+            return future.result()
         except IOError as e:
             print(e)
+            return None
 
+    # keep the current screen up for display_time seconds after its refresh
+    def _dwell(self, display_time):
+        idle_at = self.waitForRefresh()
+        if idle_at is None:
+            idle_at = time.monotonic()
+        time.sleep(max(0, display_time - (time.monotonic() - idle_at)))
+
+    # safe from any thread, an URGENT screen cuts the current one short
     def addScreenToQueue(self, screen):
-        self.queue.append(screen)
+        self.queue.push(screen)
+        if screen.priority >= URGENT and self.scheduler is not None:
+            self.scheduler.after(0, self._preempt)
+
+    def _preempt(self):
+        if self.rotating:
+            self.rotate(self.scheduler)
+        else:
+            self.startRotation(self.scheduler)
 
     def clearQueue(self):
-        self.queue = []
+        self.queue.clear()
+
+    def removeScreens(self, match):
+        self.queue.remove(match)
 
     def displayQueue(self):
         if not self.queue:
             print('No screens in queue')
             return
         
+        display_time = None
         for screen in self.queue:
+            # fetch, render and pack while the previous screen is still refreshing
             try:
-                screen.update()
+                image = screen.render()
+                buf = self.pack(image)
             except Exception as e:
                 print(e)
-            else:
-                self.showScreen(screen)
-                time.sleep(screen.display_time)
-            
+                continue
+            if display_time is not None:
+                self._dwell(display_time)
+            self.refreshScreen(screen, buf, image)
+            display_time = screen.display_time
+        if display_time is not None:
+            self._dwell(display_time)
+
+    # cycle through the queue on a scheduler, see rotate()
+    def startRotation(self, scheduler):
+        self.scheduler = scheduler
+        if self.queue and not self.rotating:
+            self.rotating = True
+            scheduler.after(0, self.rotate, scheduler, self.generation)
+
+    # Show the next screen and book the one after it for when this one has
+    # been up display_time seconds past its refresh. Stops when the queue
+    # is empty, startRotation() picks it up again. A call without a
+    # generation (a preempting screen) makes the booked one stale; a
+    # refresh in progress still finishes first.
+    def rotate(self, scheduler, generation=None):
+        if generation is not None and generation != self.generation:
+            return
+        self.generation += 1
+        generation = self.generation
+        screen = self.queue.next()
+        if screen is None:
+            self.rotating = False
+            return
+        self.rotating = True
+        try:
+            image = screen.render()
+            buf = self.pack(image)
+        except Exception as e:
+            print(e)
+            scheduler.after(1, self.rotate, scheduler, generation)
+            return
+
+        digest = contentDigest(image)
+        decision = self.dwell.decide(screen, digest, self.glass)
+        changed = digest != screen.last_digest
+        if decision == 'skip':
+            screen.skipped += 1
+            scheduler.after(0, self.rotate, scheduler, generation)
+            return
+        screen.last_digest = digest
+        screen.skipped = 0
+        dwell = self.dwell.dwell(screen, changed)
+        if decision == 'hold':
+            scheduler.after(dwell, self.rotate, scheduler, generation)
+            self._rest(time.monotonic() + dwell, generation)
+            return
+
+        self.dwell.refreshed()
+        ready_at = self.dwell.nextRefresh()
+        future = self.refreshScreen(screen, buf, image)
+        # resolves on the refresh thread, the scheduler takes it from there
+        future.add_done_callback(lambda f: self._booked(scheduler, max(_idleAt(f) + dwell, ready_at), generation))
+
+    # the panel went idle, book the next screen and rest until then
+    def _booked(self, scheduler, when, generation):
+        scheduler.at(when, self.rotate, scheduler, generation)
+        scheduler.after(0, self._rest, when, generation)
+
+    def _rest(self, until, generation):
+        if generation != self.generation:
+            return
+        self.rest_until = until
+        try:
+            self.power.rest(until)
+        except IOError as e:
+            print(e)
+
+
+# call a driver refresh with wait=False, drivers without it block until done
+def _start(method, *args):
+    if 'wait' in inspect.signature(method).parameters:
+        return method(*args, wait=False)
+    return method(*args)
+
+
+def _idleAt(future):
+    return time.monotonic() if future.exception() else future.result()
+
+
+# Draw the time into the header of image, over the time drawn before.
+# The box it takes goes in image.info['clock'], which marks the image
+# as one with a header clock for tickClock().
+def drawClock(image, font_size):
+    draw = ImageDraw.Draw(image)
+    if 'clock' in image.info:
+        draw.rectangle(image.info['clock'][0], fill=255)
+
+    # Double the font size for the time and reposition it
+    time_font_size = int(font_size * 2)  # Double the previous font size
+    time_font = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', time_font_size)
+    current_time = time.strftime("%H:%M")
+    text_width, text_height = draw.textsize(current_time, font=time_font)
+    text_x = (image.width - text_width) / 2  # Recentered horizontally
+    text_y = (image.height / 3 - text_height) / 2  # Vertically centered in the top third of the screen
+    draw.text((text_x, text_y), current_time, font=time_font, fill=0)
+    image.info['clock'] = ((text_x, text_y, text_x + text_width, text_y + text_height), font_size)
+
+
+class DisplayManager:
+    def __init__(self, orientation=90, panel='epd2in13_V3') -> None:
+        # panels by name; the first is the main panel, the one the queue,
+        # header and text helpers below use unless told otherwise
+        self.panels = {}
+
+        # set up a font for general use
+        self.body = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', 24)
+
+        self.main = self.addPanel(panel, orientation)
+
+        # make sure we close gracefully
+        signal.signal(signal.SIGINT, self._graceful_exit)
+        signal.signal(signal.SIGTERM, self._graceful_exit)
+
+    # another panel with its own pins and SPI device, e.g. a 7.5" board
+    # next to the 2.13" HAT:
+    #   addPanel('epd7in5_V2', 0, PinSet(rst=5, dc=6, cs=7, busy=13), (0, 1), 'departures')
+    def addPanel(self, driver, orientation=90, pins=None, spi=(0, 1), name=None):
+        panel = Panel(driver, orientation, pins, spi, name)
+        self.panels[panel.name] = panel
+        return panel
+
+    def panel(self, name=None):
+        return self.main if name is None else self.panels[name]
+
+    # the main panel's display object, orientation, size and queue
+    @property
+    def eink(self):
+        return self.main.eink
+
+    @property
+    def orientation(self):
+        return self.main.orientation
+
+    @property
+    def w(self):
+        return self.main.w
+
+    @property
+    def h(self):
+        return self.main.h
+
+    @property
+    def queue(self):
+        return self.main.queue
+
+    def _graceful_exit(self, signal, frame):
+        print("\nQuitting")
+        time.sleep(3)
+        self.clear()
+        self.sleep()
+        if len(self.panels) > 1:
+            # the drivers leave the shared SPI bus up for each other
+            epdconfig.module_exit(force=True)
+        print("Program exited")
+        sys.exit(0)  # Exit the program
+
+    def clear(self, color = "white"):
+        for panel in self.panels.values():
+            panel.clear(color)
+
+    def sleep(self):
+        for panel in self.panels.values():
+            panel.sleep()
+
+    def showScreen(self, screen, panel=None):
+        self.panel(panel).showScreen(screen)
+
+    def refreshScreen(self, screen, buf=None, panel=None, image=None):
+        return self.panel(panel).refreshScreen(screen, buf, image)
+
+    def waitForRefresh(self, panel=None):
+        return self.panel(panel).waitForRefresh()
+
+    def addScreenToQueue(self, screen, panel=None):
+        self.panel(panel).addScreenToQueue(screen)
+
+    def clearQueue(self, panel=None):
+        self.panel(panel).clearQueue()
+
+    def removeScreens(self, match, panel=None):
+        self.panel(panel).removeScreens(match)
+
+    def startRotation(self, scheduler):
+        for panel in self.panels.values():
+            panel.startRotation(scheduler)
+
+    # runs every panel's queue, each on its own thread so their refreshes
+    # overlap; returns when the longest queue is done
+    def displayQueue(self):
+        panels = [panel for panel in self.panels.values() if panel.queue]
+        if not panels:
+            print('No screens in queue')
+            return
+        if len(panels) == 1:
+            panels[0].displayQueue()
+            return
+        threads = [threading.Thread(target=panel.displayQueue, name=panel.name) for panel in panels]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
     def helloWorld(self):
         image = Image.new(mode='1', size=(self.w, self.h), color=255)
         draw = ImageDraw.Draw(image)
@@ -124,7 +1238,7 @@ class DisplayManager:
 
         # Download and display the weather icon
         icon_code = self.weather_data['current']['weather'][0]['icon']  # Get the icon code from the API response
-        response = requests.get(f"https://openweathermap.org/img/wn/{icon_code}.png")
+        response = fetch("weather_icon", f"https://openweathermap.org/img/wn/{icon_code}.png")
         icon_img = Image.open(BytesIO(response.content)).convert("L")  # Convert image to 8 bit black and white
         # icon_img = ImageOps.invert(icon_img)  # Invert black and white
         icon_img = icon_img.convert("1")  # Convert image back to 1 bit black and white
@@ -140,14 +1254,7 @@ class DisplayManager:
         weather_y += font.getsize(current_temp)[1]  # Move y down for the next line of text
         draw.text((weather_x, weather_y), conditions, font=font, fill=0)
 
-        # Double the font size for the time and reposition it
-        time_font_size = int(font_size * 2)  # Double the previous font size
-        time_font = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', time_font_size)
-        current_time = time.strftime("%H:%M")
-        text_width, text_height = draw.textsize(current_time, font=time_font)
-        text_x = (self.w - text_width) / 2  # Recentered horizontally
-        text_y = (self.h / 3 - text_height) / 2  # Vertically centered in the top third of the screen
-        draw.text((text_x, text_y), current_time, font=time_font, fill=0)
+        drawClock(image, font_size)
 
         # Draw a line under the header
         line_y = self.h / 3  # One third down the height
@@ -155,23 +1262,132 @@ class DisplayManager:
 
         return image
 
+    # Keep the header clock on the main panel exact: on each minute
+    # boundary the new time is drawn over the screen on the glass and only
+    # the bytes that changed go out, as a windowed partial refresh (a few
+    # hundred bytes on the 2.13" panel). Runs next to the rotation on the
+    # same scheduler; screens without a header are left alone.
+    def startClock(self, scheduler):
+        scheduler.after(60 - time.time() % 60, self.tickClock, scheduler)
+
+    def tickClock(self, scheduler):
+        image = self.main.shown
+        if image is not None and 'clock' in image.info:
+            image = image.copy()
+            drawClock(image, image.info['clock'][1])
+            try:
+                self.main.patch(image)
+            except IOError as e:
+                print(e)
+        self.startClock(scheduler)
+
 class Screen:
-    def __init__(self, content_func, *content_args, partial=False, display_time=3) -> None:
+    # deadline: show before this datetime or not at all (shown once);
+    # expires: drop it from the queue from then on; key: queued screens
+    # with the same key replace each other, by default the same content
+    # weight scales display_time in a rotation, a number or a function
+    # taking the screen
+    # partial: True or False to force that refresh, None to leave it to
+    # the panel's RefreshPolicy
+    # max_age: seconds a rendered image is reused for before render()
+    # fetches and draws it again, 0 renders each time it is shown
+    def __init__(self, content_func, *content_args, partial=None, display_time=3,
+                 priority=NORMAL, deadline=None, expires=None, key=None, weight=1,
+                 max_age=0) -> None:
         self.partial = partial
         self.content_func = content_func
         self.content_args = content_args
         self.display_time = display_time
-        self.update()
+        self.priority = priority
+        self.deadline = deadline
+        self.expires = expires
+        self.key = key if key is not None else (content_func, content_args)
+        self.weight = weight
+        # digest of the frame last shown, and rotations skipped since
+        self.last_digest = None
+        self.skipped = 0
+        # rendered on first use, not when queued
+        self.max_age = max_age
+        self._image = None
+        self.last_updated = None
+
+    # carry over what old, a screen with the same key this one replaces,
+    # last showed and rendered: an unchanged image is still skipped, and
+    # a render of the same content is reused while it is fresh
+    def inherit(self, old):
+        self.last_digest = old.last_digest
+        self.skipped = old.skipped
+        if (old.content_func, old.content_args) == (self.content_func, self.content_args):
+            self._image = old._image
+            self.last_updated = old.last_updated
+
+    def dwellTime(self):
+        weight = self.weight(self) if callable(self.weight) else self.weight
+        return self.display_time * weight
+
+    @property
+    def once(self):
+        return self.priority >= URGENT or self.deadline is not None
+
+    def expired(self, now):
+        return any(limit is not None and now >= limit for limit in (self.deadline, self.expires))
+
+    @property
+    def image(self):
+        if self._image is None:
+            self.update()
+        return self._image
+
+    def fresh(self, now=None):
+        if self.last_updated is None:
+            return False
+        return (now or datetime.now()) - self.last_updated < timedelta(seconds=self.max_age)
+
+    # the image, rendered again only once it is older than max_age; a
+    # reused one gets the current time in its header clock
+    def render(self):
+        if not self.fresh():
+            self.update()
+            return self._image
+        return self.clocked()
+
+    # the last render, with the current time in its header clock
+    def clocked(self):
+        image = self.image
+        if 'clock' not in image.info:
+            return image
+        image = image.copy()
+        drawClock(image, image.info['clock'][1])
+        return image
 
+    # timed per content function as epd_render_seconds, with the fetches
+    # made while drawing
     def update(self):
-        self.image = self.content_func(*self.content_args)
+        started = time.time()
+        start = time.perf_counter()
+        with epdmetrics.span('render', screen=self.content_func.__name__):
+            self._image = self.content_func(*self.content_args)
         self.last_updated = datetime.now()
+        if recorder is not None:
+            recorder.rendered(self, started, time.perf_counter() - start)
 
 class BusTracker:
+    # a departure this close keeps its screen up twice as long
+    IMMINENT_MINUTES = 10
+    # seconds a fetched set of predictions is shown before fetching again
+    MAX_AGE = 60
+
     def __init__(self, DisplayManager, api_key, tracked_buses=[]) -> None:
         self.DisplayManager = DisplayManager
         self.tracked_buses = tracked_buses
         self.api_key = api_key
+        # (route, stop_id) -> minutes to the next departure, from the last fetch
+        self.soonest = {}
+
+    def departureWeight(self, screen):
+        bus = screen.content_args[0]
+        minutes = self.soonest.get((bus['route'], bus['stop_id']))
+        return 2 if minutes is not None and minutes <= self.IMMINENT_MINUTES else 1
 
     def addTrackedBus(self, route, stop_id, stop_number, stop_name, direction):
         bus = {"route": route,
@@ -187,7 +1403,7 @@ class BusTracker:
         url = f"http://www.ctabustracker.com/bustime/api/v3/getpredictions?key={self.api_key}&rt={bus['route']}&stpid={bus['stop_id']}&format=json"
 
         # Send the GET request
-        response = requests.get(url)
+        response = fetch("bus_predictions", url)
 
         bus_error = False
 
@@ -243,6 +1459,7 @@ class BusTracker:
             return image
 
         next_buses = []
+        minutes = []
         now = datetime.now()
 
         for prediction in bus_predictions:
@@ -253,6 +1470,7 @@ class BusTracker:
                 # Calculate the difference in time and convert it to minutes
                 time_diff = bus_time - now
                 time_diff_minutes = int(time_diff.total_seconds() // 60)  # Using '//' to round down
+                minutes.append(max(time_diff_minutes, 0))
                 
                 if time_diff_minutes < 1:
                     time_diff_minutes = "Due"
@@ -261,6 +1479,7 @@ class BusTracker:
 
         # Limit the number of buses to maximum 3
         next_buses = next_buses[:3]
+        self.soonest[(bus['route'], bus['stop_id'])] = min(minutes, default=None)
 
         # Create a header
         image = self.DisplayManager._screenHeader()
@@ -308,7 +1527,7 @@ class BusTracker:
     
     def queueScreensForBusAlert(self, bus, display_time):
         base_url = "http://www.transitchicago.com/api/1.0/routes.aspx"
-        response = requests.get(base_url, params={"routeid": bus['route']})
+        response = fetch("bus_alerts", base_url, params={"routeid": bus['route']})
 
         if response.status_code != 200:
             print("Error checking for bus alerts")
@@ -332,7 +1551,7 @@ class BusTracker:
             print(f"No bus alerts for {bus['route']} - {bus['stop_name']}")
             return
         
-        busAlertScreen = Screen(self.busAlertScreen, bus, alert_message, partial=False, display_time=int(display_time))
+        busAlertScreen = Screen(self.busAlertScreen, bus, alert_message, display_time=int(display_time), priority=URGENT)
         self.DisplayManager.addScreenToQueue(busAlertScreen)
         print(f"Queued bus alert screen for {bus['route']} - {bus['stop_name']}: {alert_message}")
         return
@@ -374,13 +1593,36 @@ class BusTracker:
     
     def queueTrackedBusScreens(self, display_time):        
         for bus in self.tracked_buses:
-            busScreen = Screen(self.busScheduleScreen, bus, partial=False, display_time=int(display_time))
-            self.DisplayManager.addScreenToQueue(busScreen)
-            print(f"Queued bus screen for {bus['route']} - {bus['stop_name']}")
-
-            self.queueScreensForBusAlert(bus, display_time)
+            self.queueBusScreens(bus, display_time)
+
+    def queueBusScreens(self, bus, display_time):
+        busScreen = Screen(self.busScheduleScreen, bus, display_time=int(display_time), priority=HIGH,
+                           weight=self.departureWeight, max_age=self.MAX_AGE)
+        self.DisplayManager.addScreenToQueue(busScreen)
+        print(f"Queued bus screen for {bus['route']} - {bus['stop_name']}")
+
+        self.queueScreensForBusAlert(bus, display_time)
+
+    # Track these buses from now on, returns the ones added. Removed buses
+    # lose their queued screens and cached departures, the others keep
+    # theirs.
+    def setTrackedBuses(self, buses):
+        added = [bus for bus in buses if bus not in self.tracked_buses]
+        removed = [bus for bus in self.tracked_buses if bus not in buses]
+        self.tracked_buses = list(buses)
+        for bus in removed:
+            self.soonest.pop((bus['route'], bus['stop_id']), None)
+            self.DisplayManager.removeScreens(
+                lambda screen, bus=bus: screen.content_args[:1] == (bus,)
+                and screen.content_func in (self.busScheduleScreen, self.busAlertScreen))
+            print(f"Stopped tracking {bus['route']} - {bus['stop_name']}")
+        return added
     
 class WeatherTracker:
+    # the weather is fetched every 3 minutes, its screens are not drawn
+    # more often than that
+    MAX_AGE = 180
+
     def __init__(self, DisplayManager, api_key, lat, lon) -> None:
         self.DisplayManager = DisplayManager
         self.api_key = api_key
@@ -389,6 +1631,18 @@ class WeatherTracker:
 
         self.update()
 
+    # fetch the weather for a new location, returns whether it moved
+    def moveTo(self, lat, lon):
+        if (lat, lon) == (self.lat, self.lon):
+            return False
+        self.lat = lat
+        self.lon = lon
+        # screens drawn for the old location are not handed on
+        self.DisplayManager.removeScreens(
+            lambda screen: screen.content_func in (self.weatherScreen, self.tempChartScreen))
+        self.update()
+        return True
+
     def update(self):
         # Update weather here
         base_url = "https://api.openweathermap.org/data/3.0/onecall"
@@ -399,7 +1653,7 @@ class WeatherTracker:
             "exclude": "minutely",  # We exclude minutely data as we don't need it for this implementation
             "appid": self.api_key
         }
-        response = requests.get(base_url, params=params)
+        response = fetch("weather", base_url, params=params)
         self.weather_data = response.json()
         self.DisplayManager.weather_data = self.weather_data
         print('Weather data updated')
@@ -433,7 +1687,7 @@ class WeatherTracker:
         # Download and display the weather icon
         icon_height = int(((self.DisplayManager.h/3)*2 - description_font.getsize(description)[1] - high_low_font.getsize('H: 88°F L: 88°F')[1] - 5))
         icon_code = self.weather_data['current']['weather'][0]['icon']  # Get the icon code from the API response
-        response = requests.get(f"https://openweathermap.org/img/wn/{icon_code}.png")
+        response = fetch("weather_icon", f"https://openweathermap.org/img/wn/{icon_code}.png")
         icon_img = Image.open(BytesIO(response.content)).convert("L")  # Convert image to 8 bit black and white
         # icon_img = ImageOps.invert(icon_img)  # Invert black and white
         icon_img = icon_img.convert("1")  # Convert image back to 1 bit black and white
@@ -498,7 +1752,7 @@ class WeatherTracker:
 
             # Download and display the weather icon
             icon_code = hour['weather'][0]['icon']  # Get the icon code from the API response
-            response = requests.get(f"https://openweathermap.org/img/wn/{icon_code}.png")
+            response = fetch("weather_icon", f"https://openweathermap.org/img/wn/{icon_code}.png")
             icon_img = Image.open(BytesIO(response.content)).convert("L")  # Convert image to 8 bit black and white
             # icon_img = ImageOps.invert(icon_img)  # Invert black and white
             icon_img = icon_img.convert("1")  # Convert image back to 1 bit black and white
@@ -514,9 +1768,9 @@ class WeatherTracker:
         return image
     
     def queueWeatherScreens(self, display_time):
-        summaryScreen = Screen(self.weatherScreen, partial=False, display_time=int(display_time))
+        summaryScreen = Screen(self.weatherScreen, display_time=int(display_time), max_age=self.MAX_AGE)
         self.DisplayManager.addScreenToQueue(summaryScreen)
         print('Queued weather summary screen')
-        chartScreen = Screen(self.tempChartScreen, partial=False, display_time=int(display_time))
+        chartScreen = Screen(self.tempChartScreen, display_time=int(display_time), max_age=self.MAX_AGE)
         self.DisplayManager.addScreenToQueue(chartScreen)
         print('Queued temperature chart screen')
\ No newline at end of file
@@ -0,0 +1,22 @@
+import importlib
+
+
+# driver modules are imported by name when a panel is opened, e.g.
+# load('epd2in13_V3').EPD()
+def load(name):
+    return importlib.import_module('.' + name, __name__)
+
+
+# A driver instance on its own pins and spidev device, for a second or
+# third panel on the same Pi; pins is an epdconfig.PinSet, spi is
+# (bus, device). Without pins it is the same as load(name).EPD().
+def panel(name, pins=None, spi=(0, 1)):
+    epd = load(name).EPD()
+    if pins is not None:
+        from . import epdconfig
+        epdconfig.attach(pins, spi, name)
+        epd.reset_pin = pins.rst
+        epd.dc_pin = pins.dc
+        epd.cs_pin = pins.cs
+        epd.busy_pin = pins.busy
+    return epd
@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 80
@@ -48,7 +49,7 @@ class EPD:
     
     #full screen update LUT
 
-    lut_w1 =[
+    lut_w1 =bytes([
     0x60,  0x5A,  0x5A,  0x00,  0x00,  0x01,  
     0x00,  0x00,  0x00,  0x00,  0x00,  0x00,  
     0x00,  0x00,  0x00,  0x00,  0x00,  0x00,  
@@ -56,9 +57,9 @@ class EPD:
     0x00,  0x00,  0x00,  0x00,  0x00,  0x00,  
     0x00,  0x00,  0x00,  0x00,  0x00,  0x00,  
     0x00,  0x00,  0x00,  0x00,  0x00,  0x00,  
-    ]
+    ])
     
-    lut_b1 =[
+    lut_b1 =bytes([
     0x90,  0x5A,  0x5A,  0x00,  0x00,  0x01,  
     0x00,  0x00,  0x00,  0x00,  0x00,  0x00,  
     0x00,  0x00,  0x00,  0x00,  0x00,  0x00,  
@@ -66,10 +67,10 @@ class EPD:
     0x00,  0x00,  0x00,  0x00,  0x00,  0x00,  
     0x00,  0x00,  0x00,  0x00,  0x00,  0x00,  
     0x00,  0x00,  0x00,  0x00,  0x00,  0x00,  
-    ]
+    ])
 
     # partial screen update LUT
-    lut_w = [
+    lut_w = bytes([
     0x60,  0x01,  0x01,  0x00,  0x00,  0x01,  
     0x80,  0x1f,  0x00,  0x00,  0x00,  0x01,  
     0x00,  0x00,  0x00,  0x00,  0x00,  0x00,  
@@ -77,9 +78,9 @@ class EPD:
     0x00,  0x00,  0x00,  0x00,  0x00,  0x00,  
     0x00,  0x00,  0x00,  0x00,  0x00,  0x00,  
     0x00,  0x00,  0x00,  0x00,  0x00,  0x00,  
-    ]
+    ])
     
-    lut_b = [
+    lut_b = bytes([
     0x90,  0x01,  0x01,  0x00,  0x00,  0x01,  
     0x40,  0x1f,  0x00,  0x00,  0x00,  0x01,  
     0x00,  0x00,  0x00,  0x00,  0x00,  0x00,  
@@ -87,7 +88,7 @@ class EPD:
     0x00,  0x00,  0x00,  0x00,  0x00,  0x00,  
     0x00,  0x00,  0x00,  0x00,  0x00,  0x00,  
     0x00,  0x00,  0x00,  0x00,  0x00,  0x00,  
-    ]
+    ])
         
     # Hardware reset
     def reset(self):
@@ -104,21 +105,38 @@ class EPD:
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
 
+    '''
+    function :send a command and its parameters in one transaction
+    parameter:
+     command : Command register
+     data : parameter bytes, CS stays low and they go in one transfer
+    '''
+    def cmd(self, command, data=b''):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a lot of data
+    def send_data2(self, data):
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
         self.send_command(0x71)
-        busy = epdconfig.digital_read(self.busy_pin)
-        busy =not(busy & 0x01)
-        while(busy):
-            self.send_command(0x71)
-            busy = epdconfig.digital_read(self.busy_pin)
-            busy =not(busy & 0x01)
+        epdconfig.wait_busy(self.busy_pin, 1)      # 0: busy, 1: idle
         epdconfig.delay_ms(800)
         logger.debug("e-Paper busy release")        
 
@@ -128,66 +146,45 @@ class EPD:
         self.ReadBusy()
 
     def SetFulltReg(self):
-        self.send_command(0x23)
-        for count in range(0, 42):
-            self.send_data(self.lut_w1[count]) 
+        self.cmd(0x23, self.lut_w1[:42])
         
-        self.send_command(0x24)
-        for count in range(0, 42):
-            self.send_data(self.lut_b1[count])     
+        self.cmd(0x24, self.lut_b1[:42])
 
     def SetPartReg(self):
-        self.send_command(0x23)
-        for count in range(0, 42):
-            self.send_data(self.lut_w[count]) 
+        self.cmd(0x23, self.lut_w[:42])
         
-        self.send_command(0x24)
-        for count in range(0, 42):
-            self.send_data(self.lut_b[count])     
+        self.cmd(0x24, self.lut_b[:42])
 
     def Init(self):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
         # EPD hardware init start
         self.reset()
         
-        self.send_command(0xD2)			
-        self.send_data(0x3F)
+        self.cmd(0xD2, [0x3F])
 
-        self.send_command(0x00)  			
-        self.send_data (0x6F)  #from outside
+        self.cmd(0x00, [0x6F])  # from outside
 
-        self.send_command(0x01)  #power setting
-        self.send_data (0x03)	    
-        self.send_data (0x00)
-        self.send_data (0x2b)		
-        self.send_data (0x2b) 
+        self.cmd(0x01, [0x03, 0x00, 0x2b, 0x2b])  # power setting
 
-        self.send_command(0x06)  #Configuring the charge pump
-        self.send_data(0x3f)
+        self.cmd(0x06, [0x3f])  # Configuring the charge pump
 
-        self.send_command(0x2A)  #Setting XON and the options of LUT
-        self.send_data(0x00) 
-        self.send_data(0x00) 
+        self.cmd(0x2A, [0x00, 0x00])  # Setting XON and the options of LUT
 
-        self.send_command(0x30)  #Set the clock frequency
-        self.send_data(0x17) #50Hz
+        self.cmd(0x30, [0x17])  # Set the clock frequency; 50Hz
 
-        self.send_command(0x50)  #Set VCOM and data output interval
-        self.send_data(0x57)			
+        self.cmd(0x50, [0x57])  # Set VCOM and data output interval
 
-        self.send_command(0x60)  #Set The non-overlapping period of Gate and Source.
-        self.send_data(0x22)
+        self.cmd(0x60, [0x22])  # Set The non-overlapping period of Gate and Source.
 
-        self.send_command(0x61)  #resolution setting
-        self.send_data (0x50)    #source 128 	 
-        self.send_data (0x80)       
+        self.cmd(0x61, [  # resolution setting
+            0x50,  #source 128
+            0x80,
+        ])
 
-        self.send_command(0x82)  #sets VCOM_DC value
-        self.send_data(0x12)  #-1v
+        self.cmd(0x82, [0x12])  # sets VCOM_DC value; -1v
 
-        self.send_command(0xe3)#Set POWER SAVING
-        self.send_data(0x33)
+        self.cmd(0xe3, [0x33])  # Set POWER SAVING
         self.SetFulltReg()	
         self.send_command(0x04)     		#power on
         self.ReadBusy()
@@ -197,39 +194,25 @@ class EPD:
     def Partial_Init(self):
         self.reset()
         
-        self.send_command(0xD2)
-        self.send_data(0x3F)
+        self.cmd(0xD2, [0x3F])
 
-        self.send_command(0x00)
-        self.send_data (0x6F)  #from outside
+        self.cmd(0x00, [0x6F])  # from outside
 
-        self.send_command(0x01)  #power setting
-        self.send_data (0x03)
-        self.send_data (0x00)
-        self.send_data (0x2b)
-        self.send_data (0x2b)
+        self.cmd(0x01, [0x03, 0x00, 0x2b, 0x2b])  # power setting
 
-        self.send_command(0x06)  #Configuring the charge pump
-        self.send_data(0x3f)
+        self.cmd(0x06, [0x3f])  # Configuring the charge pump
 
-        self.send_command(0x2A)  #Setting XON and the options of LUT
-        self.send_data(0x00)
-        self.send_data(0x00)
+        self.cmd(0x2A, [0x00, 0x00])  # Setting XON and the options of LUT
 
-        self.send_command(0x30)  #Set the clock frequency
-        self.send_data(0x17)
+        self.cmd(0x30, [0x17])  # Set the clock frequency
 
-        self.send_command(0x50)  #Set VCOM and data output interval
-        self.send_data(0xf2)
+        self.cmd(0x50, [0xf2])  # Set VCOM and data output interval
 
-        self.send_command(0x60)  #Set The non-overlapping period of Gate and Source.
-        self.send_data(0x22)
+        self.cmd(0x60, [0x22])  # Set The non-overlapping period of Gate and Source.
 
-        self.send_command(0x82)  #Set VCOM_DC value
-        self.send_data(0x12)#-1v
+        self.cmd(0x82, [0x12])  # Set VCOM_DC value; -1v
 
-        self.send_command(0xe3)#Set POWER SAVING
-        self.send_data(0x33)
+        self.cmd(0xe3, [0x33])  # Set POWER SAVING
 
         self.SetPartReg()	
 
@@ -238,26 +221,11 @@ class EPD:
         # EPD hardware init end
         return 0
     
-    def getbuffer(self, image):
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
+    def getbuffer(self, image, orientation=None):
+        buf = epdbuffer.pack(image, self.width, self.height, orientation)
+        if buf is None:
+            # wrong size, send a blank frame
+            return epdbuffer.fill(0xFF, int(self.width/8) * self.height)
         return buf
 
     def display(self, image):
@@ -304,13 +272,13 @@ class EPD:
 
         # Set partial Windows */
         self.send_command(0x91)		#This command makes the display enter partial mode
-        self.send_command(0x90)		#resolution setting
-        self.send_data(0)           #x-start
-        self.send_data(79)       #x-end
-
-        self.send_data(0)
-        self.send_data(127)  #y-end
-        self.send_data(0x00)
+        self.cmd(0x90, [  # resolution setting
+            0,  #x-start
+            79,  #x-end
+            0,
+            127,  #y-end
+            0x00,
+        ])
        
         # Width = (self.width % 8 == 0)? (self.width / 8 ): (self.width / 8 + 1)
         if(self.width % 8 == 0):
@@ -334,12 +302,10 @@ class EPD:
         self.TurnOnDisplay()
 
     def Sleep(self):
-        self.send_command(0x50)
-        self.send_data(0xf7)
+        self.cmd(0x50, [0xf7])
         self.send_command(0x02)
         self.ReadBusy()
-        self.send_command(0x07)
-        self.send_data(0xA5)
+        self.cmd(0x07, [0xA5])
         epdconfig.delay_ms(200)
 
         epdconfig.delay_ms(2000)
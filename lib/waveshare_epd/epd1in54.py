@@ -81,6 +81,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 200
@@ -97,19 +98,19 @@ class EPD:
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
 
-    lut_full_update = [
+    lut_full_update = bytes([
         0x02, 0x02, 0x01, 0x11, 0x12, 0x12, 0x22, 0x22, 
         0x66, 0x69, 0x69, 0x59, 0x58, 0x99, 0x99, 0x88, 
         0x00, 0x00, 0x00, 0x00, 0xF8, 0xB4, 0x13, 0x51, 
         0x35, 0x51, 0x51, 0x19, 0x01, 0x00
-    ]
+    ])
 
-    lut_partial_update  = [
+    lut_partial_update  = bytes([
         0x10, 0x18, 0x18, 0x08, 0x18, 0x18, 0x08, 0x00, 
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 
         0x00, 0x00, 0x00, 0x00, 0x13, 0x14, 0x44, 0x12, 
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00
-    ]
+    ])
         
     # Hardware reset
     def reset(self):
@@ -126,102 +127,100 @@ class EPD:
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
 
+    '''
+    function :send a command and its parameters in one transaction
+    parameter:
+     command : Command register
+     data : parameter bytes, CS stays low and they go in one transfer
+    '''
+    def cmd(self, command, data=b''):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a lot of data
+    def send_data2(self, data):
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)
+        epdconfig.wait_busy(self.busy_pin, 0)      # 0: idle, 1: busy
         logger.debug("e-Paper busy release")
 
     def TurnOnDisplay(self):
-        self.send_command(0x22) # DISPLAY_UPDATE_CONTROL_2
-        self.send_data(0xC4)
+        self.cmd(0x22, [0xC4])  # DISPLAY_UPDATE_CONTROL_2
         self.send_command(0x20) # MASTER_ACTIVATION
         self.send_command(0xFF) # TERMINATE_FRAME_READ_WRITE
         
         self.ReadBusy()
 
     def SetWindow(self, x_start, y_start, x_end, y_end):
-        self.send_command(0x44) # SET_RAM_X_ADDRESS_START_END_POSITION
-        # x point must be the multiple of 8 or the last 3 bits will be ignored
-        self.send_data((x_start >> 3) & 0xFF)
-        self.send_data((x_end >> 3) & 0xFF)
-        self.send_command(0x45) # SET_RAM_Y_ADDRESS_START_END_POSITION
-        self.send_data(y_start & 0xFF)
-        self.send_data((y_start >> 8) & 0xFF)
-        self.send_data(y_end & 0xFF)
-        self.send_data((y_end >> 8) & 0xFF)
+        self.cmd(0x44, [  # SET_RAM_X_ADDRESS_START_END_POSITION
+            # x point must be the multiple of 8 or the last 3 bits will be ignored
+            (x_start >> 3) & 0xFF,
+            (x_end >> 3) & 0xFF,
+        ])
+        self.cmd(0x45, [  # SET_RAM_Y_ADDRESS_START_END_POSITION
+            y_start & 0xFF,
+            (y_start >> 8) & 0xFF,
+            y_end & 0xFF,
+            (y_end >> 8) & 0xFF,
+        ])
 
     def SetCursor(self, x, y):
-        self.send_command(0x4E) # SET_RAM_X_ADDRESS_COUNTER
-        # x point must be the multiple of 8 or the last 3 bits will be ignored
-        self.send_data((x >> 3) & 0xFF)
+        self.cmd(0x4E, [  # SET_RAM_X_ADDRESS_COUNTER
+            # x point must be the multiple of 8 or the last 3 bits will be ignored
+            (x >> 3) & 0xFF,
+        ])
         
-        self.send_command(0x4F) # SET_RAM_Y_ADDRESS_COUNTER
-        self.send_data(y & 0xFF)
-        self.send_data((y >> 8) & 0xFF)
+        self.cmd(0x4F, [y & 0xFF, (y >> 8) & 0xFF])  # SET_RAM_Y_ADDRESS_COUNTER
         # self.ReadBusy()
         
     def init(self, lut):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
         # EPD hardware init start
         self.reset()
         
-        self.send_command(0x01) # DRIVER_OUTPUT_CONTROL
-        self.send_data((EPD_HEIGHT - 1) & 0xFF)
-        self.send_data(((EPD_HEIGHT - 1) >> 8) & 0xFF)
-        self.send_data(0x00) # GD = 0 SM = 0 TB = 0
+        self.cmd(0x01, [  # DRIVER_OUTPUT_CONTROL
+            (EPD_HEIGHT - 1) & 0xFF,
+            ((EPD_HEIGHT - 1) >> 8) & 0xFF,
+            0x00,  # GD = 0 SM = 0 TB = 0
+        ])
         
-        self.send_command(0x0C) # BOOSTER_SOFT_START_CONTROL
-        self.send_data(0xD7)
-        self.send_data(0xD6)
-        self.send_data(0x9D)
+        self.cmd(0x0C, [0xD7, 0xD6, 0x9D])  # BOOSTER_SOFT_START_CONTROL
         
-        self.send_command(0x2C) # WRITE_VCOM_REGISTER
-        self.send_data(0xA8) # VCOM 7C
+        self.cmd(0x2C, [0xA8])  # WRITE_VCOM_REGISTER; VCOM 7C
         
-        self.send_command(0x3A) # SET_DUMMY_LINE_PERIOD
-        self.send_data(0x1A) # 4 dummy lines per gate
+        self.cmd(0x3A, [0x1A])  # SET_DUMMY_LINE_PERIOD; 4 dummy lines per gate
         
-        self.send_command(0x3B) # SET_GATE_TIME
-        self.send_data(0x08) # 2us per line
+        self.cmd(0x3B, [0x08])  # SET_GATE_TIME; 2us per line
         
-        self.send_command(0x11) # DATA_ENTRY_MODE_SETTING
-        self.send_data(0x03) # X increment Y increment
+        self.cmd(0x11, [0x03])  # DATA_ENTRY_MODE_SETTING; X increment Y increment
         
         # set the look-up table register
-        self.send_command(0x32)
-        for i in range(0, len(lut)):
-            self.send_data(lut[i])
+        self.cmd(0x32, lut)
         # EPD hardware init end
         return 0
 
-    def getbuffer(self, image):
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
+    def getbuffer(self, image, orientation=None):
+        buf = epdbuffer.pack(image, self.width, self.height, orientation)
+        if buf is None:
+            # wrong size, send a blank frame
+            return epdbuffer.fill(0xFF, int(self.width/8) * self.height)
         return buf
 
     def display(self, image):
@@ -251,8 +250,7 @@ class EPD:
         self.TurnOnDisplay()
 
     def sleep(self):
-        self.send_command(0x10) # DEEP_SLEEP_MODE
-        self.send_data(0x01)
+        self.cmd(0x10, [0x01])  # DEEP_SLEEP_MODE
         
         epdconfig.delay_ms(2000)
         epdconfig.module_exit()
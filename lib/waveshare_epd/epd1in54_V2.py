@@ -29,6 +29,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 200
@@ -46,7 +47,7 @@ class EPD:
         self.height = EPD_HEIGHT
         
     # waveform full refresh
-    WF_Full_1IN54 = [
+    WF_Full_1IN54 = bytes([
     0x80,	0x48,	0x40,	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,
     0x40,	0x48,	0x80,	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,
     0x80,	0x48,	0x40,	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,
@@ -66,10 +67,10 @@ class EPD:
     0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,					
     0x22,	0x22,	0x22,	0x22,	0x22,	0x22,	0x0,	0x0,	0x0,			
     0x22,	0x17,	0x41,	0x0,	0x32,	0x20
-    ]
+    ])
 
     # waveform partial refresh(fast)
-    WF_PARTIAL_1IN54_0 = [
+    WF_PARTIAL_1IN54_0 = bytes([
     0x0,0x40,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
     0x80,0x80,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
     0x40,0x40,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
@@ -89,7 +90,7 @@ class EPD:
     0x0,0x0,0x0,0x0,0x0,0x0,0x0,
     0x22,0x22,0x22,0x22,0x22,0x22,0x0,0x0,0x0,
     0x02,0x17,0x41,0xB0,0x32,0x28,
-    ]
+    ])
         
     # Hardware reset
     def reset(self):
@@ -106,6 +107,21 @@ class EPD:
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
 
+    '''
+    function :send a command and its parameters in one transaction
+    parameter:
+     command : Command register
+     data : parameter bytes, CS stays low and they go in one transfer
+    '''
+    def cmd(self, command, data=b''):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
@@ -121,65 +137,54 @@ class EPD:
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):
-            epdconfig.delay_ms(20)
+        epdconfig.wait_busy(self.busy_pin, 0)      # 0: idle, 1: busy
         logger.debug("e-Paper busy release")
 
     def TurnOnDisplay(self):
-        self.send_command(0x22) # DISPLAY_UPDATE_CONTROL_2
-        self.send_data(0xc7)
+        self.cmd(0x22, [0xc7])  # DISPLAY_UPDATE_CONTROL_2
         self.send_command(0x20) # MASTER_ACTIVATION
         self.ReadBusy()
     
     def TurnOnDisplayPart(self):
-        self.send_command(0x22) # DISPLAY_UPDATE_CONTROL_2
-        self.send_data(0xcF)
+        self.cmd(0x22, [0xcF])  # DISPLAY_UPDATE_CONTROL_2
         self.send_command(0x20) # MASTER_ACTIVATION
         self.ReadBusy()
 
     def lut(self, lut):
-        self.send_command(0x32) # WRITE_LUT_REGISTER
-        self.send_data2(lut)
+        self.cmd(0x32, lut)  # WRITE_LUT_REGISTER
             
     def set_lut(self, lut):
         self.lut(lut)
         
-        self.send_command(0x3f)
-        self.send_data(lut[153])
+        self.cmd(0x3f, [lut[153]])
         
-        self.send_command(0x03)
-        self.send_data(lut[154])
+        self.cmd(0x03, [lut[154]])
         
-        self.send_command(0x04)
-        self.send_data(lut[155])
-        self.send_data(lut[156])
-        self.send_data(lut[157])
+        self.cmd(0x04, [lut[155], lut[156], lut[157]])
         
-        self.send_command(0x2c)
-        self.send_data(lut[158])
+        self.cmd(0x2c, [lut[158]])
       
     def SetWindows(self, Xstart, Ystart, Xend, Yend):
-        self.send_command(0x44) # SET_RAM_X_ADDRESS_START_END_POSITION
-        self.send_data((Xstart>>3) & 0xFF)
-        self.send_data((Xend>>3) & 0xFF)
+        self.cmd(0x44, [  # SET_RAM_X_ADDRESS_START_END_POSITION
+            (Xstart>>3) & 0xFF,
+            (Xend>>3) & 0xFF,
+        ])
         
-        self.send_command(0x45) # SET_RAM_Y_ADDRESS_START_END_POSITION
-        self.send_data(Ystart & 0xFF)
-        self.send_data((Ystart >> 8) & 0xFF)
-        self.send_data(Yend & 0xFF)
-        self.send_data((Yend >> 8) & 0xFF)
+        self.cmd(0x45, [  # SET_RAM_Y_ADDRESS_START_END_POSITION
+            Ystart & 0xFF,
+            (Ystart >> 8) & 0xFF,
+            Yend & 0xFF,
+            (Yend >> 8) & 0xFF,
+        ])
     
 
     def SetCursor(self, Xstart, Ystart):
-        self.send_command(0x4E); # SET_RAM_X_ADDRESS_COUNTER
-        self.send_data(Xstart & 0xFF);
+        self.cmd(0x4E, [Xstart & 0xFF])  # SET_RAM_X_ADDRESS_COUNTER
 
-        self.send_command(0x4F); # SET_RAM_Y_ADDRESS_COUNTER
-        self.send_data(Ystart & 0xFF);
-        self.send_data((Ystart >> 8) & 0xFF);
+        self.cmd(0x4F, [Ystart & 0xFF, (Ystart >> 8) & 0xFF])  # SET_RAM_Y_ADDRESS_COUNTER
 
     def init(self, isPartial):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
             
         if(isPartial):
@@ -189,23 +194,11 @@ class EPD:
             
             self.set_lut(self.WF_PARTIAL_1IN54_0)
             
-            self.send_command(0x37)
-            self.send_data(0x00)
-            self.send_data(0x00)
-            self.send_data(0x00)
-            self.send_data(0x00)
-            self.send_data(0x00)
-            self.send_data(0x40)
-            self.send_data(0x00)
-            self.send_data(0x00)
-            self.send_data(0x00)
-            self.send_data(0x00)
+            self.cmd(0x37, [0x00, 0x00, 0x00, 0x00, 0x00, 0x40, 0x00, 0x00, 0x00, 0x00])
             
-            self.send_command(0x3c)  # BorderWavefrom
-            self.send_data(0x80)
+            self.cmd(0x3c, [0x80])  # BorderWavefrom
             
-            self.send_command(0x22)
-            self.send_data(0xc0)
+            self.cmd(0x22, [0xc0])
             self.send_command(0x20)
             self.ReadBusy()
         
@@ -218,24 +211,21 @@ class EPD:
             self.send_command(0x12) # SWRESET (software reset)
             self.ReadBusy()
             
-            self.send_command(0x01) # DRIVER_OUTPUT_CONTROL
-            self.send_data(0xC7) # (EPD_HEIGHT - 1) & 0xFF
-            self.send_data(0x00) # ((EPD_HEIGHT - 1) >> 8) & 0xFF
-            self.send_data(0x01) # GD = 0 SM = 0 TB = 0
+            self.cmd(0x01, [  # DRIVER_OUTPUT_CONTROL
+                0xC7,  # (EPD_HEIGHT - 1) & 0xFF
+                0x00,  # ((EPD_HEIGHT - 1) >> 8) & 0xFF
+                0x01,  # GD = 0 SM = 0 TB = 0
+            ])
             
-            self.send_command(0x11) # data entry mode
-            self.send_data(0x01)
+            self.cmd(0x11, [0x01])  # data entry mode
                       
             self.SetWindows(0, self.height-1, self.width-1, 0) # Set Windows
     
-            self.send_command(0x3C) # BorderWavefrom
-            self.send_data(0x01)
+            self.cmd(0x3C, [0x01])  # BorderWavefrom
 
-            self.send_command(0x18)
-            self.send_data(0x80)
+            self.cmd(0x18, [0x80])
 
-            self.send_command(0x22) # #Load Temperature and waveform setting.
-            self.send_data(0XB1)
+            self.cmd(0x22, [0XB1])  # #Load Temperature and waveform setting.
             self.send_command(0x20)
 
             self.SetCursor(0, self.height-1) # Set Cursor
@@ -250,50 +240,31 @@ class EPD:
         else:
             linewidth = int(self.width/8) + 1
 
-        self.send_command(0x24)
-        self.send_data2([color] * self.height * linewidth)
+        self.cmd(0x24, epdbuffer.fill(color, self.height * linewidth))
                 
         self.TurnOnDisplay()
         
-    def getbuffer(self, image):
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
+    def getbuffer(self, image, orientation=None):
+        buf = epdbuffer.pack(image, self.width, self.height, orientation)
+        if buf is None:
+            # wrong size, send a blank frame
+            return epdbuffer.fill(0xFF, int(self.width/8) * self.height)
         return buf
 
     def display(self, image):
         if (image == None):
             return
             
-        self.send_command(0x24)
-        self.send_data2(image)   
+        self.cmd(0x24, image)
         self.TurnOnDisplay()
         
     def displayPartBaseImage(self, image):
         if (image == None):
             return
         
-        self.send_command(0x24)
-        self.send_data2(image)
+        self.cmd(0x24, image)
         
-        self.send_command(0x26)
-        self.send_data2(image)
+        self.cmd(0x26, image)
                 
         self.TurnOnDisplay()
         
@@ -301,14 +272,12 @@ class EPD:
         if (image == None):
             return
         
-        self.send_command(0x24)
-        self.send_data2(image)
+        self.cmd(0x24, image)
                 
         self.TurnOnDisplayPart()
         
     def sleep(self):
-        self.send_command(0x10) # DEEP_SLEEP_MODE
-        self.send_data(0x01)
+        self.cmd(0x10, [0x01])  # DEEP_SLEEP_MODE
         
         epdconfig.delay_ms(2000)
         epdconfig.module_exit()
@@ -29,6 +29,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 200
@@ -61,6 +62,21 @@ class EPD:
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
 
+    '''
+    function :send a command and its parameters in one transaction
+    parameter:
+     command : Command register
+     data : parameter bytes, CS stays low and they go in one transfer
+    '''
+    def cmd(self, command, data=b''):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
@@ -76,12 +92,11 @@ class EPD:
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):
-            epdconfig.delay_ms(100)    
+        epdconfig.wait_busy(self.busy_pin, 0)      # 0: idle, 1: busy
         logger.debug("e-Paper busy release")
         
     def init(self):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
         # EPD hardware init start
         self.reset()
@@ -90,40 +105,31 @@ class EPD:
         self.send_command(0x12)  #SWRESET
         self.ReadBusy()   
 
-        self.send_command(0x01) #Driver output control      
-        self.send_data(0xC7)
-        self.send_data(0x00)
-        self.send_data(0x01)
+        self.cmd(0x01, [0xC7, 0x00, 0x01])  # Driver output control
 
-        self.send_command(0x11) #data entry mode       
-        self.send_data(0x01)
+        self.cmd(0x11, [0x01])  # data entry mode
 
-        self.send_command(0x44) #set Ram-X address start/end position   
-        self.send_data(0x00)
-        self.send_data(0x18)    #0x18-->(24+1)*8=200
+        self.cmd(0x44, [  # set Ram-X address start/end position
+            0x00,
+            0x18,  #0x18-->(24+1)*8=200
+        ])
 
-        self.send_command(0x45) #set Ram-Y address start/end position          
-        self.send_data(0xC7)    #0xC7-->(199+1)=200
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00) 
+        self.cmd(0x45, [  # set Ram-Y address start/end position
+            0xC7,  #0xC7-->(199+1)=200
+            0x00, 0x00, 0x00,
+        ])
 
-        self.send_command(0x3C) #BorderWavefrom
-        self.send_data(0x05)
+        self.cmd(0x3C, [0x05])  # BorderWavefrom
 
-        self.send_command(0x18) #Read built-in temperature sensor
-        self.send_data(0x80)
+        self.cmd(0x18, [0x80])  # Read built-in temperature sensor
 
-        self.send_command(0x4E)   # set RAM x address count to 0
-        self.send_data(0x00)
-        self.send_command(0x4F)   # set RAM y address count to 0X199    
-        self.send_data(0xC7)
-        self.send_data(0x00)
+        self.cmd(0x4E, [0x00])  # set RAM x address count to 0
+        self.cmd(0x4F, [0xC7, 0x00])  # set RAM y address count to 0X199
         self.ReadBusy()
         return 0
 
     def getbuffer(self, image):
-        buf = [0xFF] * int(self.width * self.height / 8)
+        buf = bytearray(epdbuffer.fill(0xFF, int(self.width * self.height / 8)))
         # Set buffer to value of Python Imaging Library image.
         # Image must be in mode 1.
         image_monocolor = image.convert('1')
@@ -147,22 +153,15 @@ class EPD:
         else:
             linewidth = int(self.width/8) + 1
 
-        buf = [0x00] * self.height * linewidth
-
         # send black data
         if (blackimage != None):
-            self.send_command(0x24) # DATA_START_TRANSMISSION_1
-            self.send_data2(blackimage)
+            self.cmd(0x24, blackimage)  # DATA_START_TRANSMISSION_1
                 
         # send red data        
         if (redimage != None):
-            self.send_command(0x26) # DATA_START_TRANSMISSION_2
-            for i in range(0, int(self.width * self.height / 8)):
-                buf[i] = ~redimage[i]
-            self.send_data2(buf)
+            self.cmd(0x26, epdbuffer.invert(redimage))  # DATA_START_TRANSMISSION_2
 
-        self.send_command(0x22) # DISPLAY_REFRESH
-        self.send_data(0xF7)
+        self.cmd(0x22, [0xF7])  # DISPLAY_REFRESH
         self.send_command(0x20) # DISPLAY_REFRESH
         self.ReadBusy()
 
@@ -172,21 +171,17 @@ class EPD:
         else:
             linewidth = int(self.width/8) + 1
 
-        self.send_command(0x24) # DATA_START_TRANSMISSION_1
-        self.send_data2([0xff] * int(self.height * linewidth))
+        self.cmd(0x24, epdbuffer.fill(0xff, int(self.height * linewidth)))  # DATA_START_TRANSMISSION_1
             
-        self.send_command(0x26) # DATA_START_TRANSMISSION_2
-        self.send_data2([0x00] * int(self.height * linewidth))
+        self.cmd(0x26, epdbuffer.fill(0x00, int(self.height * linewidth)))  # DATA_START_TRANSMISSION_2
 
-        self.send_command(0x22) # DISPLAY_REFRESH
-        self.send_data(0xF7)
+        self.cmd(0x22, [0xF7])  # DISPLAY_REFRESH
         self.send_command(0x20) # DISPLAY_REFRESH
         self.ReadBusy()
 
 
     def sleep(self):
-        self.send_command(0x10) #enter deep sleep
-        self.send_data(0x01) 
+        self.cmd(0x10, [0x01])  # enter deep sleep
 
         epdconfig.delay_ms(2000)
         epdconfig.module_exit()
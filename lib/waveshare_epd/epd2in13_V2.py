@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -48,7 +49,7 @@ class EPD:
         
     FULL_UPDATE = 0
     PART_UPDATE = 1
-    lut_full_update= [
+    lut_full_update= bytes([
         0x80,0x60,0x40,0x00,0x00,0x00,0x00,             #LUT0: BB:     VS 0 ~7
         0x10,0x60,0x20,0x00,0x00,0x00,0x00,             #LUT1: BW:     VS 0 ~7
         0x80,0x60,0x40,0x00,0x00,0x00,0x00,             #LUT2: WB:     VS 0 ~7
@@ -64,9 +65,9 @@ class EPD:
         0x00,0x00,0x00,0x00,0x00,                       # TP6 A~D RP6
 
         0x15,0x41,0xA8,0x32,0x30,0x0A,
-    ]
+    ])
 
-    lut_partial_update = [ #20 bytes
+    lut_partial_update = bytes([ #20 bytes
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,             #LUT0: BB:     VS 0 ~7
         0x80,0x00,0x00,0x00,0x00,0x00,0x00,             #LUT1: BW:     VS 0 ~7
         0x40,0x00,0x00,0x00,0x00,0x00,0x00,             #LUT2: WB:     VS 0 ~7
@@ -82,7 +83,7 @@ class EPD:
         0x00,0x00,0x00,0x00,0x00,                       # TP6 A~D RP6
 
         0x15,0x41,0xA8,0x32,0x30,0x0A,
-    ]
+    ])
         
     # Hardware reset
     def reset(self):
@@ -99,6 +100,21 @@ class EPD:
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
 
+    '''
+    function :send a command and its parameters in one transaction
+    parameter:
+     command : Command register
+     data : parameter bytes, CS stays low and they go in one transfer
+    '''
+    def cmd(self, command, data=b''):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
@@ -113,23 +129,20 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)    
+        epdconfig.wait_busy(self.busy_pin, 0)      # 0: idle, 1: busy
 
     def TurnOnDisplay(self):
-        self.send_command(0x22)
-        self.send_data(0xC7)
+        self.cmd(0x22, [0xC7])
         self.send_command(0x20)        
         self.ReadBusy()
         
     def TurnOnDisplayPart(self):
-        self.send_command(0x22)
-        self.send_data(0x0c)
+        self.cmd(0x22, [0x0c])
         self.send_command(0x20)        
         self.ReadBusy()
         
     def init(self, update):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
         # EPD hardware init start
         self.reset()
@@ -138,84 +151,57 @@ class EPD:
             self.send_command(0x12) # soft reset
             self.ReadBusy()
 
-            self.send_command(0x74) #set analog block control
-            self.send_data(0x54)
-            self.send_command(0x7E) #set digital block control
-            self.send_data(0x3B)
+            self.cmd(0x74, [0x54])  # set analog block control
+            self.cmd(0x7E, [0x3B])  # set digital block control
 
-            self.send_command(0x01) #Driver output control
-            self.send_data(0xF9)
-            self.send_data(0x00)
-            self.send_data(0x00)
+            self.cmd(0x01, [0xF9, 0x00, 0x00])  # Driver output control
 
-            self.send_command(0x11) #data entry mode
-            self.send_data(0x01)
+            self.cmd(0x11, [0x01])  # data entry mode
 
-            self.send_command(0x44) #set Ram-X address start/end position
-            self.send_data(0x00)
-            self.send_data(0x0F)    #0x0C-->(15+1)*8=128
+            self.cmd(0x44, [  # set Ram-X address start/end position
+                0x00,
+                0x0F,  #0x0C-->(15+1)*8=128
+            ])
 
-            self.send_command(0x45) #set Ram-Y address start/end position
-            self.send_data(0xF9)   #0xF9-->(249+1)=250
-            self.send_data(0x00)
-            self.send_data(0x00)
-            self.send_data(0x00)
+            self.cmd(0x45, [  # set Ram-Y address start/end position
+                0xF9,  #0xF9-->(249+1)=250
+                0x00, 0x00, 0x00,
+            ])
             
-            self.send_command(0x3C) #BorderWavefrom
-            self.send_data(0x03)
-
-            self.send_command(0x2C)     #VCOM Voltage
-            self.send_data(0x55)    #
-
-            self.send_command(0x03)
-            self.send_data(self.lut_full_update[70])
-
-            self.send_command(0x04) #
-            self.send_data(self.lut_full_update[71])
-            self.send_data(self.lut_full_update[72])
-            self.send_data(self.lut_full_update[73])
-
-            self.send_command(0x3A)     #Dummy Line
-            self.send_data(self.lut_full_update[74])
-            self.send_command(0x3B)     #Gate time
-            self.send_data(self.lut_full_update[75])
-
-            self.send_command(0x32)
-            for count in range(70):
-                self.send_data(self.lut_full_update[count])
-
-            self.send_command(0x4E)   # set RAM x address count to 0
-            self.send_data(0x00)
-            self.send_command(0x4F)   # set RAM y address count to 0X127
-            self.send_data(0xF9)
-            self.send_data(0x00)
+            self.cmd(0x3C, [0x03])  # BorderWavefrom
+
+            self.cmd(0x2C, [0x55])  # VCOM Voltage; 
+
+            self.cmd(0x03, [self.lut_full_update[70]])
+
+            self.cmd(0x04, [
+                self.lut_full_update[71],
+                self.lut_full_update[72],
+                self.lut_full_update[73],
+            ])
+
+            self.cmd(0x3A, [self.lut_full_update[74]])  # Dummy Line
+            self.cmd(0x3B, [self.lut_full_update[75]])  # Gate time
+
+            self.cmd(0x32, self.lut_full_update[:70])
+
+            self.cmd(0x4E, [0x00])  # set RAM x address count to 0
+            self.cmd(0x4F, [0xF9, 0x00])  # set RAM y address count to 0X127
             self.ReadBusy()
         else:
-            self.send_command(0x2C)     #VCOM Voltage
-            self.send_data(0x26)
+            self.cmd(0x2C, [0x26])  # VCOM Voltage
 
             self.ReadBusy()
 
-            self.send_command(0x32)
-            for count in range(70):
-                self.send_data(self.lut_partial_update[count])
-
-            self.send_command(0x37)
-            self.send_data(0x00)
-            self.send_data(0x00)
-            self.send_data(0x00)
-            self.send_data(0x00)
-            self.send_data(0x40)
-            self.send_data(0x00)
-            self.send_data(0x00)
-
-            self.send_command(0x22)
-            self.send_data(0xC0)
+            self.cmd(0x32, self.lut_partial_update[:70])
+
+            self.cmd(0x37, [0x00, 0x00, 0x00, 0x00, 0x40, 0x00, 0x00])
+
+            self.cmd(0x22, [0xC0])
             self.send_command(0x20)
             self.ReadBusy()
 
-            self.send_command(0x3C) #BorderWavefrom
-            self.send_data(0x01)
+            self.cmd(0x3C, [0x01])  # BorderWavefrom
         return 0
 
     def getbuffer(self, image):
@@ -224,7 +210,7 @@ class EPD:
         else:
             linewidth = int(self.width/8) + 1
          
-        buf = [0xFF] * (linewidth * self.height)
+        buf = bytearray(epdbuffer.fill(0xFF, linewidth * self.height))
         image_monocolor = image.convert('1')
         imwidth, imheight = image_monocolor.size
         pixels = image_monocolor.load()
@@ -249,8 +235,7 @@ class EPD:
         
         
     def display(self, image):
-        self.send_command(0x24)
-        self.send_data2(image)   
+        self.cmd(0x24, image)
         self.TurnOnDisplay()
         
     def displayPartial(self, image):
@@ -259,25 +244,18 @@ class EPD:
         else:
             linewidth = int(self.width/8) + 1
 
-        buf = [0x00] * self.height * linewidth
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                buf[i + j * linewidth] = ~image[i + j * linewidth]
+        buf = epdbuffer.invert(image[:self.height * linewidth])
 
-        self.send_command(0x24)
-        self.send_data2(image)   
+        self.cmd(0x24, image)
                 
                 
-        self.send_command(0x26)
-        self.send_data2(buf)  
+        self.cmd(0x26, buf)
         self.TurnOnDisplayPart()
 
     def displayPartBaseImage(self, image):
-        self.send_command(0x24)
-        self.send_data2(image)   
+        self.cmd(0x24, image)
                 
-        self.send_command(0x26)
-        self.send_data2(image)  
+        self.cmd(0x26, image)
         self.TurnOnDisplay()
     
     def Clear(self, color=0xFF):
@@ -287,13 +265,7 @@ class EPD:
             linewidth = int(self.width/8) + 1
         # logger.debug(linewidth)
         
-        buf = [0x00] * self.height * linewidth
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                buf[i + j * linewidth] = color
-
-        self.send_command(0x24)
-        self.send_data2(buf)
+        self.cmd(0x24, epdbuffer.fill(color, self.height * linewidth))
                 
         # self.send_command(0x26)
         # for j in range(0, self.height):
@@ -307,8 +279,7 @@ class EPD:
         # self.send_data(0xC3)
         # self.send_command(0x20)
 
-        self.send_command(0x10) #enter deep sleep
-        self.send_data(0x03)
+        self.cmd(0x10, [0x03])  # enter deep sleep
         epdconfig.delay_ms(2000)
         epdconfig.module_exit()
 
@@ -30,6 +30,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdseq
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -45,8 +47,11 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.lut_loaded = None    # LUT currently held in the controller
+        self.sequence = None      # (sequence, level) epdseq ran last
+        self.asleep = None        # epdseq level of the last sleep
         
-    lut_partial_update= [
+    lut_partial_update= bytes([
         0x0,0x40,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
         0x80,0x80,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
         0x40,0x40,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
@@ -66,9 +71,9 @@ class EPD:
         0x0,0x0,0x0,0x0,0x0,0x0,0x0,
         0x22,0x22,0x22,0x22,0x22,0x22,0x0,0x0,0x0,
         0x22,0x17,0x41,0x00,0x32,0x36,
-    ]
+    ])
 
-    lut_full_update = [ 
+    lut_full_update = bytes([ 
         0x80,0x4A,0x40,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
         0x40,0x4A,0x80,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
         0x80,0x4A,0x40,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
@@ -88,8 +93,28 @@ class EPD:
         0x0,0x0,0x0,0x0,0x0,0x0,0x0,
         0x22,0x22,0x22,0x22,0x22,0x22,0x0,0x0,0x0,
         0x22,0x17,0x41,0x0,0x32,0x36,
-    ]
+    ])
         
+    # init(), as data for epdseq; frame RAM survives all of it. Every step
+    # is DEEP: standby() keeps them all, leaving deep sleep takes the
+    # hardware reset and everything after it.
+    INIT = (
+        epdseq.reset(),
+        epdseq.busy(),
+        epdseq.command(0x12),   # SWRESET
+        epdseq.busy(),
+        epdseq.command(0x01, [0xf9, 0x00, 0x00]),   # Driver output control
+        epdseq.command(0x11, [0x03]),   # data entry mode
+        epdseq.command(0x44, [0x00, (EPD_WIDTH - 1) >> 3]),   # RAM x window
+        epdseq.command(0x45, [0x00, 0x00, (EPD_HEIGHT - 1) & 0xFF, (EPD_HEIGHT - 1) >> 8]),   # RAM y window
+        epdseq.command(0x4E, [0x00]),   # RAM x counter
+        epdseq.command(0x4F, [0x00, 0x00]),   # RAM y counter
+        epdseq.command(0x3c, [0x05]),
+        epdseq.command(0x21, [0x00, 0x80]),   # Display update control
+        epdseq.command(0x18, [0x80]),
+        epdseq.busy(),
+    )
+
     '''
     function :Hardware reset
     parameter:
@@ -101,6 +126,7 @@ class EPD:
         epdconfig.delay_ms(2)
         epdconfig.digital_write(self.reset_pin, 1)
         epdconfig.delay_ms(20)   
+        self.lut_loaded = None
 
     '''
     function :send command
@@ -113,6 +139,21 @@ class EPD:
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
 
+    '''
+    function :send a command and its parameters in one transaction
+    parameter:
+     command : Command register
+     data : parameter bytes, CS stays low and they go in one transfer
+    '''
+    def cmd(self, command, data=b''):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
     '''
     function :send data
     parameter:
@@ -137,29 +178,37 @@ class EPD:
     '''
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(10)  
+        epdconfig.wait_busy(self.busy_pin, 0)      # 0: idle, 1: busy
         logger.debug("e-Paper busy release")
 
     '''
     function : Turn On Display
     parameter:
-    '''
-    def TurnOnDisplay(self):
-        self.send_command(0x22) # Display Update Control
-        self.send_data(0xC7)
+        wait : False to return once the refresh is triggered, call
+               ReadBusy() before sending anything else
+    '''
+    def TurnOnDisplay(self, wait=True):
+        if self.lut_loaded is not self.lut_full_update:
+            # a partial refresh left its waveform, display options and
+            # border behind; restore the full ones
+            self.SetLut(self.lut_full_update)
+            self.cmd(0x37, [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00])  # Display option, ping-pong off
+            self.cmd(0x3C, [0x05])  # BorderWavefrom
+        self.cmd(0x22, [0xC7])  # Display Update Control
         self.send_command(0x20) # Activate Display Update Sequence
-        self.ReadBusy()
+        if wait:
+            self.ReadBusy()
     
     '''
     function : Turn On Display Part
     parameter:
+        wait : as for TurnOnDisplay
     '''
-    def TurnOnDisplayPart(self):
-        self.send_command(0x22) # Display Update Control
-        self.send_data(0x0f)    # fast:0x0c, quality:0x0f, 0xcf
+    def TurnOnDisplayPart(self, wait=True):
+        self.cmd(0x22, [0x0f])  # Display Update Control; fast:0x0c, quality:0x0f, 0xcf
         self.send_command(0x20) # Activate Display Update Sequence
-        self.ReadBusy()
+        if wait:
+            self.ReadBusy()
     
     '''
     function : Set lut
@@ -167,28 +216,27 @@ class EPD:
         lut : lut data
     '''    
     def Lut(self, lut):
-        self.send_command(0x32)
-        for i in range(0, 153):
-            self.send_data(lut[i])
+        self.cmd(0x32, lut[:153])
         self.ReadBusy()
     
     '''
-    function : Send lut data and configuration
+    function : Send lut data and configuration, skipped if already loaded
     parameter:
         lut : lut data 
     '''
     def SetLut(self, lut):
+        if self.lut_loaded is lut:
+            return
         self.Lut(lut)
-        self.send_command(0x3f)
-        self.send_data(lut[153])
-        self.send_command(0x03)     # gate voltage
-        self.send_data(lut[154])
-        self.send_command(0x04)     # source voltage
-        self.send_data(lut[155])    # VSH
-        self.send_data(lut[156])    # VSH2
-        self.send_data(lut[157])    # VSL
-        self.send_command(0x2c)     # VCOM
-        self.send_data(lut[158])
+        self.cmd(0x3f, [lut[153]])
+        self.cmd(0x03, [lut[154]])  # gate voltage
+        self.cmd(0x04, [  # source voltage
+            lut[155],  # VSH
+            lut[156],  # VSH2
+            lut[157],  # VSL
+        ])
+        self.cmd(0x2c, [lut[158]])  # VCOM
+        self.lut_loaded = lut
     
     '''
     function : Setting the display window
@@ -199,16 +247,18 @@ class EPD:
         yend : End position of Y-axis
     '''
     def SetWindow(self, x_start, y_start, x_end, y_end):
-        self.send_command(0x44) # SET_RAM_X_ADDRESS_START_END_POSITION
-        # x point must be the multiple of 8 or the last 3 bits will be ignored
-        self.send_data((x_start>>3) & 0xFF)
-        self.send_data((x_end>>3) & 0xFF)
+        self.cmd(0x44, [  # SET_RAM_X_ADDRESS_START_END_POSITION
+            # x point must be the multiple of 8 or the last 3 bits will be ignored
+            (x_start>>3) & 0xFF,
+            (x_end>>3) & 0xFF,
+        ])
         
-        self.send_command(0x45) # SET_RAM_Y_ADDRESS_START_END_POSITION
-        self.send_data(y_start & 0xFF)
-        self.send_data((y_start >> 8) & 0xFF)
-        self.send_data(y_end & 0xFF)
-        self.send_data((y_end >> 8) & 0xFF)
+        self.cmd(0x45, [  # SET_RAM_Y_ADDRESS_START_END_POSITION
+            y_start & 0xFF,
+            (y_start >> 8) & 0xFF,
+            y_end & 0xFF,
+            (y_end >> 8) & 0xFF,
+        ])
 
     '''
     function : Set Cursor
@@ -217,52 +267,53 @@ class EPD:
         y : Y-axis starting position
     '''
     def SetCursor(self, x, y):
-        self.send_command(0x4E) # SET_RAM_X_ADDRESS_COUNTER
-        # x point must be the multiple of 8 or the last 3 bits will be ignored
-        self.send_data(x & 0xFF)
+        self.cmd(0x4E, [  # SET_RAM_X_ADDRESS_COUNTER
+            # x point must be the multiple of 8 or the last 3 bits will be ignored
+            x & 0xFF,
+        ])
         
-        self.send_command(0x4F) # SET_RAM_Y_ADDRESS_COUNTER
-        self.send_data(y & 0xFF)
-        self.send_data((y >> 8) & 0xFF)
+        self.cmd(0x4F, [y & 0xFF, (y >> 8) & 0xFF])  # SET_RAM_Y_ADDRESS_COUNTER
     
     '''
     function : Initialize the e-Paper register
     parameter:
     '''
     def init(self):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
-        # EPD hardware init start
-        self.reset()
-        
-        self.ReadBusy()
-        self.send_command(0x12)  #SWRESET
-        self.ReadBusy() 
-
-        self.send_command(0x01) #Driver output control      
-        self.send_data(0xf9)
-        self.send_data(0x00)
-        self.send_data(0x00)
-    
-        self.send_command(0x11) #data entry mode       
-        self.send_data(0x03)
-
-        self.SetWindow(0, 0, self.width-1, self.height-1)
-        self.SetCursor(0, 0)
-        
-        self.send_command(0x3c)
-        self.send_data(0x05)
+        epdseq.run(self, self.INIT)
+        self.asleep = None
+        self.SetLut(self.lut_full_update)
+        return 0
 
-        self.send_command(0x21) #  Display update control
-        self.send_data(0x00)
-        self.send_data(0x80)
-    
-        self.send_command(0x18)
-        self.send_data(0x80)
-        
+    '''
+    function : Turn the clock and analog supply off between refreshes.
+               Registers, the LUT and frame RAM are kept, so waking
+               from it sends nothing; an update sequence turns both back
+               on by itself.
+    parameter:
+    '''
+    def standby(self):
+        self.ReadBusy()  # a refresh still running finishes first
+        self.cmd(0x22, [0x03])  # Display Update Control: clock and analog off
+        self.send_command(0x20) # Activate Display Update Sequence
         self.ReadBusy()
-        
-        self.SetLut(self.lut_full_update)
+        self.asleep = epdseq.LIGHT
+
+    '''
+    function : Wake the panel after standby() or sleep(). Deep sleep
+               loses the registers and the LUT but keeps frame RAM, so
+               partial refreshes go on against the last base image.
+    parameter:
+    '''
+    def wake(self):
+        level = self.asleep or epdseq.LIGHT
+        if level == epdseq.DEEP and epdconfig.module_init(__name__) != 0:
+            return -1
+        epdseq.run(self, self.INIT, level)
+        self.asleep = None
+        if self.lut_loaded is None:
+            self.SetLut(self.lut_full_update)
         return 0
 
     '''
@@ -270,69 +321,32 @@ class EPD:
     parameter:
         image : Image data
     '''
-    def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        if(imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif(imwidth == self.height and imheight == self.width):
-            # image has correct dimensions, but needs to be rotated
-            img = img.rotate(90, expand=True).convert('1')
-        else:
+    def getbuffer(self, image, orientation=None):
+        buf = epdbuffer.pack(image, self.width, self.height, orientation)
+        if buf is None:
             logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
             # return a blank buffer
-            return [0x00] * (int(self.width/8) * self.height)
-
-        buf = bytearray(img.tobytes('raw'))
+            return epdbuffer.fill(0x00, int(self.width/8) * self.height)
         return buf
         
     '''
     function : Sends the image buffer in RAM to e-Paper and displays
     parameter:
         image : Image data
+        wait : False to return once the refresh is triggered
     '''
-    def display(self, image):
-        if self.width%8 == 0:
-            linewidth = int(self.width/8)
-        else:
-            linewidth = int(self.width/8) + 1
-
-        self.send_command(0x24)
-        for j in range(0, self.height):
-            for i in range(0, linewidth):
-                self.send_data(image[i + j * linewidth])   
-        self.TurnOnDisplay()
+    def display(self, image, wait=True):
+        self.cmd(0x24, image)
+        self.TurnOnDisplay(wait)
     
     '''
     function : Sends the image buffer in RAM to e-Paper and partial refresh
     parameter:
         image : Image data
+        wait : False to return once the refresh is triggered
     '''
-    def displayPartial(self, image):
-        epdconfig.digital_write(self.reset_pin, 0)
-        epdconfig.delay_ms(1)
-        epdconfig.digital_write(self.reset_pin, 1)  
-        
-        self.SetLut(self.lut_partial_update)
-        self.send_command(0x37)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x40)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)  
-        self.send_data(0x00)
-
-        self.send_command(0x3C) #BorderWavefrom
-        self.send_data(0x80)
-
-        self.send_command(0x22) 
-        self.send_data(0xC0)
-        self.send_command(0x20)
-        self.ReadBusy()
+    def displayPartial(self, image, wait=True):
+        self.PartialMode()
 
         self.SetWindow(0, 0, self.width - 1, self.height - 1)
         self.SetCursor(0, 0)
@@ -342,45 +356,95 @@ class EPD:
         #     for i in range(0, linewidth):
         #         self.send_data(image[i + j * linewidth])   
         self.send_data2(image)  
-        self.TurnOnDisplayPart()
+        self.TurnOnDisplayPart(wait)
+
+    '''
+    function : Sends one window of the image buffer to RAM and partial
+               refreshes, only the bytes inside the window go over SPI
+    parameter:
+        image : Image data, the whole frame
+        x_start, y_start, x_end, y_end : window, inclusive; x_start is a
+               multiple of 8 and x_end one less than a multiple of 8
+        wait : False to return once the refresh is triggered
+    '''
+    def displayPartialWindow(self, image, x_start, y_start, x_end, y_end, wait=True):
+        self.PartialMode()
+
+        if self.width%8 == 0:
+            linewidth = int(self.width/8)
+        else:
+            linewidth = int(self.width/8) + 1
+        first, last = x_start >> 3, (x_end >> 3) + 1
+        window = b''.join(image[y * linewidth + first:y * linewidth + last]
+                          for y in range(y_start, y_end + 1))
+
+        self.SetWindow(x_start, y_start, x_end, y_end)
+        self.SetCursor(x_start >> 3, y_start)
+        self.cmd(0x24, window)  # WRITE_RAM
+        # whole frame writes rely on the full window and a cursor at 0
+        self.SetWindow(0, 0, self.width - 1, self.height - 1)
+        self.SetCursor(0, 0)
+        self.TurnOnDisplayPart(wait)
+
+    '''
+    function : Load the partial waveform, it stays loaded between partial
+               refreshes and is only set up again after a full refresh
+               or a reset
+    parameter:
+    '''
+    def PartialMode(self):
+        if self.lut_loaded is not self.lut_partial_update:
+            epdconfig.digital_write(self.reset_pin, 0)
+            epdconfig.delay_ms(1)
+            epdconfig.digital_write(self.reset_pin, 1)  
+            self.lut_loaded = None
+
+            self.SetLut(self.lut_partial_update)
+            self.cmd(0x37, [0x00, 0x00, 0x00, 0x00, 0x00, 0x40, 0x00, 0x00, 0x00, 0x00])
+
+            self.cmd(0x3C, [0x80])  # BorderWavefrom
+
+        self.cmd(0x22, [0xC0])
+        self.send_command(0x20)
+        self.ReadBusy()
 
     '''
     function : Refresh a base image
     parameter:
         image : Image data
+        wait : False to return once the refresh is triggered
     '''
-    def displayPartBaseImage(self, image):
-        self.send_command(0x24)
-        self.send_data2(image)  
+    def displayPartBaseImage(self, image, wait=True):
+        self.cmd(0x24, image)
                 
-        self.send_command(0x26)
-        self.send_data2(image)  
-        self.TurnOnDisplay()
+        self.cmd(0x26, image)
+        self.TurnOnDisplay(wait)
     
     '''
     function : Clear screen
     parameter:
+        wait : False to return once the refresh is triggered
     '''
-    def Clear(self, color=0xFF):
+    def Clear(self, color=0xFF, wait=True):
         if self.width%8 == 0:
             linewidth = int(self.width/8)
         else:
             linewidth = int(self.width/8) + 1
         # logger.debug(linewidth)
         
-        self.send_command(0x24)
-        self.send_data2([color] * int(self.height * linewidth))  
-        self.TurnOnDisplay()
+        self.cmd(0x24, epdbuffer.fill(color, int(self.height * linewidth)))
+        self.TurnOnDisplay(wait)
 
     '''
     function : Enter sleep mode
     parameter:
     '''
     def sleep(self):
-        self.send_command(0x10) #enter deep sleep
-        self.send_data(0x01)
+        self.ReadBusy()  # a refresh still running finishes first
+        self.cmd(0x10, [0x01])  # enter deep sleep
+        self.asleep = epdseq.DEEP
         
-        epdconfig.delay_ms(2000)
+        epdconfig.delay_ms(epdseq.SLEEP_SETTLE_MS)
         epdconfig.module_exit()
 
 ### END OF FILE ###
@@ -29,6 +29,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 122
@@ -60,6 +61,21 @@ class EPD:
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    '''
+    function :send a command and its parameters in one transaction
+    parameter:
+     command : Command register
+     data : parameter bytes, CS stays low and they go in one transfer
+    '''
+    def cmd(self, command, data=b''):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
     
     # send 1 byte data
     def send_data(self, data):
@@ -78,34 +94,32 @@ class EPD:
     # judge e-Paper whether is busy
     def busy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) != 0): 
-            epdconfig.delay_ms(10)
+        epdconfig.wait_busy(self.busy_pin, 0)      # 0: idle, 1: busy
         logger.debug("e-Paper busy release")
 
     # set the display window
     def set_windows(self, xstart, ystart, xend, yend):
-        self.send_command(0x44) # SET_RAM_X_ADDRESS_START_END_POSITION
-        self.send_data((xstart>>3) & 0xff)
-        self.send_data((xend>>3) & 0xff)
+        self.cmd(0x44, [  # SET_RAM_X_ADDRESS_START_END_POSITION
+            (xstart>>3) & 0xff,
+            (xend>>3) & 0xff,
+        ])
         
-        self.send_command(0x45) # SET_RAM_Y_ADDRESS_START_END_POSITION
-        self.send_data(ystart & 0xff)
-        self.send_data((ystart >> 8) & 0xff)
-        self.send_data(yend & 0xff)
-        self.send_data((yend >> 8) & 0xff)
+        self.cmd(0x45, [  # SET_RAM_Y_ADDRESS_START_END_POSITION
+            ystart & 0xff,
+            (ystart >> 8) & 0xff,
+            yend & 0xff,
+            (yend >> 8) & 0xff,
+        ])
         
     # set the display cursor(origin)
     def set_cursor(self, xstart, ystart):
-        self.send_command(0x4E) # SET_RAM_X_ADDRESS_COUNTER
-        self.send_data(xstart & 0xff)
+        self.cmd(0x4E, [xstart & 0xff])  # SET_RAM_X_ADDRESS_COUNTER
 
-        self.send_command(0x4F) # SET_RAM_Y_ADDRESS_COUNTER
-        self.send_data(ystart & 0xff)
-        self.send_data((ystart >> 8) & 0xff)
+        self.cmd(0x4F, [ystart & 0xff, (ystart >> 8) & 0xff])  # SET_RAM_Y_ADDRESS_COUNTER
 
     # initialize 
     def init(self):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
             
         self.reset()
@@ -114,26 +128,18 @@ class EPD:
         self.send_command(0x12)  # SWRESET
         self.busy()   
 
-        self.send_command(0x01) # Driver output control      
-        self.send_data(0xf9)
-        self.send_data(0x00)
-        self.send_data(0x00)
+        self.cmd(0x01, [0xf9, 0x00, 0x00])  # Driver output control
 
-        self.send_command(0x11) # data entry mode       
-        self.send_data(0x03)
+        self.cmd(0x11, [0x03])  # data entry mode
 
         self.set_windows(0, 0, self.width - 1, self.height - 1)
         self.set_cursor(0, 0)
 
-        self.send_command(0x3C) # BorderWavefrom
-        self.send_data(0x05)	
+        self.cmd(0x3C, [0x05])  # BorderWavefrom
 
-        self.send_command(0x18) # Read built-in temperature sensor
-        self.send_data(0x80)	
+        self.cmd(0x18, [0x80])  # Read built-in temperature sensor
 
-        self.send_command(0x21) # Display update control
-        self.send_data(0x80)	
-        self.send_data(0x80)
+        self.cmd(0x21, [0x80, 0x80])  # Display update control
 
         self.busy()
         
@@ -145,29 +151,19 @@ class EPD:
         self.busy()
 
     # image converted to bytearray
-    def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        if(imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif(imwidth == self.height and imheight == self.width):
-            # image has correct dimensions, but needs to be rotated
-            img = img.rotate(90, expand=True).convert('1')
-        else:
+    def getbuffer(self, image, orientation=None):
+        buf = epdbuffer.pack(image, self.width, self.height, orientation)
+        if buf is None:
             logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
             # return a blank buffer
-            return [0x00] * (int(self.width/8) * self.height)
-
-        buf = bytearray(img.tobytes('raw'))
+            return epdbuffer.fill(0x00, int(self.width/8) * self.height)
         return buf
 
     # display image
     def display(self, imageblack, imagered):
-        self.send_command(0x24)
-        self.send_data2(imageblack)
+        self.cmd(0x24, imageblack)
         
-        self.send_command(0x26)
-        self.send_data2(imagered)
+        self.cmd(0x26, imagered)
         
         self.ondisplay()
         
@@ -178,13 +174,11 @@ class EPD:
         else:
             linewidth = int(self.width/8) + 1
             
-        buf = [0xff] * (int(linewidth * self.height))
+        buf = epdbuffer.fill(0xff, int(linewidth * self.height))
             
-        self.send_command(0x24)
-        self.send_data2(buf)
+        self.cmd(0x24, buf)
         
-        self.send_command(0x26)
-        self.send_data2(buf)
+        self.cmd(0x26, buf)
         
         self.ondisplay()
 
@@ -194,8 +188,7 @@ class EPD:
 
     # sleep
     def sleep(self):
-        self.send_command(0x10) # DEEP_SLEEP
-        self.send_data(0x01) # check code
+        self.cmd(0x10, [0x01])  # DEEP_SLEEP; check code
         
         epdconfig.delay_ms(2000)
         epdconfig.module_exit()
@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 import PIL
 from PIL import Image
@@ -75,6 +76,21 @@ class EPD:
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
 
+    '''
+    function :send a command and its parameters in one transaction
+    parameter:
+     command : Command register
+     data : parameter bytes, CS stays low and they go in one transfer
+    '''
+    def cmd(self, command, data=b''):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
@@ -84,99 +100,72 @@ class EPD:
     def ReadBusy(self):
         logger.debug("e-Paper busy H")
         epdconfig.delay_ms(100)
-        while(epdconfig.digital_read(self.busy_pin) == 0):      # 0: idle, 1: busy
-            epdconfig.delay_ms(5)
+        epdconfig.wait_busy(self.busy_pin, 1)      # 0: busy, 1: idle
         logger.debug("e-Paper busy release")
         
     def SetWindow(self):
-        self.send_command(0x61) # SET_RAM_X_ADDRESS_START_END_POSITION
-        # x point must be the multiple of 8 or the last 3 bits will be ignored
-        self.send_data(self.Source_BITS/256)
-        self.send_data(self.Source_BITS%256)
-        self.send_data(self.Gate_BITS/256)
-        self.send_data(self.Gate_BITS%256)
+        self.cmd(0x61, [  # SET_RAM_X_ADDRESS_START_END_POSITION
+            # x point must be the multiple of 8 or the last 3 bits will be ignored
+            self.Source_BITS // 256 & 0xFF,
+            self.Source_BITS % 256,
+            self.Gate_BITS // 256 & 0xFF,
+            self.Gate_BITS % 256,
+        ])
 
     def TurnOnDisplay(self):
-        self.send_command(0x12) # DISPLAY_REFRESH
-        self.send_data(0X00)
+        self.cmd(0x12, [0X00])  # DISPLAY_REFRESH
         self.ReadBusy()
         
     def init(self):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
         # EPD hardware init start
 
         self.reset()
         
         self.ReadBusy()
-        self.send_command(0x4D)
-        self.send_data(0x78)
-
-        self.send_command(0x00)
-        self.send_data(0x0F)
-        self.send_data(0x29)
-
-        self.send_command(0x01)
-        self.send_data(0x07)
-        self.send_data(0x00)
-
-        self.send_command(0x03)
-        self.send_data(0x10)
-        self.send_data(0x54)
-        self.send_data(0x44)
-
-        self.send_command(0x06)
-        self.send_data(0x05)
-        self.send_data(0x00)
-        self.send_data(0x3F)
-        self.send_data(0x0A)
-        self.send_data(0x25)
-        self.send_data(0x12)
-        self.send_data(0x1A)
-
-        self.send_command(0x50)
-        self.send_data(0x37)
-
-        self.send_command(0x60)
-        self.send_data(0x02)
-        self.send_data(0x02)
+        self.cmd(0x4D, [0x78])
+
+        self.cmd(0x00, [0x0F, 0x29])
+
+        self.cmd(0x01, [0x07, 0x00])
+
+        self.cmd(0x03, [0x10, 0x54, 0x44])
+
+        self.cmd(0x06, [0x05, 0x00, 0x3F, 0x0A, 0x25, 0x12, 0x1A])
+
+        self.cmd(0x50, [0x37])
+
+        self.cmd(0x60, [0x02, 0x02])
         
         self.SetWindow()
         
-        self.send_command(0xE7)
-        self.send_data(0x1C)
+        self.cmd(0xE7, [0x1C])
 
-        self.send_command(0xE3)
-        self.send_data(0x22)
+        self.cmd(0xE3, [0x22])
 
-        self.send_command(0xB4)
-        self.send_data(0xD0)
-        self.send_command(0xB5)
-        self.send_data(0x03)
+        self.cmd(0xB4, [0xD0])
+        self.cmd(0xB5, [0x03])
 
-        self.send_command(0xE9)
-        self.send_data(0x01)
+        self.cmd(0xE9, [0x01])
         
-        self.send_command(0x30)
-        self.send_data(0x08)
+        self.cmd(0x30, [0x08])
         
         self.send_command(0x04)
         self.ReadBusy()
         return 0
 
-    def getbuffer(self, image):
+    def getbuffer(self, image, orientation=None):
         # Create a pallette with the 4 colors supported by the panel
         pal_image = Image.new("P", (1,1))
         pal_image.putpalette( (0,0,0,  255,255,255,  255,255,0,   255,0,0) + (0,0,0)*252)
 
-        # Check if we need to rotate the image
-        imwidth, imheight = image.size
-        if(imwidth == self.width and imheight == self.height):
-            image_temp = image
-        elif(imwidth == self.height and imheight == self.width):
-            image_temp = image.rotate(90, expand=True)
-        else:
+        # Turn the image onto the panel layout if needed
+        image_temp = epdbuffer.orient(image, self.width, self.height, orientation)
+        if image_temp is None:
+            imwidth, imheight = image.size
             logger.warning("Invalid image dimensions: %d x %d, expected %d x %d" % (imwidth, imheight, self.width, self.height))
+            raise ValueError("Invalid image dimensions")
 
         # Convert the soruce image to the 4 colors, dithering if needed
         image_4color = image_temp.convert("RGB").quantize(palette=pal_image)
@@ -188,7 +177,7 @@ class EPD:
         else :
             Width = self.width // 4 + 1
         Height = self.height 
-        buf = [0x00] * int(Width * Height)
+        buf = bytearray(int(Width * Height))
         idx = 0
         for j in range(0, Height):
             for i in range(0, Width):
@@ -233,8 +222,7 @@ class EPD:
         self.ReadBusy()
         epdconfig.delay_ms(100)
         
-        self.send_command(0x07) # DEEP_SLEEP
-        self.send_data(0XA5)
+        self.cmd(0x07, [0XA5])  # DEEP_SLEEP
         
         epdconfig.delay_ms(2000)
         epdconfig.module_exit()
@@ -29,6 +29,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 176
@@ -54,7 +55,7 @@ class EPD:
         self.GRAY3  = GRAY3 #gray
         self.GRAY4  = GRAY4 #Blackest
 
-    LUT_DATA_4Gray = [
+    LUT_DATA_4Gray = bytes([
         0x40,0x48,0x80,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
         0x8,0x48,0x10,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
         0x2,0x48,0x4,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
@@ -74,7 +75,7 @@ class EPD:
         0x0,0x0,0x0,0x0,0x0,0x0,0x0,					
         0x22,0x22,0x22,0x22,0x22,0x22,0x0,0x0,0x0,			
         0x22,0x17,0x41,0x0,0x32,0x1C,
-        ]
+        ])
     
     # Hardware reset
     def reset(self):
@@ -91,49 +92,64 @@ class EPD:
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
 
+    '''
+    function :send a command and its parameters in one transaction
+    parameter:
+     command : Command register
+     data : parameter bytes, CS stays low and they go in one transfer
+    '''
+    def cmd(self, command, data=b''):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a lot of data
+    def send_data2(self, data):
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):        
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      #  1: idle, 0: busy
-            epdconfig.delay_ms(20)                
+        epdconfig.wait_busy(self.busy_pin, 0)      # 0: idle, 1: busy
         logger.debug("e-Paper busy release")
     
     def TurnOnDisplay(self):
-        self.send_command(0x22) #Display Update Control
-        self.send_data(0xF7)
+        self.cmd(0x22, [0xF7])  # Display Update Control
         self.send_command(0x20) #Activate Display Update Sequence
         self.ReadBusy()
         
     def TurnOnDisplay_Fast(self):
-        self.send_command(0x22) #Display Update Control
-        self.send_data(0xC7)
+        self.cmd(0x22, [0xC7])  # Display Update Control
         self.send_command(0x20) #Activate Display Update Sequence
         self.ReadBusy()
         
     def TurnOnDisplay_Partial(self):
-        self.send_command(0x22) #Display Update Control
-        self.send_data(0xFF)
+        self.cmd(0x22, [0xFF])  # Display Update Control
         self.send_command(0x20) #Activate Display Update Sequence
         self.ReadBusy()
         
     def TurnOnDisplay_4GRAY(self):
-        self.send_command(0x22) #Display Update Control
-        self.send_data(0xC7)
+        self.cmd(0x22, [0xC7])  # Display Update Control
         self.send_command(0x20) #Activate Display Update Sequence
         self.ReadBusy()
         
     def Lut(self):
-        self.send_command(0x32)
-        for i in range(159):
-            self.send_data(self.LUT_DATA_4Gray[i])
+        self.cmd(0x32, self.LUT_DATA_4Gray[:159])
     
     def init(self):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
             
         # EPD hardware init start
@@ -143,22 +159,19 @@ class EPD:
         self.send_command(0x12) #SWRESET
         self.ReadBusy()
 
-        self.send_command(0x45) #set Ram-Y address start/end position          
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x07) #0x0107-->(263+1)=264
-        self.send_data(0x01)
+        self.cmd(0x45, [  # set Ram-Y address start/end position
+            0x00, 0x00,
+            0x07,  #0x0107-->(263+1)=264
+            0x01,
+        ])
 
-        self.send_command(0x4F)   # set RAM y address count to 0;    
-        self.send_data(0x00)
-        self.send_data(0x00)
+        self.cmd(0x4F, [0x00, 0x00])  # set RAM y address count to 0;
 
-        self.send_command(0x11)  # data entry mode
-        self.send_data(0x03)
+        self.cmd(0x11, [0x03])  # data entry mode
         return 0
         
     def init_Fast(self):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
             
         # EPD hardware init start
@@ -171,126 +184,90 @@ class EPD:
         self.send_command(0x12) #SWRESET
         self.ReadBusy()
 
-        self.send_command(0x18) #Read built-in temperature sensor
-        self.send_data(0x80)	
+        self.cmd(0x18, [0x80])  # Read built-in temperature sensor
 
-        self.send_command(0x22) # Load temperature value
-        self.send_data(0xB1)	
+        self.cmd(0x22, [0xB1])  # Load temperature value
         self.send_command(0x20)	
         self.ReadBusy()
 
-        self.send_command(0x1A) # Write to temperature register
-        self.send_data(0x64)	
-        self.send_data(0x00)	
+        self.cmd(0x1A, [0x64, 0x00])  # Write to temperature register
 
-        self.send_command(0x45) #set Ram-Y address start/end position          
-        self.send_data(0x00)   
-        self.send_data(0x00)
-        self.send_data(0x07) #0x0107-->(263+1)=264
-        self.send_data(0x01)
+        self.cmd(0x45, [  # set Ram-Y address start/end position
+            0x00, 0x00,
+            0x07,  #0x0107-->(263+1)=264
+            0x01,
+        ])
 
-        self.send_command(0x4F)   # set RAM y address count to 0;    
-        self.send_data(0x00)
-        self.send_data(0x00)
+        self.cmd(0x4F, [0x00, 0x00])  # set RAM y address count to 0;
 
-        self.send_command(0x11)   # data entry mode      
-        self.send_data(0x03)
+        self.cmd(0x11, [0x03])  # data entry mode
 
-        self.send_command(0x22) # Load temperature value
-        self.send_data(0x91)	
+        self.cmd(0x22, [0x91])  # Load temperature value
         self.send_command(0x20)	
         self.ReadBusy()
         return 0
 
     def Init_4Gray(self):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
         self.reset()
         
         self.send_command(0x12) # soft reset
         self.ReadBusy();
 
-        self.send_command(0x74) #set analog block control       
-        self.send_data(0x54)
-        self.send_command(0x7E) #set digital block control          
-        self.send_data(0x3B)
+        self.cmd(0x74, [0x54])  # set analog block control
+        self.cmd(0x7E, [0x3B])  # set digital block control
         
-        self.send_command(0x01) #Driver output control      
-        self.send_data(0x07)
-        self.send_data(0x01)
-        self.send_data(0x00) 
+        self.cmd(0x01, [0x07, 0x01, 0x00])  # Driver output control
         
-        self.send_command(0x11) #data entry mode       
-        self.send_data(0x03)
+        self.cmd(0x11, [0x03])  # data entry mode
 
-        self.send_command(0x44) #set Ram-X address start/end position   
-        self.send_data(0x00)
-        self.send_data(0x15)   #0x15-->(21+1)*8=176
+        self.cmd(0x44, [  # set Ram-X address start/end position
+            0x00,
+            0x15,  #0x15-->(21+1)*8=176
+        ])
 
-        self.send_command(0x45) #set Ram-Y address start/end position          
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x07) #0x0107-->(263+1)=264
-        self.send_data(0x01)
+        self.cmd(0x45, [  # set Ram-Y address start/end position
+            0x00, 0x00,
+            0x07,  #0x0107-->(263+1)=264
+            0x01,
+        ])
 
 
-        self.send_command(0x3C) #BorderWavefrom
-        self.send_data(0x00)	
+        self.cmd(0x3C, [0x00])  # BorderWavefrom
 
 
-        self.send_command(0x2C)     #VCOM Voltage
-        self.send_data(self.LUT_DATA_4Gray[158])    #0x1C
+        self.cmd(0x2C, [self.LUT_DATA_4Gray[158]])  # VCOM Voltage; 0x1C
 
 
-        self.send_command(0x3F) #EOPQ    
-        self.send_data(self.LUT_DATA_4Gray[153])
+        self.cmd(0x3F, [self.LUT_DATA_4Gray[153]])  # EOPQ
 
-        self.send_command(0x03) #VGH      
-        self.send_data(self.LUT_DATA_4Gray[154])
+        self.cmd(0x03, [self.LUT_DATA_4Gray[154]])  # VGH
 
-        self.send_command(0x04) #      
-        self.send_data(self.LUT_DATA_4Gray[155]) #VSH1   
-        self.send_data(self.LUT_DATA_4Gray[156]) #VSH2   
-        self.send_data(self.LUT_DATA_4Gray[157]) #VSL   
+        self.cmd(0x04, [
+            self.LUT_DATA_4Gray[155],  #VSH1
+            self.LUT_DATA_4Gray[156],  #VSH2
+            self.LUT_DATA_4Gray[157],  #VSL
+        ])
 
         self.Lut() #LUT
 
 
-        self.send_command(0x4E)   # set RAM x address count to 0;
-        self.send_data(0x00)
-        self.send_command(0x4F)  # set RAM y address count to 0X199;    
-        self.send_data(0x00)
-        self.send_data(0x00)
+        self.cmd(0x4E, [0x00])  # set RAM x address count to 0;
+        self.cmd(0x4F, [0x00, 0x00])  # set RAM y address count to 0X199;
         self.ReadBusy()
         return 0
 
-    def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
+    def getbuffer(self, image, orientation=None):
+        buf = epdbuffer.pack(image, self.width, self.height, orientation)
+        if buf is None:
+            # wrong size, send a blank frame
+            return epdbuffer.fill(0xFF, int(self.width/8) * self.height)
         return buf
     
     def getbuffer_4Gray(self, image):
         # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 4) * self.height)
+        buf = bytearray(epdbuffer.fill(0xFF, int(self.width / 4) * self.height))
         image_monocolor = image.convert('L')
         imwidth, imheight = image_monocolor.size
         pixels = image_monocolor.load()
@@ -417,23 +394,21 @@ class EPD:
         # Reset
         self.reset()
 
-        self.send_command(0x3C) #BorderWavefrom
-        self.send_data(0x80)
+        self.cmd(0x3C, [0x80])  # BorderWavefrom
 	
-        self.send_command(0x44)       # set RAM x address start/end, in page 35
-        self.send_data(Xstart & 0xff)    # RAM x address start at 00h;
-        self.send_data(Xend & 0xff)    # RAM x address end at 0fh(15+1)*8->128 
-        self.send_command(0x45)       # set RAM y address start/end, in page 35
-        self.send_data(Ystart & 0xff)    # RAM y address start at 0127h;
-        self.send_data((Ystart>>8) & 0x01)    # RAM y address start at 0127h;
-        self.send_data(Yend & 0xff)    # RAM y address end at 00h;
-        self.send_data((Yend>>8) & 0x01)   
-
-        self.send_command(0x4E)   # set RAM x address count to 0;
-        self.send_data(Xstart & 0xff)
-        self.send_command(0x4F)   # set RAM y address count to 0X127;    
-        self.send_data(Ystart & 0xff)
-        self.send_data((Ystart>>8) & 0x01)
+        self.cmd(0x44, [  # set RAM x address start/end, in page 35
+            Xstart & 0xff,  # RAM x address start at 00h;
+            Xend & 0xff,  # RAM x address end at 0fh(15+1)*8->128
+        ])
+        self.cmd(0x45, [  # set RAM y address start/end, in page 35
+            Ystart & 0xff,  # RAM y address start at 0127h;
+            (Ystart>>8) & 0x01,  # RAM y address start at 0127h;
+            Yend & 0xff,  # RAM y address end at 00h;
+            (Yend>>8) & 0x01,
+        ])
+
+        self.cmd(0x4E, [Xstart & 0xff])  # set RAM x address count to 0;
+        self.cmd(0x4F, [Ystart & 0xff, (Ystart>>8) & 0x01])  # set RAM y address count to 0X127;
 
         self.send_command(0x24)   #Write Black and White image to RAM
         for j in range(Height):
@@ -510,8 +485,7 @@ class EPD:
         self.TurnOnDisplay_4GRAY()
 
     def sleep(self):
-        self.send_command(0X10)
-        self.send_data(0x01)
+        self.cmd(0X10, [0x01])
         
         epdconfig.delay_ms(2000)
         epdconfig.module_exit()
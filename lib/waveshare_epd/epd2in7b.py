@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 176
@@ -46,7 +47,7 @@ class EPD:
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
 
-    lut_vcom_dc = [
+    lut_vcom_dc = bytes([
         0x00, 0x00,
         0x00, 0x1A, 0x1A, 0x00, 0x00, 0x01,
         0x00, 0x0A, 0x0A, 0x00, 0x00, 0x08,
@@ -55,9 +56,9 @@ class EPD:
         0x00, 0x04, 0x10, 0x00, 0x00, 0x05,
         0x00, 0x03, 0x0E, 0x00, 0x00, 0x0A,
         0x00, 0x23, 0x00, 0x00, 0x00, 0x01
-    ]
+    ])
 
-    lut_ww = [
+    lut_ww = bytes([
         0x90, 0x1A, 0x1A, 0x00, 0x00, 0x01,
         0x40, 0x0A, 0x0A, 0x00, 0x00, 0x08,
         0x84, 0x0E, 0x01, 0x0E, 0x01, 0x10,
@@ -65,10 +66,10 @@ class EPD:
         0x00, 0x04, 0x10, 0x00, 0x00, 0x05,
         0x00, 0x03, 0x0E, 0x00, 0x00, 0x0A,
         0x00, 0x23, 0x00, 0x00, 0x00, 0x01
-    ]
+    ])
 
     # R22H    r
-    lut_bw = [
+    lut_bw = bytes([
         0xA0, 0x1A, 0x1A, 0x00, 0x00, 0x01,
         0x00, 0x0A, 0x0A, 0x00, 0x00, 0x08,
         0x84, 0x0E, 0x01, 0x0E, 0x01, 0x10,
@@ -76,10 +77,10 @@ class EPD:
         0xB0, 0x04, 0x10, 0x00, 0x00, 0x05,
         0xB0, 0x03, 0x0E, 0x00, 0x00, 0x0A,
         0xC0, 0x23, 0x00, 0x00, 0x00, 0x01
-    ]
+    ])
 
     # R23H    w
-    lut_bb = [
+    lut_bb = bytes([
         0x90, 0x1A, 0x1A, 0x00, 0x00, 0x01,
         0x40, 0x0A, 0x0A, 0x00, 0x00, 0x08,
         0x84, 0x0E, 0x01, 0x0E, 0x01, 0x10,
@@ -87,9 +88,9 @@ class EPD:
         0x00, 0x04, 0x10, 0x00, 0x00, 0x05,
         0x00, 0x03, 0x0E, 0x00, 0x00, 0x0A,
         0x00, 0x23, 0x00, 0x00, 0x00, 0x01
-    ]
+    ])
     # R24H    b
-    lut_wb = [
+    lut_wb = bytes([
         0x90, 0x1A, 0x1A, 0x00, 0x00, 0x01,
         0x20, 0x0A, 0x0A, 0x00, 0x00, 0x08,
         0x84, 0x0E, 0x01, 0x0E, 0x01, 0x10,
@@ -97,7 +98,7 @@ class EPD:
         0x00, 0x04, 0x10, 0x00, 0x00, 0x05,
         0x00, 0x03, 0x0E, 0x00, 0x00, 0x0A,
         0x00, 0x23, 0x00, 0x00, 0x00, 0x01
-    ]
+    ])
 
     # Hardware reset
     def reset(self):
@@ -114,37 +115,48 @@ class EPD:
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
 
+    '''
+    function :send a command and its parameters in one transaction
+    parameter:
+     command : Command register
+     data : parameter bytes, CS stays low and they go in one transfer
+    '''
+    def cmd(self, command, data=b''):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
         epdconfig.spi_writebyte([data])
         epdconfig.digital_write(self.cs_pin, 1)
+
+    # send a lot of data
+    def send_data2(self, data):
+        epdconfig.digital_write(self.dc_pin, 1)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 0):      # 0: idle, 1: busy
-            epdconfig.delay_ms(100)
+        epdconfig.wait_busy(self.busy_pin, 1)      # 0: busy, 1: idle
         logger.debug("e-Paper busy release")
         
     def set_lut(self):
-        self.send_command(0x20)               # vcom
-        for count in range(0, 44):
-            self.send_data(self.lut_vcom_dc[count])
-        self.send_command(0x21)         # ww --
-        for count in range(0, 42):
-            self.send_data(self.lut_ww[count])
-        self.send_command(0x22)         # bw r
-        for count in range(0, 42):
-            self.send_data(self.lut_bw[count])
-        self.send_command(0x23)         # wb w
-        for count in range(0, 42):
-            self.send_data(self.lut_bb[count])
-        self.send_command(0x24)         # bb b
-        for count in range(0, 42):
-            self.send_data(self.lut_wb[count])
+        self.cmd(0x20, self.lut_vcom_dc[:44])  # vcom
+        self.cmd(0x21, self.lut_ww[:42])  # ww --
+        self.cmd(0x22, self.lut_bw[:42])  # bw r
+        self.cmd(0x23, self.lut_bb[:42])  # wb w
+        self.cmd(0x24, self.lut_wb[:42])  # bb b
             
     def init(self):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
             
         self.reset()
@@ -152,94 +164,58 @@ class EPD:
         self.send_command(0x04) # POWER_ON
         self.ReadBusy()
 
-        self.send_command(0x00) # PANEL_SETTING
-        self.send_data(0xaf) #KW-BF   KWR-AF    BWROTP 0f
+        self.cmd(0x00, [0xaf])  # PANEL_SETTING; KW-BF   KWR-AF    BWROTP 0f
         
-        self.send_command(0x30) # PLL_CONTROL
-        self.send_data(0x3a) #3A 100HZ   29 150Hz 39 200HZ    31 171HZ
+        self.cmd(0x30, [0x3a])  # PLL_CONTROL; 3A 100HZ   29 150Hz 39 200HZ    31 171HZ
 
-        self.send_command(0x01) # POWER_SETTING
-        self.send_data(0x03) # VDS_EN, VDG_EN
-        self.send_data(0x00) # VCOM_HV, VGHL_LV[1], VGHL_LV[0]
-        self.send_data(0x2b) # VDH
-        self.send_data(0x2b) # VDL
-        self.send_data(0x09) # VDHR
+        self.cmd(0x01, [  # POWER_SETTING
+            0x03,  # VDS_EN, VDG_EN
+            0x00,  # VCOM_HV, VGHL_LV[1], VGHL_LV[0]
+            0x2b,  # VDH
+            0x2b,  # VDL
+            0x09,  # VDHR
+        ])
 
-        self.send_command(0x06) # BOOSTER_SOFT_START
-        self.send_data(0x07)
-        self.send_data(0x07)
-        self.send_data(0x17)
+        self.cmd(0x06, [0x07, 0x07, 0x17])  # BOOSTER_SOFT_START
 
         # Power optimization
-        self.send_command(0xF8)
-        self.send_data(0x60)
-        self.send_data(0xA5)
+        self.cmd(0xF8, [0x60, 0xA5])
 
         # Power optimization
-        self.send_command(0xF8)
-        self.send_data(0x89)
-        self.send_data(0xA5)
+        self.cmd(0xF8, [0x89, 0xA5])
 
         # Power optimization
-        self.send_command(0xF8)
-        self.send_data(0x90)
-        self.send_data(0x00)
+        self.cmd(0xF8, [0x90, 0x00])
         
         # Power optimization
-        self.send_command(0xF8)
-        self.send_data(0x93)
-        self.send_data(0x2A)
+        self.cmd(0xF8, [0x93, 0x2A])
 
         # Power optimization
-        self.send_command(0xF8)
-        self.send_data(0x73)
-        self.send_data(0x41)
+        self.cmd(0xF8, [0x73, 0x41])
 
-        self.send_command(0x82) # VCM_DC_SETTING_REGISTER
-        self.send_data(0x12)                   
-        self.send_command(0x50) # VCOM_AND_DATA_INTERVAL_SETTING
-        self.send_data(0x87) # define by OTP
+        self.cmd(0x82, [0x12])  # VCM_DC_SETTING_REGISTER
+        self.cmd(0x50, [0x87])  # VCOM_AND_DATA_INTERVAL_SETTING; define by OTP
 
         self.set_lut()
 
-        self.send_command(0x16) # PARTIAL_DISPLAY_REFRESH
-        self.send_data(0x00)
+        self.cmd(0x16, [0x00])  # PARTIAL_DISPLAY_REFRESH
         
         return 0
 
-    def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
+    def getbuffer(self, image, orientation=None):
+        buf = epdbuffer.pack(image, self.width, self.height, orientation)
+        if buf is None:
+            # wrong size, send a blank frame
+            return epdbuffer.fill(0xFF, int(self.width/8) * self.height)
         return buf
 
     def display(self, imageblack, imagered):
-        self.send_command(0x10)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(~imageblack[i])
+        length = int(self.width * self.height / 8)
+        # both planes go out inverted, masked to bytes in one transfer each
+        self.cmd(0x10, epdbuffer.invert(imageblack[:length]))
         self.send_command(0x11)
         
-        self.send_command(0x13)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(~imagered[i])
+        self.cmd(0x13, epdbuffer.invert(imagered[:length]))
         self.send_command(0x11)
         
         self.send_command(0x12) 
@@ -260,11 +236,9 @@ class EPD:
         self.ReadBusy()
 
     def sleep(self):
-        self.send_command(0X50)
-        self.send_data(0xf7)
+        self.cmd(0X50, [0xf7])
         self.send_command(0X02)
-        self.send_command(0X07)
-        self.send_data(0xA5)
+        self.cmd(0X07, [0xA5])
         
         epdconfig.delay_ms(2000)
         epdconfig.module_exit()
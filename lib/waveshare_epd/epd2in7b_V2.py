@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 176
@@ -62,6 +63,21 @@ class EPD:
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
 
+    '''
+    function :send a command and its parameters in one transaction
+    parameter:
+     command : Command register
+     data : parameter bytes, CS stays low and they go in one transfer
+    '''
+    def cmd(self, command, data=b''):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
     # Send Data
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
@@ -79,33 +95,23 @@ class EPD:
     # Read Busy
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      # 0: idle, 1: busy
-            epdconfig.delay_ms(10)
+        epdconfig.wait_busy(self.busy_pin, 0)      # 0: idle, 1: busy
         logger.debug("e-Paper busy release")
             
     # Setting the display window
     def SetWindows(self, Xstart, Ystart, Xend, Yend):
-        self.send_command(0x44)
-        self.send_data((Xstart >> 3) & 0xff)
-        self.send_data((Xend >> 3) & 0xff)
+        self.cmd(0x44, [(Xstart >> 3) & 0xff, (Xend >> 3) & 0xff])
         
-        self.send_command(0x45)
-        self.send_data(Ystart & 0xff)
-        self.send_data((Ystart >> 8) & 0xff)
-        self.send_data(Yend & 0xff)
-        self.send_data((Yend >> 8) & 0xff)
+        self.cmd(0x45, [Ystart & 0xff, (Ystart >> 8) & 0xff, Yend & 0xff, (Yend >> 8) & 0xff])
     
     # Set Cursor
     def SetCursor(self, Xstart, Ystart):
-        self.send_command(0x4E)
-        self.send_data(Xstart & 0xff)
-        self.send_command(0x4F)
-        self.send_data(Ystart & 0xff)
-        self.send_data((Ystart >> 8) & 0xff)
+        self.cmd(0x4E, [Xstart & 0xff])
+        self.cmd(0x4F, [Ystart & 0xff, (Ystart >> 8) & 0xff])
         
     # Initialize the e-Paper register
     def init(self):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
             
         self.reset()
@@ -114,40 +120,19 @@ class EPD:
         self.send_command(0x12)      
         self.ReadBusy() 
         
-        self.send_command(0x00)     
-        self.send_data(0x27) 
-        self.send_data(0x01) 
-        self.send_data(0x00) 
+        self.cmd(0x00, [0x27, 0x01, 0x00])
         
-        self.send_command(0x11)     
-        self.send_data(0x03) 
+        self.cmd(0x11, [0x03])
         
         self.SetWindows(0, 0, self.width-1, self.height-1)
         self.SetCursor(0, 0)
         return 0
 
-    def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
+    def getbuffer(self, image, orientation=None):
+        buf = epdbuffer.pack(image, self.width, self.height, orientation)
+        if buf is None:
+            # wrong size, send a blank frame
+            return epdbuffer.fill(0xFF, int(self.width/8) * self.height)
         return buf
     
     # Sends the image buffer in RAM to e-Paper and displays
@@ -155,25 +140,19 @@ class EPD:
         Width = self.width / 8 
         Height = self.height 
 
-        buf = [0x00] * int(Width * Height)
-        for i in range(0, int(Width * Height)):
-            buf[i] = ~imagered[i]
+        buf = epdbuffer.invert(imagered[:int(Width * Height)])
 
-        self.send_command(0x24) 
-        self.send_data2(imageblack) 
+        self.cmd(0x24, imageblack)
 
-        self.send_command(0x26) 
-        self.send_data2(buf) 
+        self.cmd(0x26, buf)
         
         self.TurnOnDisplay()
 
     # Clear the screen
     def Clear(self):
-        self.send_command(0x24)
-        self.send_data2([0xff] * int(self.width * self.height / 8))
+        self.cmd(0x24, epdbuffer.fill(0xff, int(self.width * self.height / 8)))
 
-        self.send_command(0x26)
-        self.send_data2([0x00] * int(self.width * self.height / 8))
+        self.cmd(0x26, epdbuffer.fill(0x00, int(self.width * self.height / 8)))
             
         self.TurnOnDisplay()
         
@@ -184,8 +163,7 @@ class EPD:
 
     # Enter sleep mode
     def sleep(self):
-        self.send_command(0x10)
-        self.send_data(0x01)
+        self.cmd(0x10, [0x01])
         
         epdconfig.delay_ms(2000)
         epdconfig.module_exit()
@@ -29,6 +29,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdseq
 
 # Display resolution
 EPD_WIDTH       = 128
@@ -44,8 +46,11 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.lut_loaded = None    # LUT currently held in the controller
+        self.sequence = None      # (sequence, level) epdseq ran last
+        self.asleep = None        # epdseq level of the last sleep
         
-    WF_PARTIAL_2IN9 = [
+    WF_PARTIAL_2IN9 = bytes([
     0x0,0x40,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
     0x80,0x80,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
     0x40,0x40,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,0x0,
@@ -65,9 +70,9 @@ class EPD:
     0x0,0x0,0x0,0x0,0x0,0x0,0x0,
     0x22,0x22,0x22,0x22,0x22,0x22,0x0,0x0,0x0,
     0x22,0x17,0x41,0xB0,0x32,0x36,
-    ]
+    ])
 
-    WS_20_30 = [									
+    WS_20_30 = bytes([									
     0x80,	0x66,	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	0x40,	0x0,	0x0,	0x0,
     0x10,	0x66,	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	0x20,	0x0,	0x0,	0x0,
     0x80,	0x66,	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	0x40,	0x0,	0x0,	0x0,
@@ -87,7 +92,25 @@ class EPD:
     0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	0x0,					
     0x44,	0x44,	0x44,	0x44,	0x44,	0x44,	0x0,	0x0,	0x0,			
     0x22,	0x17,	0x41,	0x0,	0x32,	0x36
-    ]
+    ])
+
+    # init(), as data for epdseq; frame RAM survives all of it. Every step
+    # is DEEP: standby() keeps them all, leaving deep sleep takes the
+    # hardware reset and everything after it.
+    INIT = (
+        epdseq.reset(),
+        epdseq.busy(),
+        epdseq.command(0x12),   # SWRESET
+        epdseq.busy(),
+        epdseq.command(0x01, [0x27, 0x01, 0x00]),   # Driver output control
+        epdseq.command(0x11, [0x03]),   # data entry mode
+        epdseq.command(0x44, [0x00, (EPD_WIDTH - 1) >> 3]),   # RAM x window
+        epdseq.command(0x45, [0x00, 0x00, (EPD_HEIGHT - 1) & 0xFF, (EPD_HEIGHT - 1) >> 8]),   # RAM y window
+        epdseq.command(0x21, [0x00, 0x80]),   # Display update control
+        epdseq.command(0x4E, [0x00]),   # RAM x counter
+        epdseq.command(0x4F, [0x00, 0x00]),   # RAM y counter
+        epdseq.busy(),
+    )
 
     # Hardware reset
     def reset(self):
@@ -97,6 +120,7 @@ class EPD:
         epdconfig.delay_ms(2)
         epdconfig.digital_write(self.reset_pin, 1)
         epdconfig.delay_ms(50)   
+        self.lut_loaded = None
 
     def send_command(self, command):
         epdconfig.digital_write(self.dc_pin, 0)
@@ -104,6 +128,21 @@ class EPD:
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
 
+    '''
+    function :send a command and its parameters in one transaction
+    parameter:
+     command : Command register
+     data : parameter bytes, CS stays low and they go in one transfer
+    '''
+    def cmd(self, command, data=b''):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
@@ -119,187 +158,174 @@ class EPD:
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      #  0: idle, 1: busy
-            epdconfig.delay_ms(10) 
+        epdconfig.wait_busy(self.busy_pin, 0)      # 0: idle, 1: busy
         logger.debug("e-Paper busy release")  
 
-    def TurnOnDisplay(self):
-        self.send_command(0x22) # DISPLAY_UPDATE_CONTROL_2
-        self.send_data(0xc7)
+    # wait=False returns once the refresh is triggered, call ReadBusy()
+    # before sending anything else
+    def TurnOnDisplay(self, wait=True):
+        if self.lut_loaded is not self.WS_20_30:
+            # a partial refresh left its waveform, display options and
+            # border behind; restore the full ones, init() leaves the
+            # last two at their reset values
+            self.SetLut(self.WS_20_30)
+            self.cmd(0x37, [0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00])  # Display option, ping-pong off
+            self.cmd(0x3C, [0xC0])  # BorderWavefrom
+        self.cmd(0x22, [0xc7])  # DISPLAY_UPDATE_CONTROL_2
         self.send_command(0x20) # MASTER_ACTIVATION
-        self.ReadBusy()
+        if wait:
+            self.ReadBusy()
 
-    def TurnOnDisplay_Partial(self):
-        self.send_command(0x22) # DISPLAY_UPDATE_CONTROL_2
-        self.send_data(0x0F)
+    def TurnOnDisplay_Partial(self, wait=True):
+        self.cmd(0x22, [0x0F])  # DISPLAY_UPDATE_CONTROL_2
         self.send_command(0x20) # MASTER_ACTIVATION
-        self.ReadBusy()
+        if wait:
+            self.ReadBusy()
 
     def lut(self, lut):
-        self.send_command(0x32)
-        for i in range(0, 153):
-            self.send_data(lut[i])
+        self.cmd(0x32, lut[:153])
         self.ReadBusy()
 
+    # skipped if the lut is already loaded
     def SetLut(self, lut):
+        if self.lut_loaded is lut:
+            return
         self.lut(lut)
-        self.send_command(0x3f)
-        self.send_data(lut[153])
-        self.send_command(0x03);	# gate voltage
-        self.send_data(lut[154])
-        self.send_command(0x04);	# source voltage
-        self.send_data(lut[155])	# VSH
-        self.send_data(lut[156])	# VSH2
-        self.send_data(lut[157])	# VSL
-        self.send_command(0x2c);		# VCOM
-        self.send_data(lut[158])
+        self.cmd(0x3f, [lut[153]])
+        self.cmd(0x03, [lut[154]])  # gate voltage
+        self.cmd(0x04, [  # source voltage
+            lut[155],  # VSH
+            lut[156],  # VSH2
+            lut[157],  # VSL
+        ])
+        self.cmd(0x2c, [lut[158]])  # VCOM
+        self.lut_loaded = lut
 
     def SetWindow(self, x_start, y_start, x_end, y_end):
-        self.send_command(0x44) # SET_RAM_X_ADDRESS_START_END_POSITION
-        # x point must be the multiple of 8 or the last 3 bits will be ignored
-        self.send_data((x_start>>3) & 0xFF)
-        self.send_data((x_end>>3) & 0xFF)
-        self.send_command(0x45) # SET_RAM_Y_ADDRESS_START_END_POSITION
-        self.send_data(y_start & 0xFF)
-        self.send_data((y_start >> 8) & 0xFF)
-        self.send_data(y_end & 0xFF)
-        self.send_data((y_end >> 8) & 0xFF)
+        self.cmd(0x44, [  # SET_RAM_X_ADDRESS_START_END_POSITION
+            # x point must be the multiple of 8 or the last 3 bits will be ignored
+            (x_start>>3) & 0xFF,
+            (x_end>>3) & 0xFF,
+        ])
+        self.cmd(0x45, [  # SET_RAM_Y_ADDRESS_START_END_POSITION
+            y_start & 0xFF,
+            (y_start >> 8) & 0xFF,
+            y_end & 0xFF,
+            (y_end >> 8) & 0xFF,
+        ])
 
     def SetCursor(self, x, y):
-        self.send_command(0x4E) # SET_RAM_X_ADDRESS_COUNTER
-        # x point must be the multiple of 8 or the last 3 bits will be ignored
-        self.send_data(x & 0xFF)
+        self.cmd(0x4E, [  # SET_RAM_X_ADDRESS_COUNTER
+            # x point must be the multiple of 8 or the last 3 bits will be ignored
+            x & 0xFF,
+        ])
         
-        self.send_command(0x4F) # SET_RAM_Y_ADDRESS_COUNTER
-        self.send_data(y & 0xFF)
-        self.send_data((y >> 8) & 0xFF)
+        self.cmd(0x4F, [y & 0xFF, (y >> 8) & 0xFF])  # SET_RAM_Y_ADDRESS_COUNTER
         
     def init(self):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
-        # EPD hardware init start     
-        self.reset()
-
-        self.ReadBusy()
-        self.send_command(0x12)  #SWRESET
-        self.ReadBusy() 
-
-        self.send_command(0x01) #Driver output control      
-        self.send_data(0x27)
-        self.send_data(0x01)
-        self.send_data(0x00)
-    
-        self.send_command(0x11) #data entry mode       
-        self.send_data(0x03)
-
-        self.SetWindow(0, 0, self.width-1, self.height-1)
+        epdseq.run(self, self.INIT)
+        self.asleep = None
+        self.SetLut(self.WS_20_30)
+        return 0
 
-        self.send_command(0x21) #  Display update control
-        self.send_data(0x00)
-        self.send_data(0x80)
-    
-        self.SetCursor(0, 0)
+    '''
+    function : Turn the clock and analog supply off between refreshes.
+               Registers, the LUT and frame RAM are kept, so waking
+               from it sends nothing; an update sequence turns both back
+               on by itself.
+    parameter:
+    '''
+    def standby(self):
+        self.ReadBusy()  # a refresh still running finishes first
+        self.cmd(0x22, [0x03])  # DISPLAY_UPDATE_CONTROL_2: clock and analog off
+        self.send_command(0x20) # MASTER_ACTIVATION
         self.ReadBusy()
+        self.asleep = epdseq.LIGHT
 
-        self.SetLut(self.WS_20_30)
-        # EPD hardware init end
+    '''
+    function : Wake the panel after standby() or sleep(). Deep sleep
+               loses the registers and the LUT but keeps frame RAM, so
+               partial refreshes go on against the last base image.
+    parameter:
+    '''
+    def wake(self):
+        level = self.asleep or epdseq.LIGHT
+        if level == epdseq.DEEP and epdconfig.module_init(__name__) != 0:
+            return -1
+        epdseq.run(self, self.INIT, level)
+        self.asleep = None
+        if self.lut_loaded is None:
+            self.SetLut(self.WS_20_30)
         return 0
 
-    def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
+    def getbuffer(self, image, orientation=None):
+        buf = epdbuffer.pack(image, self.width, self.height, orientation)
+        if buf is None:
+            # wrong size, send a blank frame
+            return epdbuffer.fill(0xFF, int(self.width/8) * self.height)
         return buf
 
-    def display(self, image):
+    def display(self, image, wait=True):
         if (image == None):
             return            
-        self.send_command(0x24) # WRITE_RAM
-        self.send_data2(image)   
-        self.TurnOnDisplay()
+        self.cmd(0x24, image)  # WRITE_RAM
+        self.TurnOnDisplay(wait)
 
-    def display_Base(self, image):
+    def display_Base(self, image, wait=True):
         if (image == None):
             return   
             
-        self.send_command(0x24) # WRITE_RAM
-        self.send_data2(image)
+        self.cmd(0x24, image)  # WRITE_RAM
                 
-        self.send_command(0x26) # WRITE_RAM
-        self.send_data2(image)   
+        self.cmd(0x26, image)  # WRITE_RAM
                 
-        self.TurnOnDisplay()
+        self.TurnOnDisplay(wait)
         
-    def display_Partial(self, image):
+    def display_Partial(self, image, wait=True):
         if (image == None):
             return
             
-        epdconfig.digital_write(self.reset_pin, 0)
-        epdconfig.delay_ms(2)
-        epdconfig.digital_write(self.reset_pin, 1)
-        epdconfig.delay_ms(2)   
-        
-        self.SetLut(self.WF_PARTIAL_2IN9)
-        self.send_command(0x37)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x40)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x00)  
-        self.send_data(0x00)
+        # the partial waveform stays loaded between partial refreshes,
+        # only set it up again after a full refresh or a reset
+        if self.lut_loaded is not self.WF_PARTIAL_2IN9:
+            epdconfig.digital_write(self.reset_pin, 0)
+            epdconfig.delay_ms(2)
+            epdconfig.digital_write(self.reset_pin, 1)
+            epdconfig.delay_ms(2)   
+            self.lut_loaded = None
+
+            self.SetLut(self.WF_PARTIAL_2IN9)
+            self.cmd(0x37, [0x00, 0x00, 0x00, 0x00, 0x00, 0x40, 0x00, 0x00, 0x00, 0x00])
 
-        self.send_command(0x3C) #BorderWavefrom
-        self.send_data(0x80)
+            self.cmd(0x3C, [0x80])  # BorderWavefrom
 
-        self.send_command(0x22) 
-        self.send_data(0xC0)
+        self.cmd(0x22, [0xC0])
         self.send_command(0x20)
         self.ReadBusy()
 
         self.SetWindow(0, 0, self.width - 1, self.height - 1)
         self.SetCursor(0, 0)
         
-        self.send_command(0x24) # WRITE_RAM
-        self.send_data2(image)   
-        self.TurnOnDisplay_Partial()
+        self.cmd(0x24, image)  # WRITE_RAM
+        self.TurnOnDisplay_Partial(wait)
 
-    def Clear(self, color=0xFF):
+    def Clear(self, color=0xFF, wait=True):
         if self.width%8 == 0:
             linewidth = int(self.width/8)
         else:
             linewidth = int(self.width/8) + 1
 
-        self.send_command(0x24) # WRITE_RAM
-        self.send_data2([color] * int(self.height * linewidth)) 
-        self.TurnOnDisplay()
+        self.cmd(0x24, epdbuffer.fill(color, int(self.height * linewidth)))  # WRITE_RAM
+        self.TurnOnDisplay(wait)
 
     def sleep(self):
-        self.send_command(0x10) # DEEP_SLEEP_MODE
-        self.send_data(0x01)
+        self.ReadBusy()  # a refresh still running finishes first
+        self.cmd(0x10, [0x01])  # DEEP_SLEEP_MODE
+        self.asleep = epdseq.DEEP
         
-        epdconfig.delay_ms(2000)
+        epdconfig.delay_ms(epdseq.SLEEP_SETTLE_MS)
         epdconfig.module_exit()
 ### END OF FILE ###
 
@@ -30,11 +30,9 @@
 # THE SOFTWARE.
 #
 
-from distutils.command.build_scripts import build_scripts
 import logging
 from . import epdconfig
-from PIL import Image
-import RPi.GPIO as GPIO
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 128
@@ -50,8 +48,9 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.lut_loaded = None    # LUT currently held in the controller
     
-    lut_vcom1 = [  
+    lut_vcom1 = bytes([  
         0x00, 0x19, 0x01, 0x00, 0x00, 0x01,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
@@ -60,9 +59,9 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00,
-    ]
+    ])
 
-    lut_ww1 = [  
+    lut_ww1 = bytes([  
         0x00, 0x19, 0x01, 0x00, 0x00, 0x01,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
@@ -70,9 +69,9 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
+    ])
 
-    lut_bw1 = [  
+    lut_bw1 = bytes([  
         0x80, 0x19, 0x01, 0x00, 0x00, 0x01,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
@@ -80,9 +79,9 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
+    ])
 
-    lut_wb1 = [
+    lut_wb1 = bytes([
         0x40, 0x19, 0x01, 0x00, 0x00, 0x01,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
@@ -90,9 +89,9 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
+    ])
 
-    lut_bb1 = [ 
+    lut_bb1 = bytes([ 
         0x00, 0x19, 0x01, 0x00, 0x00, 0x01,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
@@ -100,7 +99,7 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
+    ])
         
     # Hardware reset
     def reset(self):
@@ -118,6 +117,7 @@ class EPD:
         epdconfig.delay_ms(5)
         epdconfig.digital_write(self.reset_pin, 1)
         epdconfig.delay_ms(20)  
+        self.lut_loaded = None
 
     def send_command(self, command):
         epdconfig.digital_write(self.dc_pin, 0)
@@ -125,6 +125,21 @@ class EPD:
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
 
+    '''
+    function :send a command and its parameters in one transaction
+    parameter:
+     command : Command register
+     data : parameter bytes, CS stays low and they go in one transfer
+    '''
+    def cmd(self, command, data=b''):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
@@ -140,9 +155,8 @@ class EPD:
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 0):      # 0: idle, 1: busy
-            self.send_command(0x71)
-            epdconfig.delay_ms(10)  
+        self.send_command(0x71)
+        epdconfig.wait_busy(self.busy_pin, 1)      # 0: busy, 1: idle
         logger.debug("e-Paper busy release")
         
     def TurnOnDisplay(self):
@@ -151,7 +165,7 @@ class EPD:
         self.ReadBusy()
         
     def init(self):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
         # EPD hardware init start
         self.reset()
@@ -159,95 +173,64 @@ class EPD:
         self.send_command(0x04)
         self.ReadBusy() #waiting for the electronic paper IC to release the idle signal
 
-        self.send_command(0x00)     #panel setting
-        self.send_data(0x1f)        # LUT from OTP，KW-BF   KWR-AF    BWROTP 0f   BWOTP 1f
+        self.cmd(0x00, [0x1f])  # panel setting; LUT from OTP，KW-BF   KWR-AF    BWROTP 0f   BWOTP 1f
 
-        self.send_command(0x61)     #resolution setting
-        self.send_data (0x80)       
-        self.send_data (0x01)   
-        self.send_data (0x28)   
+        self.cmd(0x61, [0x80, 0x01, 0x28])  # resolution setting
 
-        self.send_command(0X50) #VCOM AND DATA INTERVAL SETTING     
-        self.send_data(0x97)        #WBmode:VBDF 17|D7 VBDW 97 VBDB 57  WBRmode:VBDF F7 VBDW 77 VBDB 37  VBDR B7
+        self.cmd(0X50, [  # VCOM AND DATA INTERVAL SETTING; WBmode:VBDF 17|D7 VBDW 97 VBDB 57  WBRmode:VBDF F7 VBDW 77 VBDB 37  VBDR B7
+            0x97,  #WBmode:VBDF 17|D7 VBDW 97 VBDB 57  WBRmode:VBDF F7 VBDW 77 VBDB 37  VBDR B7
+        ])
 
         return 0
     
     def SetPartReg(self):
+        if self.lut_loaded is self.lut_vcom1:
+            return
 
-        self.send_command(0x01) #POWER SETTING
-        self.send_data(0x03)
-        self.send_data(0x00)
-        self.send_data(0x2b)
-        self.send_data(0x2b)
-        self.send_data(0x03)
+        self.cmd(0x01, [0x03, 0x00, 0x2b, 0x2b, 0x03])  # POWER SETTING
 
-        self.send_command(0x06) #boost soft start
-        self.send_data(0x17)     #A
-        self.send_data(0x17)     #B
-        self.send_data(0x17)     #C
+        self.cmd(0x06, [  # boost soft start
+            0x17,  #A
+            0x17,  #B
+            0x17,  #C
+        ])
 
         self.send_command(0x04)
         self.ReadBusy()
 
-        self.send_command(0x00) #panel setting
-        self.send_data(0xbf)     #LUT from OTP，128x296
+        self.cmd(0x00, [0xbf])  # panel setting; LUT from OTP，128x296
 
-        self.send_command(0x30) #PLL setting
-        self.send_data(0x3a)     # 3a 100HZ   29 150Hz 39 200HZ 31 171HZ
+        self.cmd(0x30, [0x3a])  # PLL setting; 3a 100HZ   29 150Hz 39 200HZ 31 171HZ
 
-        self.send_command(0x61) #resolution setting
-        self.send_data(self.width)
-        self.send_data((self.height >> 8) & 0xff)
-        self.send_data(self.height & 0xff)
+        self.cmd(0x61, [  # resolution setting
+            self.width,
+            (self.height >> 8) & 0xff,
+            self.height & 0xff,
+        ])
 
-        self.send_command(0x82) #vcom_DC setting
-        self.send_data(0x12)
+        self.cmd(0x82, [0x12])  # vcom_DC setting
 
-        self.send_command(0X50)
-        self.send_data(0x97)
+        self.cmd(0X50, [0x97])
         
-        self.send_command(0x20)         # vcom
-        self.send_data2(self.lut_vcom1)
-        self.send_command(0x21)         # ww --
-        self.send_data2(self.lut_ww1)
-        self.send_command(0x22)         # bw r
-        self.send_data2(self.lut_bw1)
-        self.send_command(0x23)         # wb w
-        self.send_data2(self.lut_wb1)
-        self.send_command(0x24)         # bb b
-        self.send_data2(self.lut_bb1)
+        self.cmd(0x20, self.lut_vcom1)  # vcom
+        self.cmd(0x21, self.lut_ww1)  # ww --
+        self.cmd(0x22, self.lut_bw1)  # bw r
+        self.cmd(0x23, self.lut_wb1)  # wb w
+        self.cmd(0x24, self.lut_bb1)  # bb b
+        self.lut_loaded = self.lut_vcom1
 
-    def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
+    def getbuffer(self, image, orientation=None):
+        buf = epdbuffer.pack(image, self.width, self.height, orientation)
+        if buf is None:
+            # wrong size, send a blank frame
+            return epdbuffer.fill(0xFF, int(self.width/8) * self.height)
         return buf
 
     def display(self, image):
-        self.send_command(0x10)
-        self.send_data2([0x00] * int(self.width * self.height / 8))
+        self.cmd(0x10, epdbuffer.fill(0x00, int(self.width * self.height / 8)))
         epdconfig.delay_ms(10)
         
-        self.send_command(0x13)
-        self.send_data2(image)
+        self.cmd(0x13, image)
         epdconfig.delay_ms(10)
         
         self.TurnOnDisplay()
@@ -255,47 +238,36 @@ class EPD:
     def DisplayPartial(self, image):
         self.SetPartReg()
         self.send_command(0x91)
-        self.send_command(0x90)
-        self.send_data(0)
-        self.send_data(self.width - 1)
-
-        self.send_data(0)
-        self.send_data(0)
-        self.send_data(int(self.height / 256))
-        self.send_data(self.height % 256 - 1)
-        self.send_data(0x28)
+        self.cmd(0x90, [  # partial window
+            0, self.width - 1,  # x-start, x-end
+            0, 0,  # y-start
+            int(self.height / 256), self.height % 256 - 1,  # y-end
+            0x28,
+        ])
         
 
-        buf = [0x00] * int(self.width * self.height / 8)
-        for i in range(0, int(self.width * self.height / 8)):
-            buf[i] = ~image[i]
-        self.send_command(0x10)
-        self.send_data2(image)
+        buf = epdbuffer.invert(image[:int(self.width * self.height / 8)])
+        self.cmd(0x10, image)
         epdconfig.delay_ms(10)
         
-        self.send_command(0x13)
-        self.send_data2(buf)
+        self.cmd(0x13, buf)
         epdconfig.delay_ms(10)
           
         self.TurnOnDisplay()
         
     def Clear(self):
-        self.send_command(0x10)
-        self.send_data2([0x00] * int(self.width * self.height / 8))
+        self.cmd(0x10, epdbuffer.fill(0x00, int(self.width * self.height / 8)))
         epdconfig.delay_ms(10)
         
-        self.send_command(0x13)
-        self.send_data2([0xFF] * int(self.width * self.height / 8))
+        self.cmd(0x13, epdbuffer.fill(0xFF, int(self.width * self.height / 8)))
         epdconfig.delay_ms(10)
         
         self.TurnOnDisplay()
 
     def sleep(self):
-        self.send_command(0X50)
-        self.send_data(0xf7)
+        self.cmd(0X50, [0xf7])
         self.send_command(0X02)         #power off
-        self.send_command(0X07)         #deep sleep  
-        self.send_data(0xA5)
+        self.cmd(0X07, [0xA5])  # deep sleep
         
         epdconfig.delay_ms(2000)
         epdconfig.module_exit()
@@ -29,6 +29,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 280
@@ -49,12 +50,13 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.lut_loaded = None    # LUT currently held in the controller
         self.GRAY1  = GRAY1 #white
         self.GRAY2  = GRAY2
         self.GRAY3  = GRAY3 #gray
         self.GRAY4  = GRAY4 #Blackest
 
-    lut_4Gray_GC = [
+    lut_4Gray_GC = bytes([
         0x2A,0x06,0x15,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x28,0x06,0x14,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x20,0x06,0x10,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
@@ -66,9 +68,9 @@ class EPD:
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x22,0x22,0x22,0x22,0x22
-    ]
+    ])
 
-    lut_1Gray_GC  = [
+    lut_1Gray_GC  = bytes([
         0x2A,0x05,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x05,0x2A,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x2A,0x15,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
@@ -80,9 +82,9 @@ class EPD:
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x22,0x22,0x22,0x22,0x22
-    ]
+    ])
 
-    lut_1Gray_DU  = [
+    lut_1Gray_DU  = bytes([
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x01,0x2A,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x0A,0x55,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
@@ -94,9 +96,9 @@ class EPD:
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x22,0x22,0x22,0x22,0x22
-    ]
+    ])
 
-    lut_1Gray_A2  = [
+    lut_1Gray_A2  = bytes([
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x0A,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
         0x05,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,
@@ -108,7 +110,7 @@ class EPD:
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00, 
         0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00,0x00, 
         0x22,0x22,0x22,0x22,0x22
-    ]
+    ])
         
     # Hardware reset
     def reset(self):
@@ -118,6 +120,7 @@ class EPD:
         epdconfig.delay_ms(5)
         epdconfig.digital_write(self.reset_pin, 1)
         epdconfig.delay_ms(200)   
+        self.lut_loaded = None
 
 
     def send_command(self, command):
@@ -126,6 +129,21 @@ class EPD:
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
 
+    '''
+    function :send a command and its parameters in one transaction
+    parameter:
+     command : Command register
+     data : parameter bytes, CS stays low and they go in one transfer
+    '''
+    def cmd(self, command, data=b''):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
 
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
@@ -143,13 +161,12 @@ class EPD:
 
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        while(epdconfig.digital_read(self.busy_pin) == 1):      #  0: idle, 1: busy
-            epdconfig.delay_ms(10) 
+        epdconfig.wait_busy(self.busy_pin, 0)      # 0: idle, 1: busy
         logger.debug("e-Paper busy release") 
 
 
     def init(self, mode):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
         # EPD hardware init start
         self.reset()
@@ -157,122 +174,65 @@ class EPD:
         self.send_command(0x12)
         epdconfig.delay_ms(300)
         
-        self.send_command(0x46)
-        self.send_data(0xF7)
+        self.cmd(0x46, [0xF7])
         self.ReadBusy()
-        self.send_command(0x47)
-        self.send_data(0xF7)
+        self.cmd(0x47, [0xF7])
         self.ReadBusy()
         
-        self.send_command(0x01) # setting gaet number
-        self.send_data(0xDF)
-        self.send_data(0x01)
-        self.send_data(0x00)
+        self.cmd(0x01, [0xDF, 0x01, 0x00])  # setting gaet number
 
-        self.send_command(0x03) # set gate voltage
-        self.send_data(0x00)
+        self.cmd(0x03, [0x00])  # set gate voltage
 
-        self.send_command(0x04) # set source voltage
-        self.send_data(0x41)
-        self.send_data(0xA8)
-        self.send_data(0x32)
+        self.cmd(0x04, [0x41, 0xA8, 0x32])  # set source voltage
 
-        self.send_command(0x11) # set data entry sequence
-        self.send_data(0x03)
+        self.cmd(0x11, [0x03])  # set data entry sequence
 
-        self.send_command(0x3C) # set border 
-        self.send_data(0x03)
+        self.cmd(0x3C, [0x03])  # set border
         
-        self.send_command(0x0C) # set booster strength
-        self.send_data(0xAE)
-        self.send_data(0xC7)
-        self.send_data(0xC3)
-        self.send_data(0xC0)
-        self.send_data(0xC0)
-
-        self.send_command(0x18) # set internal sensor on
-        self.send_data(0x80)
+        self.cmd(0x0C, [0xAE, 0xC7, 0xC3, 0xC0, 0xC0])  # set booster strength
+
+        self.cmd(0x18, [0x80])  # set internal sensor on
          
-        self.send_command(0x2C) # set vcom value
-        self.send_data(0x44)
+        self.cmd(0x2C, [0x44])  # set vcom value
         
         if(mode == 0):   #4Gray
-            self.send_command(0x37) # set display option, these setting turn on previous function
-            self.send_data(0x00)
-            self.send_data(0x00)
-            self.send_data(0x00)
-            self.send_data(0x00)
-            self.send_data(0x00)  
-            self.send_data(0x00)
-            self.send_data(0x00)
-            self.send_data(0x00)
-            self.send_data(0x00)
-            self.send_data(0x00)  
+            self.cmd(0x37, [  # set display option, these setting turn on previous function
+                0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+            ])
         elif(mode == 1):      #1Gray
-            self.send_command(0x37) # set display option, these setting turn on previous function
-            self.send_data(0x00)     #can switch 1 gray or 4 gray
-            self.send_data(0xFF)
-            self.send_data(0xFF)
-            self.send_data(0xFF)
-            self.send_data(0xFF)  
-            self.send_data(0x4F)
-            self.send_data(0xFF)
-            self.send_data(0xFF)
-            self.send_data(0xFF)
-            self.send_data(0xFF)
+            self.cmd(0x37, [  # set display option, these setting turn on previous function
+                0x00,  #can switch 1 gray or 4 gray
+                0xFF, 0xFF, 0xFF, 0xFF, 0x4F, 0xFF, 0xFF, 0xFF, 0xFF,
+            ])
         else:
             logger.debug("There is no such mode") 
 
-        self.send_command(0x44) # setting X direction start/end position of RAM
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0x17)
-        self.send_data(0x01)
+        self.cmd(0x44, [0x00, 0x00, 0x17, 0x01])  # setting X direction start/end position of RAM
 
-        self.send_command(0x45) # setting Y direction start/end position of RAM
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_data(0xDF)
-        self.send_data(0x01)
+        self.cmd(0x45, [0x00, 0x00, 0xDF, 0x01])  # setting Y direction start/end position of RAM
 
-        self.send_command(0x22) # Display Update Control 2
-        self.send_data(0xCF)
+        self.cmd(0x22, [0xCF])  # Display Update Control 2
         return 0
 
 
     def load_lut(self, lut):
-        self.send_command(0x32)
-        self.send_data2(lut)
+        if self.lut_loaded is lut:
+            return
+        self.cmd(0x32, lut)
+        self.lut_loaded = lut
 
 
-    def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
+    def getbuffer(self, image, orientation=None):
+        buf = epdbuffer.pack(image, self.width, self.height, orientation)
+        if buf is None:
+            # wrong size, send a blank frame
+            return epdbuffer.fill(0xFF, int(self.width/8) * self.height)
         return buf
 
 
     def getbuffer_4Gray(self, image):
         # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 4) * self.height)
+        buf = bytearray(epdbuffer.fill(0xFF, int(self.width / 4) * self.height))
         image_monocolor = image.convert('L')
         imwidth, imheight = image_monocolor.size
         pixels = image_monocolor.load()
@@ -311,19 +271,15 @@ class EPD:
         if (image == None):
             return            
 
-        self.send_command(0x4E)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_command(0x4F)
-        self.send_data(0x00)
-        self.send_data(0x00)
+        self.cmd(0x4E, [0x00, 0x00])
+        self.cmd(0x4F, [0x00, 0x00])
 
         if self.width%8 == 0:
             linewidth = int(self.width/8)
         else:
             linewidth = int(self.width/8) + 1
 
-        buf = [0x00] * self.height * linewidth
+        buf = bytearray(self.height * linewidth)
 
         self.send_command(0x24)
         for i in range(0, (int)(self.height*(self.width/8))):
@@ -357,12 +313,8 @@ class EPD:
             buf[i] = temp3
         self.send_data2(buf)
 
-        self.send_command(0x4E)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_command(0x4F)
-        self.send_data(0x00)
-        self.send_data(0x00)
+        self.cmd(0x4E, [0x00, 0x00])
+        self.cmd(0x4F, [0x00, 0x00])
 
         self.send_command(0x26)
         for i in range(0, (int)(self.height*(self.width/8))):
@@ -397,8 +349,7 @@ class EPD:
         self.send_data2(buf)
 
         self.load_lut(self.lut_4Gray_GC)
-        self.send_command(0x22)
-        self.send_data(0xC7)
+        self.cmd(0x22, [0xC7])
         self.send_command(0x20)
         self.ReadBusy()   
 
@@ -407,15 +358,10 @@ class EPD:
         if (image == None):
             return            
 
-        self.send_command(0x4E)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_command(0x4F)
-        self.send_data(0x00)
-        self.send_data(0x00)
+        self.cmd(0x4E, [0x00, 0x00])
+        self.cmd(0x4F, [0x00, 0x00])
 
-        self.send_command(0x24)
-        self.send_data2(image)   
+        self.cmd(0x24, image)
 
         self.load_lut(self.lut_1Gray_A2)
         self.send_command(0x20)
@@ -423,28 +369,21 @@ class EPD:
         
 
     def Clear(self, color, mode):
-        self.send_command(0x4E)
-        self.send_data(0x00)
-        self.send_data(0x00)
-        self.send_command(0x4F)
-        self.send_data(0x00)
-        self.send_data(0x00)
+        self.cmd(0x4E, [0x00, 0x00])
+        self.cmd(0x4F, [0x00, 0x00])
 
         if self.width%8 == 0:
             linewidth = int(self.width/8)
         else:
             linewidth = int(self.width/8) + 1
 
-        self.send_command(0x24)
-        self.send_data2([0xff] * int(self.height * linewidth))
+        self.cmd(0x24, epdbuffer.fill(0xff, int(self.height * linewidth)))
 
         if(mode == 0):              #4Gray
-            self.send_command(0x26)
-            self.send_data2([0xff] * int(self.height * linewidth))
+            self.cmd(0x26, epdbuffer.fill(0xff, int(self.height * linewidth)))
 
             self.load_lut(self.lut_4Gray_GC)
-            self.send_command(0x22)
-            self.send_data(0xC7)
+            self.cmd(0x22, [0xC7])
         elif(mode == 1):            #1Gray
             self.load_lut(self.lut_1Gray_DU)
         else:
@@ -455,8 +394,7 @@ class EPD:
 
 
     def sleep(self):
-        self.send_command(0X10) #deep sleep
-        self.send_data(0x03)
+        self.cmd(0X10, [0x03])  # deep sleep
 
         epdconfig.delay_ms(2000)
         epdconfig.module_exit()
@@ -30,8 +30,7 @@
 
 import logging
 from . import epdconfig
-from PIL import Image
-import RPi.GPIO as GPIO
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH  = 400
@@ -53,13 +52,14 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.lut_loaded = None    # LUT currently held in the controller
         self.GRAY1 = GRAY1  # white
         self.GRAY2 = GRAY2
         self.GRAY3 = GRAY3  # gray
         self.GRAY4 = GRAY4  # Blackest
-        self.DATA = [0x00] * 15000
+        self.DATA = bytearray(15000)
 
-    lut_vcom0 = [
+    lut_vcom0 = bytes([
         0x00, 0x08, 0x08, 0x00, 0x00, 0x02,
         0x00, 0x0F, 0x0F, 0x00, 0x00, 0x01,
         0x00, 0x08, 0x08, 0x00, 0x00, 0x02,
@@ -68,8 +68,8 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00,
-    ]
-    lut_ww = [
+    ])
+    lut_ww = bytes([
         0x50, 0x08, 0x08, 0x00, 0x00, 0x02,
         0x90, 0x0F, 0x0F, 0x00, 0x00, 0x01,
         0xA0, 0x08, 0x08, 0x00, 0x00, 0x02,
@@ -77,8 +77,8 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
-    lut_bw = [
+    ])
+    lut_bw = bytes([
         0x50, 0x08, 0x08, 0x00, 0x00, 0x02,
         0x90, 0x0F, 0x0F, 0x00, 0x00, 0x01,
         0xA0, 0x08, 0x08, 0x00, 0x00, 0x02,
@@ -86,8 +86,8 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
-    lut_wb = [
+    ])
+    lut_wb = bytes([
         0xA0, 0x08, 0x08, 0x00, 0x00, 0x02,
         0x90, 0x0F, 0x0F, 0x00, 0x00, 0x01,
         0x50, 0x08, 0x08, 0x00, 0x00, 0x02,
@@ -95,8 +95,8 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
-    lut_bb = [
+    ])
+    lut_bb = bytes([
         0x20, 0x08, 0x08, 0x00, 0x00, 0x02,
         0x90, 0x0F, 0x0F, 0x00, 0x00, 0x01,
         0x10, 0x08, 0x08, 0x00, 0x00, 0x02,
@@ -104,9 +104,9 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
+    ])
     # ******************************partial screen update LUT*********************************/
-    EPD_4IN2_Partial_lut_vcom1 = [
+    EPD_4IN2_Partial_lut_vcom1 = bytes([
         0x00, 0x01, 0x20, 0x01, 0x00, 0x01,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
@@ -117,9 +117,9 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
+    ])
 
-    EPD_4IN2_Partial_lut_ww1 = [
+    EPD_4IN2_Partial_lut_ww1 = bytes([
         0x00, 0x01, 0x20, 0x01, 0x00, 0x01,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
@@ -127,9 +127,9 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
+    ])
 
-    EPD_4IN2_Partial_lut_bw1 = [
+    EPD_4IN2_Partial_lut_bw1 = bytes([
         0x20, 0x01, 0x20, 0x01, 0x00, 0x01,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
@@ -140,9 +140,9 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
+    ])
 
-    EPD_4IN2_Partial_lut_wb1 = [
+    EPD_4IN2_Partial_lut_wb1 = bytes([
         0x10, 0x01, 0x20, 0x01, 0x00, 0x01,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
@@ -150,9 +150,9 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
+    ])
 
-    EPD_4IN2_Partial_lut_bb1 = [
+    EPD_4IN2_Partial_lut_bb1 = bytes([
         0x00, 0x01, 0x20, 0x01, 0x00, 0x01,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
@@ -160,11 +160,11 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
+    ])
 
     # ******************************gray*********************************/
     # 0~3 gray
-    EPD_4IN2_4Gray_lut_vcom = [
+    EPD_4IN2_4Gray_lut_vcom = bytes([
         0x00, 0x0A, 0x00, 0x00, 0x00, 0x01,
         0x60, 0x14, 0x14, 0x00, 0x00, 0x01,
         0x00, 0x14, 0x00, 0x00, 0x00, 0x01,
@@ -172,9 +172,9 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00
-    ]
+    ])
     # R21
-    EPD_4IN2_4Gray_lut_ww = [
+    EPD_4IN2_4Gray_lut_ww = bytes([
         0x40, 0x0A, 0x00, 0x00, 0x00, 0x01,
         0x90, 0x14, 0x14, 0x00, 0x00, 0x01,
         0x10, 0x14, 0x0A, 0x00, 0x00, 0x01,
@@ -182,9 +182,9 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
+    ])
     # R22H r
-    EPD_4IN2_4Gray_lut_bw = [
+    EPD_4IN2_4Gray_lut_bw = bytes([
         0x40, 0x0A, 0x00, 0x00, 0x00, 0x01,
         0x90, 0x14, 0x14, 0x00, 0x00, 0x01,
         0x00, 0x14, 0x0A, 0x00, 0x00, 0x01,
@@ -192,9 +192,9 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
+    ])
     # R23H w
-    EPD_4IN2_4Gray_lut_wb = [
+    EPD_4IN2_4Gray_lut_wb = bytes([
         0x40, 0x0A, 0x00, 0x00, 0x00, 0x01,
         0x90, 0x14, 0x14, 0x00, 0x00, 0x01,
         0x00, 0x14, 0x0A, 0x00, 0x00, 0x01,
@@ -202,9 +202,9 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
+    ])
     # R24H b
-    EPD_4IN2_4Gray_lut_bb = [
+    EPD_4IN2_4Gray_lut_bb = bytes([
         0x80, 0x0A, 0x00, 0x00, 0x00, 0x01,
         0x90, 0x14, 0x14, 0x00, 0x00, 0x01,
         0x20, 0x14, 0x0A, 0x00, 0x00, 0x01,
@@ -212,7 +212,7 @@ class EPD:
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
         0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-    ]
+    ])
 
     # Hardware reset
     def reset(self):
@@ -230,6 +230,7 @@ class EPD:
         epdconfig.delay_ms(10)
         epdconfig.digital_write(self.reset_pin, 1)
         epdconfig.delay_ms(10)
+        self.lut_loaded = None
 
     def send_command(self, command):
         epdconfig.digital_write(self.dc_pin, 0)
@@ -237,6 +238,21 @@ class EPD:
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
 
+    '''
+    function :send a command and its parameters in one transaction
+    parameter:
+     command : Command register
+     data : parameter bytes, CS stays low and they go in one transfer
+    '''
+    def cmd(self, command, data=b''):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
@@ -252,213 +268,172 @@ class EPD:
 
     def ReadBusy(self):
         self.send_command(0x71)
-        while epdconfig.digital_read(self.busy_pin) == 0:  # 0: idle, 1: busy
-            self.send_command(0x71)
-            epdconfig.delay_ms(100)
+        epdconfig.wait_busy(self.busy_pin, 1)      # 0: busy, 1: idle
 
     def set_lut(self):
-        self.send_command(0x20)  # vcom
-        self.send_data2(self.lut_vcom0)
+        if self.lut_loaded is self.lut_vcom0:
+            return
+        self.cmd(0x20, self.lut_vcom0)  # vcom
 
-        self.send_command(0x21)  # ww --
-        self.send_data2(self.lut_ww)
+        self.cmd(0x21, self.lut_ww)  # ww --
 
-        self.send_command(0x22)  # bw r
-        self.send_data2(self.lut_bw)
+        self.cmd(0x22, self.lut_bw)  # bw r
 
-        self.send_command(0x23)  # wb w
-        self.send_data2(self.lut_bb)
+        self.cmd(0x23, self.lut_bb)  # wb w
 
-        self.send_command(0x24)  # bb b
-        self.send_data2(self.lut_wb)
+        self.cmd(0x24, self.lut_wb)  # bb b
+        self.lut_loaded = self.lut_vcom0
 
     def Partial_SetLut(self):
-        self.send_command(0x20)
-        self.send_data2(self.EPD_4IN2_Partial_lut_vcom1)
+        if self.lut_loaded is self.EPD_4IN2_Partial_lut_vcom1:
+            return
+        self.cmd(0x20, self.EPD_4IN2_Partial_lut_vcom1)
 
-        self.send_command(0x21)
-        self.send_data2(self.EPD_4IN2_Partial_lut_ww1)
+        self.cmd(0x21, self.EPD_4IN2_Partial_lut_ww1)
 
-        self.send_command(0x22)
-        self.send_data2(self.EPD_4IN2_Partial_lut_bw1)
+        self.cmd(0x22, self.EPD_4IN2_Partial_lut_bw1)
 
-        self.send_command(0x23)
-        self.send_data2(self.EPD_4IN2_Partial_lut_wb1)
+        self.cmd(0x23, self.EPD_4IN2_Partial_lut_wb1)
 
-        self.send_command(0x24)
-        self.send_data2(self.EPD_4IN2_Partial_lut_bb1)
+        self.cmd(0x24, self.EPD_4IN2_Partial_lut_bb1)
+        self.lut_loaded = self.EPD_4IN2_Partial_lut_vcom1
 
     def Gray_SetLut(self):
-        self.send_command(0x20)  # vcom
-        self.send_data2(self.EPD_4IN2_4Gray_lut_vcom)
+        if self.lut_loaded is self.EPD_4IN2_4Gray_lut_vcom:
+            return
+        self.cmd(0x20, self.EPD_4IN2_4Gray_lut_vcom)  # vcom
 
-        self.send_command(0x21)  # red not use
-        self.send_data2(self.EPD_4IN2_4Gray_lut_ww)
+        self.cmd(0x21, self.EPD_4IN2_4Gray_lut_ww)  # red not use
 
-        self.send_command(0x22)  # bw r
-        self.send_data2(self.EPD_4IN2_4Gray_lut_bw)
+        self.cmd(0x22, self.EPD_4IN2_4Gray_lut_bw)  # bw r
 
-        self.send_command(0x23)  # wb w
-        self.send_data2(self.EPD_4IN2_4Gray_lut_wb)
+        self.cmd(0x23, self.EPD_4IN2_4Gray_lut_wb)  # wb w
 
-        self.send_command(0x24)  # bb b
-        self.send_data2(self.EPD_4IN2_4Gray_lut_bb)
+        self.cmd(0x24, self.EPD_4IN2_4Gray_lut_bb)  # bb b
 
-        self.send_command(0x25)  # vcom
-        self.send_data2(self.EPD_4IN2_4Gray_lut_ww)
+        self.cmd(0x25, self.EPD_4IN2_4Gray_lut_ww)  # vcom
+        self.lut_loaded = self.EPD_4IN2_4Gray_lut_vcom
 
     def init(self):
-        if epdconfig.module_init() != 0:
+        if epdconfig.module_init(__name__) != 0:
             return -1
         # EPD hardware init start
         self.reset()
 
-        self.send_command(0x01)  # POWER SETTING
-        self.send_data(0x03)  # VDS_EN, VDG_EN
-        self.send_data(0x00)  # VCOM_HV, VGHL_LV[1], VGHL_LV[0]
-        self.send_data(0x2b)  # VDH
-        self.send_data(0x2b)  # VDL
+        self.cmd(0x01, [  # POWER SETTING
+            0x03,  # VDS_EN, VDG_EN
+            0x00,  # VCOM_HV, VGHL_LV[1], VGHL_LV[0]
+            0x2b,  # VDH
+            0x2b,  # VDL
+        ])
 
-        self.send_command(0x06)  # boost soft start
-        self.send_data(0x17)
-        self.send_data(0x17)
-        self.send_data(0x17)
+        self.cmd(0x06, [0x17, 0x17, 0x17])  # boost soft start
 
         self.send_command(0x04)  # POWER_ON
         self.ReadBusy()
 
-        self.send_command(0x00)  # panel setting
-        self.send_data(0xbf)  # KW-BF   KWR-AF  BWROTP 0f
+        self.cmd(0x00, [0xbf])  # panel setting; KW-BF   KWR-AF  BWROTP 0f
 
-        self.send_command(0x30)  # PLL setting
-        self.send_data(0x3c)  # 3A 100HZ   29 150Hz 39 200HZ  31 171HZ
+        self.cmd(0x30, [0x3c])  # PLL setting; 3A 100HZ   29 150Hz 39 200HZ  31 171HZ
 
-        self.send_command(0x61)  # resolution setting
-        self.send_data(0x01)
-        self.send_data(0x90)  # 128
-        self.send_data(0x01)
-        self.send_data(0x2c)
+        self.cmd(0x61, [  # resolution setting
+            0x01,
+            0x90,  # 128
+            0x01, 0x2c,
+        ])
 
-        self.send_command(0x82)  # vcom_DC setting
-        self.send_data(0x12)
+        self.cmd(0x82, [0x12])  # vcom_DC setting
 
-        self.send_command(0X50)  # VCOM AND DATA INTERVAL SETTING
-        self.send_data(
-            0x97)  # 97white border 77black border  VBDF 17|D7 VBDW 97 VBDB 57  VBDF F7 VBDW 77 VBDB 37  VBDR B7
+        self.cmd(0x50, [0x97])  # VCOM AND DATA INTERVAL SETTING; 97white border 77black border  VBDF 17|D7 VBDW 97 VBDB 57  VBDF F7 VBDW 77 VBDB 37  VBDR B7
 
         self.set_lut()
         # EPD hardware init end
         return 0
 
     def init_Partial(self):
-        if epdconfig.module_init() != 0:
+        if epdconfig.module_init(__name__) != 0:
             return -1
         # EPD hardware init start
         self.reset()
 
-        self.send_command(0x01)  # POWER SETTING
-        self.send_data(0x03)  # VDS_EN, VDG_EN
-        self.send_data(0x00)  # VCOM_HV, VGHL_LV[1], VGHL_LV[0]
-        self.send_data(0x2b)  # VDH
-        self.send_data(0x2b)  # VDL
+        self.cmd(0x01, [  # POWER SETTING
+            0x03,  # VDS_EN, VDG_EN
+            0x00,  # VCOM_HV, VGHL_LV[1], VGHL_LV[0]
+            0x2b,  # VDH
+            0x2b,  # VDL
+        ])
 
-        self.send_command(0x06)  # boost soft start
-        self.send_data(0x17)
-        self.send_data(0x17)
-        self.send_data(0x17)
+        self.cmd(0x06, [0x17, 0x17, 0x17])  # boost soft start
 
         self.send_command(0x04)  # POWER_ON
         self.ReadBusy()
 
-        self.send_command(0x00)  # panel setting
-        self.send_data(0xbf)  # KW-BF   KWR-AF  BWROTP 0f
+        self.cmd(0x00, [0xbf])  # panel setting; KW-BF   KWR-AF  BWROTP 0f
 
-        self.send_command(0x30)  # PLL setting
-        self.send_data(0x3c)  # 3A 100HZ   29 150Hz 39 200HZ  31 171HZ
+        self.cmd(0x30, [0x3c])  # PLL setting; 3A 100HZ   29 150Hz 39 200HZ  31 171HZ
 
-        self.send_command(0x61)  # resolution setting
-        self.send_data(0x01)
-        self.send_data(0x90)  # 128
-        self.send_data(0x01)
-        self.send_data(0x2c)
+        self.cmd(0x61, [  # resolution setting
+            0x01,
+            0x90,  # 128
+            0x01, 0x2c,
+        ])
 
-        self.send_command(0x82)  # vcom_DC setting
-        self.send_data(0x12)
+        self.cmd(0x82, [0x12])  # vcom_DC setting
 
-        self.send_command(0X50)  # VCOM AND DATA INTERVAL SETTING
-        self.send_data(
-            0x07)  # 97white border 77black border  VBDF 17|D7 VBDW 97 VBDB 57  VBDF F7 VBDW 77 VBDB 37  VBDR B7
+        self.cmd(0x50, [0x07])  # VCOM AND DATA INTERVAL SETTING; 97white border 77black border  VBDF 17|D7 VBDW 97 VBDB 57  VBDF F7 VBDW 77 VBDB 37  VBDR B7
 
         self.Partial_SetLut()
         # EPD hardware init end
         return 0
 
     def Init_4Gray(self):
-        if epdconfig.module_init() != 0:
+        if epdconfig.module_init(__name__) != 0:
             return -1
         # EPD hardware init start
         self.reset()
 
-        self.send_command(0x01)  # POWER SETTING
-        self.send_data(0x03)
-        self.send_data(0x00)  # VGH=20V,VGL=-20V
-        self.send_data(0x2b)  # VDH=15V
-        self.send_data(0x2b)  # VDL=-15V
-        self.send_data(0x13)
+        self.cmd(0x01, [  # POWER SETTING
+            0x03,
+            0x00,  # VGH=20V,VGL=-20V
+            0x2b,  # VDH=15V
+            0x2b,  # VDL=-15V
+            0x13,
+        ])
 
-        self.send_command(0x06)  # booster soft start
-        self.send_data(0x17)  # A
-        self.send_data(0x17)  # B
-        self.send_data(0x17)  # C
+        self.cmd(0x06, [  # booster soft start
+            0x17,  # A
+            0x17,  # B
+            0x17,  # C
+        ])
 
         self.send_command(0x04)
         self.ReadBusy()
 
-        self.send_command(0x00)  # panel setting
-        self.send_data(0x3f)  # KW-3f   KWR-2F BWROTP 0f BWOTP 1f
+        self.cmd(0x00, [0x3f])  # panel setting; KW-3f   KWR-2F BWROTP 0f BWOTP 1f
 
-        self.send_command(0x30)  # PLL setting
-        self.send_data(0x3c)  # 100hz
+        self.cmd(0x30, [0x3c])  # PLL setting; 100hz
 
-        self.send_command(0x61)  # resolution setting
-        self.send_data(0x01)  # 400
-        self.send_data(0x90)
-        self.send_data(0x01)  # 300
-        self.send_data(0x2c)
+        self.cmd(0x61, [  # resolution setting
+            0x01,  # 400
+            0x90,
+            0x01,  # 300
+            0x2c,
+        ])
 
-        self.send_command(0x82)  # vcom_DC setting
-        self.send_data(0x12)
+        self.cmd(0x82, [0x12])  # vcom_DC setting
 
-        self.send_command(0X50)  # VCOM AND DATA INTERVAL SETTING
-        self.send_data(0x97)
+        self.cmd(0X50, [0x97])  # VCOM AND DATA INTERVAL SETTING
 
-    def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if imwidth == self.width and imheight == self.height:
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif imwidth == self.height and imheight == self.width:
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy * self.width) / 8)] &= ~(0x80 >> (y % 8))
+    def getbuffer(self, image, orientation=None):
+        buf = epdbuffer.pack(image, self.width, self.height, orientation)
+        if buf is None:
+            # wrong size, send a blank frame
+            return epdbuffer.fill(0xFF, int(self.width/8) * self.height)
         return buf
 
     def getbuffer_4Gray(self, image):
         # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width / 4) * self.height)
+        buf = bytearray(epdbuffer.fill(0xFF, int(self.width / 4) * self.height))
         image_monocolor = image.convert('L')
         imwidth, imheight = image_monocolor.size
         pixels = image_monocolor.load()
@@ -505,11 +480,9 @@ class EPD:
 
         self.send_command(0x92)
         self.set_lut()
-        self.send_command(0x10)
-        self.send_data2([0xFF] * int(self.width * linewidth))
+        self.cmd(0x10, epdbuffer.fill(0xFF, int(self.width * linewidth)))
 
-        self.send_command(0x13)
-        self.send_data2(image)
+        self.cmd(0x13, image)
 
         self.send_command(0x12)
         self.ReadBusy()
@@ -533,34 +506,34 @@ class EPD:
         else:
             X_end = int(X_end / 8)
 
-        buf = [0x00] * (Y_end - Y_start) * (X_end - X_start)
+        linewidth = X_end - X_start
+        buf = bytearray((Y_end - Y_start) * linewidth)
 
         self.send_command(0x91)  # This command makes the display enter partial mode
-        self.send_command(0x90)  # resolution setting
-        self.send_data(int(X_start * 8 / 256))
-        self.send_data(int(X_start * 8 % 256))  # x-start
-
-        self.send_data(int(X_end * 8 / 256))
-        self.send_data(int(X_end * 8 % 256) - 1)  # x-end
-
-        self.send_data(int(Y_start / 256))
-        self.send_data(int(Y_start % 256))  # y-start
-
-        self.send_data(int(Y_end / 256))
-        self.send_data(int(Y_end % 256) - 1)  # y-end
-        self.send_data(0x28)
+        self.cmd(0x90, [  # resolution setting
+            int(X_start * 8 / 256),
+            int(X_start * 8 % 256),  # x-start
+            int(X_end * 8 / 256),
+            int(X_end * 8 % 256) - 1,  # x-end
+            int(Y_start / 256),
+            int(Y_start % 256),  # y-start
+            int(Y_end / 256),
+            int(Y_end % 256) - 1,  # y-end
+            0x28,
+        ])
 
         self.send_command(0x10)  # writes Old data to SRAM for programming
         for j in range(0, Y_end - Y_start):
-            for i in range(0, X_end - X_start):
-                buf[j * (X_end - X_start) + i] = self.DATA[(Y_start + j) * Width + X_start + i]
+            row = (Y_start + j) * Width
+            buf[j * linewidth:(j + 1) * linewidth] = self.DATA[row + X_start:row + X_end]
         self.send_data2(buf)
 
         self.send_command(0x13)  # writes New data to SRAM.
         for j in range(0, Y_end - Y_start):
-            for i in range(0, X_end - X_start):
-                buf[j * (X_end - X_start) + i] = ~Image[(Y_start + j) * Width + X_start + i]
-                self.DATA[(Y_start + j) * Width + X_start + i] = ~Image[(Y_start + j) * Width + X_start / 8 + i]
+            row = (Y_start + j) * Width
+            line = epdbuffer.invert(Image[row + X_start:row + X_end])
+            buf[j * linewidth:(j + 1) * linewidth] = line
+            self.DATA[row + X_start:row + X_end] = line
         self.send_data2(buf)
 
         self.send_command(0x12)  # DISPLAY REFRESH
@@ -577,7 +550,7 @@ class EPD:
         else:
             linewidth = int(self.width / 8) + 1
 
-        buf = [0x00] * self.height * linewidth
+        buf = bytearray(self.height * linewidth)
 
         for i in range(0, int(EPD_WIDTH * EPD_HEIGHT / 8)):  # EPD_WIDTH * EPD_HEIGHT / 4
             temp3 = 0
@@ -657,11 +630,9 @@ class EPD:
         else:
             linewidth = int(self.width / 8) + 1
 
-        self.send_command(0x10)
-        self.send_data2([0xff] * int(self.height * linewidth))
+        self.cmd(0x10, epdbuffer.fill(0xff, int(self.height * linewidth)))
 
-        self.send_command(0x13)
-        self.send_data2([0xff] * int(self.height * linewidth))
+        self.cmd(0x13, epdbuffer.fill(0xff, int(self.height * linewidth)))
 
         self.send_command(0x12)
         self.ReadBusy()
@@ -669,8 +640,7 @@ class EPD:
     def sleep(self):
         self.send_command(0x02)  # POWER_OFF
         self.ReadBusy()
-        self.send_command(0x07)  # DEEP_SLEEP
-        self.send_data(0XA5)
+        self.cmd(0x07, [0XA5])  # DEEP_SLEEP
 
         epdconfig.delay_ms(2000)
         epdconfig.module_exit()
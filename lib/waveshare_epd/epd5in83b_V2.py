@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 648
@@ -61,6 +62,21 @@ class EPD:
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
 
+    '''
+    function :send a command and its parameters in one transaction
+    parameter:
+     command : Command register
+     data : parameter bytes, CS stays low and they go in one transfer
+    '''
+    def cmd(self, command, data=b''):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
@@ -76,94 +92,64 @@ class EPD:
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        self.send_command(0X71)
-        while(epdconfig.digital_read(self.busy_pin) == 0):      #  0: idle, 1: busy
-            self.send_command(0X71)
-            epdconfig.delay_ms(200)
+        self.send_command(0x71)
+        epdconfig.wait_busy(self.busy_pin, 1)      # 0: busy, 1: idle
         logger.debug("e-Paper busy release")
             
     def init(self):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
             
         self.reset()
 
-        self.send_command(0x01)     #POWER SETTING
-        self.send_data (0x07)
-        self.send_data (0x07)       #VGH=20V,VGL=-20V
-        self.send_data (0x3f)       #VDH=15V
-        self.send_data (0x3f)       #VDL=-15V
+        self.cmd(0x01, [  # POWER SETTING
+            0x07,
+            0x07,  #VGH=20V,VGL=-20V
+            0x3f,  #VDH=15V
+            0x3f,  #VDL=-15V
+        ])
 
         self.send_command(0x04) #POWER ON
         epdconfig.delay_ms(100)  
         self.ReadBusy()   #waiting for the electronic paper IC to release the idle signal
 
-        self.send_command(0X00)     #PANNEL SETTING
-        self.send_data(0x0F)        #KW-3f   KWR-2F    BWROTP 0f   BWOTP 1f
+        self.cmd(0X00, [0x0F])  # PANNEL SETTING; KW-3f   KWR-2F    BWROTP 0f   BWOTP 1f
 
-        self.send_command(0x61)     #tres
-        self.send_data (0x02)       #source 648
-        self.send_data (0x88)
-        self.send_data (0x01)       #gate 480
-        self.send_data (0xe0)
+        self.cmd(0x61, [  # tres
+            0x02,  #source 648
+            0x88,
+            0x01,  #gate 480
+            0xe0,
+        ])
 
-        self.send_command(0X15)
-        self.send_data(0x00)
+        self.cmd(0X15, [0x00])
 
-        self.send_command(0X50)     #VCOM AND DATA INTERVAL SETTING
-        self.send_data(0x11)
-        self.send_data(0x07)
+        self.cmd(0X50, [0x11, 0x07])  # VCOM AND DATA INTERVAL SETTING
 
-        self.send_command(0X60)     #TCON SETTING
-        self.send_data(0x22)
+        self.cmd(0X60, [0x22])  # TCON SETTING
         
         return 0
 
-    def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        # logger.debug("imwidth = %d, imheight = %d",imwidth,imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
+    def getbuffer(self, image, orientation=None):
+        buf = epdbuffer.pack(image, self.width, self.height, orientation)
+        if buf is None:
+            # wrong size, send a blank frame
+            return epdbuffer.fill(0xFF, int(self.width/8) * self.height)
         return buf
 
     def display(self, imageblack, imagered):
-        buf = [0x00] * int(self.width * self.height / 8)
-        for i in range(0, int(self.width * self.height / 8)):
-            buf[i] = ~imagered[i]
-
         if (imageblack != None):
-            self.send_command(0X10)
-            self.send_data2(imageblack)        
+            self.cmd(0X10, imageblack)
         if (imagered != None):
-            self.send_command(0X13)
-            self.send_data2(buf)
+            self.cmd(0X13, epdbuffer.invert(imagered))
 
         self.send_command(0x12)
         epdconfig.delay_ms(200) 
         self.ReadBusy()
 
     def Clear(self):
-        self.send_command(0X10)
-        self.send_data2([0xFF] * int(self.width * self.height / 8))
-        self.send_command(0X13)
-        self.send_data2([0x00] * int(self.width * self.height / 8))
+        self.cmd(0X10, epdbuffer.fill(0xFF, int(self.width * self.height / 8)))
+        self.cmd(0X13, epdbuffer.fill(0x00, int(self.width * self.height / 8)))
 
         self.send_command(0x12)
         epdconfig.delay_ms(200) 
@@ -172,8 +158,7 @@ class EPD:
     def sleep(self):
         self.send_command(0X02) # power off
         self.ReadBusy()
-        self.send_command(0X07) # deep sleep
-        self.send_data(0xA5)
+        self.cmd(0X07, [0xA5])  # deep sleep
         
         epdconfig.delay_ms(2000)
         epdconfig.module_exit()
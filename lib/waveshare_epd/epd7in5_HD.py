@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 880
@@ -61,6 +62,21 @@ class EPD:
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
 
+    '''
+    function :send a command and its parameters in one transaction
+    parameter:
+     command : Command register
+     data : parameter bytes, CS stays low and they go in one transfer
+    '''
+    def cmd(self, command, data=b''):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
@@ -75,13 +91,11 @@ class EPD:
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        busy = epdconfig.digital_read(self.busy_pin)
-        while(busy == 1):
-            busy = epdconfig.digital_read(self.busy_pin)
+        epdconfig.wait_busy(self.busy_pin, 0)      # 0: idle, 1: busy
         epdconfig.delay_ms(200)
         
     def init(self):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
         # EPD hardware init start
         self.reset()
@@ -90,91 +104,64 @@ class EPD:
         self.send_command(0x12);  #SWRESET
         self.ReadBusy();
 
-        self.send_command(0x46);  # Auto Write Red RAM
-        self.send_data(0xf7);
+        self.cmd(0x46, [0xf7])  # Auto Write Red RAM
         self.ReadBusy();
-        self.send_command(0x47);  # Auto Write  B/W RAM
-        self.send_data(0xf7);
+        self.cmd(0x47, [0xf7])  # Auto Write  B/W RAM
         self.ReadBusy();
 
-        self.send_command(0x0C);  # Soft start setting
-        self.send_data2([0xAE, 0xC7, 0xC3, 0xC0, 0x40])
+        self.cmd(0x0C, [0xAE, 0xC7, 0xC3, 0xC0, 0x40])  # Soft start setting
 
-        self.send_command(0x01);  # Set MUX as 527
-        self.send_data2([0xAF, 0x02, 0x01])
+        self.cmd(0x01, [0xAF, 0x02, 0x01])  # Set MUX as 527
 
-        self.send_command(0x11);  # Data entry mode      
-        self.send_data(0x01);
+        self.cmd(0x11, [0x01])  # Data entry mode
 
-        self.send_command(0x44); 
-        self.send_data2([0x00, 0x00, 0x6F, 0x03]) # RAM x address start at 0
-        self.send_command(0x45); 
-        self.send_data2([0xAF, 0x02, 0x00, 0x00])
+        self.cmd(0x44, [0x00, 0x00, 0x6F, 0x03])  # RAM x address start at 0
+        self.cmd(0x45, [0xAF, 0x02, 0x00, 0x00])
 
-        self.send_command(0x3C); # VBD
-        self.send_data(0x05); # LUT1, for white
+        self.cmd(0x3C, [0x05])  # VBD; LUT1, for white
 
-        self.send_command(0x18);
-        self.send_data(0X80);
+        self.cmd(0x18, [0X80])
 
 
-        self.send_command(0x22);
-        self.send_data(0XB1); #Load Temperature and waveform setting.
+        self.cmd(0x22, [0XB1])  # Load Temperature and waveform setting.
         self.send_command(0x20);
         self.ReadBusy();
 
-        self.send_command(0x4E); # set RAM x address count to 0;
-        self.send_data2([0x00, 0x00])
-        self.send_command(0x4F); 
-        self.send_data2([0x00, 0x00])
+        self.cmd(0x4E, [0x00, 0x00])  # set RAM x address count to 0;
+        self.cmd(0x4F, [0x00, 0x00])
         # EPD hardware init end
         return 0
 
-    def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        if(imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif(imwidth == self.height and imheight == self.width):
-            img = img.rotate(90, expand=True).convert('1')
-        else:
+    def getbuffer(self, image, orientation=None):
+        buf = epdbuffer.pack(image, self.width, self.height, orientation)
+        if buf is None:
             logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
             # return a blank buffer
-            return [0xff] * int(self.width * self.height / 8)
-
-        buf = bytearray(img.tobytes('raw'))
+            return epdbuffer.fill(0xff, int(self.width * self.height / 8))
         return buf
         
     def display(self, image):
-        self.send_command(0x4F); 
-        self.send_data2([0x00, 0x00])
-        self.send_command(0x24);
-        self.send_data2(image)
-        self.send_command(0x22);
-        self.send_data(0xF7);#Load LUT from MCU(0x32)
+        self.cmd(0x4F, [0x00, 0x00])
+        self.cmd(0x24, image)
+        self.cmd(0x22, [0xF7])  # Load LUT from MCU(0x32)
         self.send_command(0x20);
         epdconfig.delay_ms(10);
         self.ReadBusy();
         
     def Clear(self):
-        buf = [0xff] * int(self.width * self.height / 8)
-        self.send_command(0x4F); 
-        self.send_data2([0x00, 0x00])
-        self.send_command(0x24)
-        self.send_data2(buf)
+        buf = epdbuffer.fill(0xff, int(self.width * self.height / 8))
+        self.cmd(0x4F, [0x00, 0x00])
+        self.cmd(0x24, buf)
             
-        self.send_command(0x26)
-        self.send_data2(buf)
+        self.cmd(0x26, buf)
                 
-        self.send_command(0x22);
-        self.send_data(0xF7);#Load LUT from MCU(0x32)
+        self.cmd(0x22, [0xF7])  # Load LUT from MCU(0x32)
         self.send_command(0x20);
         epdconfig.delay_ms(10);
         self.ReadBusy();
 
     def sleep(self):
-        self.send_command(0x10);
-        self.send_data(0x01);
+        self.cmd(0x10, [0x01])
         
         epdconfig.delay_ms(2000)
         epdconfig.module_exit()
@@ -30,6 +30,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdseq
 
 # Display resolution
 EPD_WIDTH       = 800
@@ -45,7 +47,25 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
-    
+        self.sequence = None    # (sequence, level) epdseq ran last
+        self.asleep = None      # epdseq level of the last standby/sleep
+
+    # init(), as data for epdseq. Power off (standby) only loses the LIGHT
+    # steps, deep sleep loses everything including frame RAM.
+    INIT = (
+        epdseq.reset(),
+        epdseq.command(0x06, [0x17, 0x17, 0x28, 0x17]),   # btst, try 0x38 for 0x28 if the image is off
+        epdseq.command(0x01, [0x07, 0x07, 0x3f, 0x3f]),   # POWER SETTING: VGH=20V, VGL=-20V, VDH=15V, VDL=-15V
+        epdseq.command(0x04, level=epdseq.LIGHT),   # POWER ON
+        epdseq.delay(100, level=epdseq.LIGHT),
+        epdseq.busy(level=epdseq.LIGHT),
+        epdseq.command(0x00, [0x1F]),   # PANNEL SETTING
+        epdseq.command(0x61, [0x03, 0x20, 0x01, 0xE0]),   # tres: source 800, gate 480
+        epdseq.command(0x15, [0x00]),
+        epdseq.command(0x50, [0x10, 0x07]),   # VCOM AND DATA INTERVAL SETTING
+        epdseq.command(0x60, [0x22]),   # TCON SETTING
+    )
+
     # Hardware reset
     def reset(self):
         epdconfig.digital_write(self.reset_pin, 1)
@@ -61,6 +81,21 @@ class EPD:
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
 
+    '''
+    function :send a command and its parameters in one transaction
+    parameter:
+     command : Command register
+     data : parameter bytes, CS stays low and they go in one transfer
+    '''
+    def cmd(self, command, data=b''):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
@@ -70,108 +105,68 @@ class EPD:
     def send_data2(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
-        epdconfig.SPI.writebytes2(data)
+        epdconfig.spi_writebyte2(data)
         epdconfig.digital_write(self.cs_pin, 1)
 
     def ReadBusy(self):
         logger.debug("e-Paper busy")
         self.send_command(0x71)
-        busy = epdconfig.digital_read(self.busy_pin)
-        while(busy == 0):
-            self.send_command(0x71)
-            busy = epdconfig.digital_read(self.busy_pin)
+        epdconfig.wait_busy(self.busy_pin, 1)      # 0: busy, 1: idle
         epdconfig.delay_ms(20)
         logger.debug("e-Paper busy release")
         
     def init(self):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
-        # EPD hardware init start
-        self.reset()
-        
-        self.send_command(0x06)     # btst
-        self.send_data(0x17)
-        self.send_data(0x17)
-        self.send_data(0x28)        # If an exception is displayed, try using 0x38
-        self.send_data(0x17)
-        
-        self.send_command(0x01)			#POWER SETTING
-        self.send_data(0x07)
-        self.send_data(0x07)    #VGH=20V,VGL=-20V
-        self.send_data(0x3f)		#VDH=15V
-        self.send_data(0x3f)		#VDL=-15V
-
-        self.send_command(0x04) #POWER ON
-        epdconfig.delay_ms(100)
-        self.ReadBusy()
-
-        self.send_command(0X00)			#PANNEL SETTING
-        self.send_data(0x1F)   #KW-3f   KWR-2F	BWROTP 0f	BWOTP 1f
-
-        self.send_command(0x61)        	#tres
-        self.send_data(0x03)		#source 800
-        self.send_data(0x20)
-        self.send_data(0x01)		#gate 480
-        self.send_data(0xE0)
-
-        self.send_command(0X15)
-        self.send_data(0x00)
-
-        self.send_command(0X50)			#VCOM AND DATA INTERVAL SETTING
-        self.send_data(0x10)
-        self.send_data(0x07)
-
-        self.send_command(0X60)			#TCON SETTING
-        self.send_data(0x22)
-
-        # EPD hardware init end
+        epdseq.run(self, self.INIT)
+        self.asleep = None
         return 0
 
-    def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        if(imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif(imwidth == self.height and imheight == self.width):
-            # image has correct dimensions, but needs to be rotated
-            img = img.rotate(90, expand=True).convert('1')
-        else:
+    def getbuffer(self, image, orientation=None):
+        buf = epdbuffer.pack(image, self.width, self.height, orientation)
+        if buf is None:
             logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
             # return a blank buffer
-            return [0x00] * (int(self.width/8) * self.height)
-
-        buf = bytearray(img.tobytes('raw'))
-        # The bytes need to be inverted, because in the PIL world 0=black and 1=white, but
-        # in the e-paper world 0=white and 1=black.
-        for i in range(len(buf)):
-            buf[i] ^= 0xFF
-        return buf
+            return epdbuffer.fill(0x00, int(self.width/8) * self.height)
+        return epdbuffer.invert(buf)
 
     def display(self, image):
-        self.send_command(0x13)
-        self.send_data2(image)
+        self.cmd(0x13, image)
 
         self.send_command(0x12)
         epdconfig.delay_ms(100)
         self.ReadBusy()
 
     def Clear(self):
-        buf = [0x00] * (int(self.width/8) * self.height)
-        self.send_command(0x10)
-        self.send_data2(buf)
-        self.send_command(0x13)
-        self.send_data2(buf)
+        buf = epdbuffer.fill(0x00, int(self.width/8) * self.height)
+        self.cmd(0x10, buf)
+        self.cmd(0x13, buf)
         self.send_command(0x12)
         epdconfig.delay_ms(100)
         self.ReadBusy()
 
+    # Power off but keep the registers, wake() only powers back on
+    def standby(self):
+        self.send_command(0x02) # POWER_OFF
+        self.ReadBusy()
+        self.asleep = epdseq.LIGHT
+
+    # Come back from standby() or sleep(), replaying what that level lost
+    def wake(self):
+        level = self.asleep or epdseq.LIGHT
+        if level == epdseq.DEEP and epdconfig.module_init(__name__) != 0:
+            return -1
+        epdseq.run(self, self.INIT, level)
+        self.asleep = None
+        return 0
+
     def sleep(self):
         self.send_command(0x02) # POWER_OFF
         self.ReadBusy()
         
-        self.send_command(0x07) # DEEP_SLEEP
-        self.send_data(0XA5)
+        self.cmd(0x07, [0XA5])  # DEEP_SLEEP
+        self.asleep = epdseq.DEEP
         
-        epdconfig.delay_ms(2000)
+        epdconfig.delay_ms(epdseq.SLEEP_SETTLE_MS)
         epdconfig.module_exit()
 ### END OF FILE ###
@@ -30,6 +30,8 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
+from . import epdseq
 
 # Display resolution
 EPD_WIDTH       = 800
@@ -45,12 +47,14 @@ class EPD:
         self.cs_pin = epdconfig.CS_PIN
         self.width = EPD_WIDTH
         self.height = EPD_HEIGHT
+        self.sequence = None    # (sequence, level) epdseq ran last
+        self.asleep = None      # epdseq level of the last standby/sleep
     
     Voltage_Frame_7IN5_V2 = [
 	0x6, 0x3F, 0x3F, 0x11, 0x24, 0x7, 0x17,
     ]
 
-    LUT_VCOM_7IN5_V2 = [	
+    LUT_VCOM_7IN5_V2 = bytes([	
         0x0,	0xF,	0xF,	0x0,	0x0,	0x1,	
         0x0,	0xF,	0x1,	0xF,	0x1,	0x2,	
         0x0,	0xF,	0xF,	0x0,	0x0,	0x1,	
@@ -58,9 +62,9 @@ class EPD:
         0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
         0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
         0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
-    ]	
+    ])	
 
-    LUT_WW_7IN5_V2 = [
+    LUT_WW_7IN5_V2 = bytes([
         0x10,	0xF,	0xF,	0x0,	0x0,	0x1,	
         0x84,	0xF,	0x1,	0xF,	0x1,	0x2,	
         0x20,	0xF,	0xF,	0x0,	0x0,	0x1,	
@@ -68,9 +72,9 @@ class EPD:
         0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
         0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
         0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
-    ]
+    ])
 
-    LUT_BW_7IN5_V2 = [	
+    LUT_BW_7IN5_V2 = bytes([	
         0x10,	0xF,	0xF,	0x0,	0x0,	0x1,	
         0x84,	0xF,	0x1,	0xF,	0x1,	0x2,	
         0x20,	0xF,	0xF,	0x0,	0x0,	0x1,	
@@ -78,9 +82,9 @@ class EPD:
         0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
         0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
         0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
-    ]
+    ])
 
-    LUT_WB_7IN5_V2 = [
+    LUT_WB_7IN5_V2 = bytes([
         0x80,	0xF,	0xF,	0x0,	0x0,	0x1,	
         0x84,	0xF,	0x1,	0xF,	0x1,	0x2,	
         0x40,	0xF,	0xF,	0x0,	0x0,	0x1,	
@@ -88,9 +92,9 @@ class EPD:
         0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
         0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
         0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
-    ]
+    ])
 
-    LUT_BB_7IN5_V2 = [
+    LUT_BB_7IN5_V2 = bytes([
         0x80,	0xF,	0xF,	0x0,	0x0,	0x1,	
         0x84,	0xF,	0x1,	0xF,	0x1,	0x2,	
         0x40,	0xF,	0xF,	0x0,	0x0,	0x1,	
@@ -98,7 +102,26 @@ class EPD:
         0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
         0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
         0x0,	0x0,	0x0,	0x0,	0x0,	0x0,	
-    ]
+    ])
+
+    # init(), as data for epdseq. Power off (standby) only loses the LIGHT
+    # steps, deep sleep loses everything including frame RAM.
+    INIT = (
+        epdseq.reset(),
+        epdseq.command(0x01, [0x17] + Voltage_Frame_7IN5_V2[6:7] + Voltage_Frame_7IN5_V2[1:4]),   # power setting: internal, VGH&VGL, VSH, VSL, VSHR
+        epdseq.command(0x82, Voltage_Frame_7IN5_V2[4:5]),   # VCOM DC Setting
+        epdseq.command(0x06, [0x27, 0x27, 0x2F, 0x17]),   # Booster Setting
+        epdseq.command(0x30, Voltage_Frame_7IN5_V2[0:1]),   # OSC Setting; 3C=50Hz, 3A=100HZ
+        epdseq.command(0x04, level=epdseq.LIGHT),   # POWER ON
+        epdseq.delay(100, level=epdseq.LIGHT),
+        epdseq.busy(level=epdseq.LIGHT),
+        epdseq.command(0x00, [0x3F]),   # PANNEL SETTING
+        epdseq.command(0x61, [0x03, 0x20, 0x01, 0xE0]),   # tres: source 800, gate 480
+        epdseq.command(0x15, [0x00]),
+        epdseq.command(0x50, [0x10, 0x07]),   # VCOM AND DATA INTERVAL SETTING
+        epdseq.command(0x60, [0x22]),   # TCON SETTING
+        epdseq.command(0x65, [0x00, 0x00, 0x00, 0x00]),   # Resolution setting, 800*480
+    )
 
     # Hardware reset
     def reset(self):
@@ -115,6 +138,21 @@ class EPD:
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
 
+    '''
+    function :send a command and its parameters in one transaction
+    parameter:
+     command : Command register
+     data : parameter bytes, CS stays low and they go in one transfer
+    '''
+    def cmd(self, command, data=b''):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
@@ -130,149 +168,76 @@ class EPD:
     def ReadBusy(self):
         logger.debug("e-Paper busy")
         self.send_command(0x71)
-        busy = epdconfig.digital_read(self.busy_pin)
-        while(busy == 0):
-            self.send_command(0x71)
-            busy = epdconfig.digital_read(self.busy_pin)
+        epdconfig.wait_busy(self.busy_pin, 1)      # 0: busy, 1: idle
         epdconfig.delay_ms(20)
         logger.debug("e-Paper busy release")
         
     def SetLut(self, lut_vcom, lut_ww, lut_bw, lut_wb, lut_bb):
-        self.send_command(0x20)
-        for count in range(0, 42):
-            self.send_data(lut_vcom[count])
+        self.cmd(0x20, lut_vcom[:42])
 
-        self.send_command(0x21)
-        for count in range(0, 42):
-            self.send_data(lut_ww[count])
+        self.cmd(0x21, lut_ww[:42])
 
-        self.send_command(0x22)
-        for count in range(0, 42):
-            self.send_data(lut_bw[count])
+        self.cmd(0x22, lut_bw[:42])
 
-        self.send_command(0x23)
-        for count in range(0, 42):
-            self.send_data(lut_wb[count])
+        self.cmd(0x23, lut_wb[:42])
 
-        self.send_command(0x24)
-        for count in range(0, 42):
-            self.send_data(lut_bb[count])
+        self.cmd(0x24, lut_bb[:42])
 
     def init(self):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
-        # EPD hardware init start
-        self.reset()
-        
-        # self.send_command(0x06)     # btst
-        # self.send_data(0x17)
-        # self.send_data(0x17)
-        # self.send_data(0x28)        # If an exception is displayed, try using 0x38
-        # self.send_data(0x17)
-        
-        # self.send_command(0x01)   #POWER SETTING
-        # self.send_data(0x07)
-        # self.send_data(0x07)      #VGH=20V,VGL=-20V
-        # self.send_data(0x3f)		#VDH=15V
-        # self.send_data(0x3f)		#VDL=-15V
-
-        self.send_command(0x01)     # power setting
-        self.send_data(0x17)        # 1-0=11: internal power
-        self.send_data(self.Voltage_Frame_7IN5_V2[6])   # VGH&VGL
-        self.send_data(self.Voltage_Frame_7IN5_V2[1])   # VSH
-        self.send_data(self.Voltage_Frame_7IN5_V2[2])   # VSL
-        self.send_data(self.Voltage_Frame_7IN5_V2[3])   # VSHR
-        
-        self.send_command(0x82)     # VCOM DC Setting
-        self.send_data(self.Voltage_Frame_7IN5_V2[4])   # VCOM
-
-        self.send_command(0x06)     # Booster Setting
-        self.send_data(0x27)
-        self.send_data(0x27)
-        self.send_data(0x2F)
-        self.send_data(0x17)
-        
-        self.send_command(0x30)     # OSC Setting
-        self.send_data(self.Voltage_Frame_7IN5_V2[0])   # 3C=50Hz, 3A=100HZ
-
-        self.send_command(0x04)     # POWER ON
-        epdconfig.delay_ms(100)
-        self.ReadBusy()
-
-        self.send_command(0X00)     # PANNEL SETTING
-        self.send_data(0x3F)        # KW-3f KWR-2F BWROTP-0f BWOTP-1f
-
-        self.send_command(0x61)     # tres
-        self.send_data(0x03)        # source 800
-        self.send_data(0x20)
-        self.send_data(0x01)        # gate 480
-        self.send_data(0xE0)
-
-        self.send_command(0X15)
-        self.send_data(0x00)
-
-        self.send_command(0X50)     # VCOM AND DATA INTERVAL SETTING
-        self.send_data(0x10)
-        self.send_data(0x07)
-
-        self.send_command(0X60)     # TCON SETTING
-        self.send_data(0x22)
-
-        self.send_command(0x65)     # Resolution setting
-        self.send_data(0x00)
-        self.send_data(0x00)        # 800*480
-        self.send_data(0x00)
-        self.send_data(0x00)
-
+        epdseq.run(self, self.INIT)
+        self.asleep = None
         self.SetLut(self.LUT_VCOM_7IN5_V2, self.LUT_WW_7IN5_V2, self.LUT_BW_7IN5_V2, self.LUT_WB_7IN5_V2, self.LUT_BB_7IN5_V2)
-        # EPD hardware init end
         return 0
 
-    def getbuffer(self, image):
-        img = image
-        imwidth, imheight = img.size
-        if(imwidth == self.width and imheight == self.height):
-            img = img.convert('1')
-        elif(imwidth == self.height and imheight == self.width):
-            # image has correct dimensions, but needs to be rotated
-            img = img.rotate(90, expand=True).convert('1')
-        else:
+    def getbuffer(self, image, orientation=None):
+        buf = epdbuffer.pack(image, self.width, self.height, orientation)
+        if buf is None:
             logger.warning("Wrong image dimensions: must be " + str(self.width) + "x" + str(self.height))
             # return a blank buffer
-            return [0x00] * (int(self.width/8) * self.height)
-
-        buf = bytearray(img.tobytes('raw'))
-        # The bytes need to be inverted, because in the PIL world 0=black and 1=white, but
-        # in the e-paper world 0=white and 1=black.
-        for i in range(len(buf)):
-            buf[i] ^= 0xFF
-        return buf
+            return epdbuffer.fill(0x00, int(self.width/8) * self.height)
+        return epdbuffer.invert(buf)
 
     def display(self, image):
-        self.send_command(0x13)
-        self.send_data2(image)
+        self.cmd(0x13, image)
 
         self.send_command(0x12)
         epdconfig.delay_ms(100)
         self.ReadBusy()
 
     def Clear(self):
-        buf = [0x00] * (int(self.width/8) * self.height)
-        self.send_command(0x10)
-        self.send_data2(buf)
-        self.send_command(0x13)
-        self.send_data2(buf)
+        buf = epdbuffer.fill(0x00, int(self.width/8) * self.height)
+        self.cmd(0x10, buf)
+        self.cmd(0x13, buf)
         self.send_command(0x12)
         epdconfig.delay_ms(100)
         self.ReadBusy()
 
+    # Power off but keep the registers, wake() only powers back on
+    def standby(self):
+        self.send_command(0x02) # POWER_OFF
+        self.ReadBusy()
+        self.asleep = epdseq.LIGHT
+
+    # Come back from standby() or sleep(), replaying what that level lost
+    def wake(self):
+        level = self.asleep or epdseq.LIGHT
+        if level == epdseq.DEEP and epdconfig.module_init(__name__) != 0:
+            return -1
+        epdseq.run(self, self.INIT, level)
+        self.asleep = None
+        if level == epdseq.DEEP:
+            self.SetLut(self.LUT_VCOM_7IN5_V2, self.LUT_WW_7IN5_V2, self.LUT_BW_7IN5_V2, self.LUT_WB_7IN5_V2, self.LUT_BB_7IN5_V2)
+        return 0
+
     def sleep(self):
         self.send_command(0x02) # POWER_OFF
         self.ReadBusy()
         
-        self.send_command(0x07) # DEEP_SLEEP
-        self.send_data(0XA5)
+        self.cmd(0x07, [0XA5])  # DEEP_SLEEP
+        self.asleep = epdseq.DEEP
         
-        epdconfig.delay_ms(2000)
+        epdconfig.delay_ms(epdseq.SLEEP_SETTLE_MS)
         epdconfig.module_exit()
 ### END OF FILE ###
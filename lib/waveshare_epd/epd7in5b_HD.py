@@ -30,6 +30,7 @@
 
 import logging
 from . import epdconfig
+from . import epdbuffer
 
 # Display resolution
 EPD_WIDTH       = 880
@@ -61,6 +62,21 @@ class EPD:
         epdconfig.spi_writebyte([command])
         epdconfig.digital_write(self.cs_pin, 1)
 
+    '''
+    function :send a command and its parameters in one transaction
+    parameter:
+     command : Command register
+     data : parameter bytes, CS stays low and they go in one transfer
+    '''
+    def cmd(self, command, data=b''):
+        epdconfig.digital_write(self.dc_pin, 0)
+        epdconfig.digital_write(self.cs_pin, 0)
+        epdconfig.spi_writebyte([command])
+        if data:
+            epdconfig.digital_write(self.dc_pin, 1)
+            epdconfig.spi_writebyte2(data)
+        epdconfig.digital_write(self.cs_pin, 1)
+
     def send_data(self, data):
         epdconfig.digital_write(self.dc_pin, 1)
         epdconfig.digital_write(self.cs_pin, 0)
@@ -69,13 +85,11 @@ class EPD:
         
     def ReadBusy(self):
         logger.debug("e-Paper busy")
-        busy = epdconfig.digital_read(self.busy_pin)
-        while(busy == 1):
-            busy = epdconfig.digital_read(self.busy_pin)
+        epdconfig.wait_busy(self.busy_pin, 0)      # 0: idle, 1: busy
         epdconfig.delay_ms(200)
             
     def init(self):
-        if (epdconfig.module_init() != 0):
+        if (epdconfig.module_init(__name__) != 0):
             return -1
             
         self.reset()
@@ -83,105 +97,66 @@ class EPD:
         self.send_command(0x12); 		  #SWRESET
         self.ReadBusy();        #waiting for the electronic paper IC to release the idle signal
 
-        self.send_command(0x46);  # Auto Write RAM
-        self.send_data(0xF7);
+        self.cmd(0x46, [0xF7])  # Auto Write RAM
         self.ReadBusy();        #waiting for the electronic paper IC to release the idle signal
 
-        self.send_command(0x47);  # Auto Write RAM
-        self.send_data(0xF7);
+        self.cmd(0x47, [0xF7])  # Auto Write RAM
         self.ReadBusy();        #waiting for the electronic paper IC to release the idle signal
 
-        self.send_command(0x0C);  # Soft start setting
-        self.send_data(0xAE);
-        self.send_data(0xC7);
-        self.send_data(0xC3);
-        self.send_data(0xC0);
-        self.send_data(0x40);   
-
-        self.send_command(0x01);  # Set MUX as 527
-        self.send_data(0xAF);
-        self.send_data(0x02);
-        self.send_data(0x01);
-
-        self.send_command(0x11);  # Data entry mode
-        self.send_data(0x01);
-
-        self.send_command(0x44);
-        self.send_data(0x00); # RAM x address start at 0
-        self.send_data(0x00);
-        self.send_data(0x6F); # RAM x address end at 36Fh -> 879
-        self.send_data(0x03);
-        self.send_command(0x45);
-        self.send_data(0xAF); # RAM y address start at 20Fh;
-        self.send_data(0x02);
-        self.send_data(0x00); # RAM y address end at 00h;
-        self.send_data(0x00);
-
-        self.send_command(0x3C); # VBD
-        self.send_data(0x01); # LUT1, for white
-
-        self.send_command(0x18);
-        self.send_data(0X80);
-        self.send_command(0x22);
-        self.send_data(0XB1);	#Load Temperature and waveform setting.
+        self.cmd(0x0C, [0xAE, 0xC7, 0xC3, 0xC0, 0x40])  # Soft start setting
+
+        self.cmd(0x01, [0xAF, 0x02, 0x01])  # Set MUX as 527
+
+        self.cmd(0x11, [0x01])  # Data entry mode
+
+        self.cmd(0x44, [
+            0x00,  # RAM x address start at 0
+            0x00,
+            0x6F,  # RAM x address end at 36Fh -> 879
+            0x03,
+        ])
+        self.cmd(0x45, [
+            0xAF,  # RAM y address start at 20Fh;
+            0x02,
+            0x00,  # RAM y address end at 00h;
+            0x00,
+        ])
+
+        self.cmd(0x3C, [0x01])  # VBD; LUT1, for white
+
+        self.cmd(0x18, [0X80])
+        self.cmd(0x22, [0XB1])  # Load Temperature and waveform setting.
         self.send_command(0x20);
         self.ReadBusy();        #waiting for the electronic paper IC to release the idle signal
 
-        self.send_command(0x4E); 
-        self.send_data(0x00);
-        self.send_data(0x00);
-        self.send_command(0x4F); 
-        self.send_data(0xAF);
-        self.send_data(0x02);
+        self.cmd(0x4E, [0x00, 0x00])
+        self.cmd(0x4F, [0xAF, 0x02])
         
         return 0
 
-    def getbuffer(self, image):
-        # logger.debug("bufsiz = ",int(self.width/8) * self.height)
-        buf = [0xFF] * (int(self.width/8) * self.height)
-        image_monocolor = image.convert('1')
-        imwidth, imheight = image_monocolor.size
-        pixels = image_monocolor.load()
-        logger.debug('imwidth = %d  imheight =  %d ',imwidth, imheight)
-        if(imwidth == self.width and imheight == self.height):
-            logger.debug("Horizontal")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    # Set the bits for the column of pixels at the current position.
-                    if pixels[x, y] == 0:
-                        buf[int((x + y * self.width) / 8)] &= ~(0x80 >> (x % 8))
-        elif(imwidth == self.height and imheight == self.width):
-            logger.debug("Vertical")
-            for y in range(imheight):
-                for x in range(imwidth):
-                    newx = y
-                    newy = self.height - x - 1
-                    if pixels[x, y] == 0:
-                        buf[int((newx + newy*self.width) / 8)] &= ~(0x80 >> (y % 8))
+    def getbuffer(self, image, orientation=None):
+        buf = epdbuffer.pack(image, self.width, self.height, orientation)
+        if buf is None:
+            # wrong size, send a blank frame
+            return epdbuffer.fill(0xFF, int(self.width/8) * self.height)
         return buf
 
     def display(self, imageblack, imagered):
-        self.send_command(0x4F); 
-        self.send_data(0xAf);
+        self.cmd(0x4F, [0xAf])
         
-        self.send_command(0x24)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(imageblack[i]);
+        length = int(self.width * self.height / 8)
+        self.cmd(0x24, imageblack[:length])
         
+        # the red plane goes out inverted, masked to bytes
+        self.cmd(0x26, epdbuffer.invert(imagered[:length]))
         
-        self.send_command(0x26)
-        for i in range(0, int(self.width * self.height / 8)):
-            self.send_data(~imagered[i]);
-        
-        self.send_command(0x22);
-        self.send_data(0xC7);    #Load LUT from MCU(0x32)
+        self.cmd(0x22, [0xC7])  # Load LUT from MCU(0x32)
         self.send_command(0x20);
         epdconfig.delay_ms(200);      #!!!The delay here is necessary, 200uS at least!!!     
         self.ReadBusy();
         
     def Clear(self):
-        self.send_command(0x4F); 
-        self.send_data(0xAf);
+        self.cmd(0x4F, [0xAf])
         
         self.send_command(0x24)
         for i in range(0, int(self.width * self.height / 8)):
@@ -192,15 +167,13 @@ class EPD:
         for i in range(0, int(self.width * self.height / 8)):
             self.send_data(0x00);
         
-        self.send_command(0x22);
-        self.send_data(0xC7);    #Load LUT from MCU(0x32)
+        self.cmd(0x22, [0xC7])  # Load LUT from MCU(0x32)
         self.send_command(0x20);
         epdconfig.delay_ms(200);      #!!!The delay here is necessary, 200uS at least!!!     
         self.ReadBusy();
 
     def sleep(self):
-        self.send_command(0x10);  	#deep sleep
-        self.send_data(0x01);
+        self.cmd(0x10, [0x01])  # deep sleep
         
         epdconfig.delay_ms(2000)
         epdconfig.module_exit()
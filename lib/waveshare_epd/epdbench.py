@@ -0,0 +1,308 @@
+# *****************************************************************************
+# * | File        :	  epdbench.py
+# * | Function    :   Driver benchmark on the virtual backend
+# * | Info        :
+# *----------------
+# * | Info        :
+# * Runs every driver's frame paths against the virtual panel and measures
+# * each operation: getbuffer(), getbuffer_4Gray(), display() and
+# * display_4Gray(), for a text-heavy, a photo and a solid image, drawn
+# * portrait and landscape:
+# *
+# *   python -m lib.waveshare_epd.epdbench --save bench.json
+# *   python -m lib.waveshare_epd.epdbench --compare bench.json
+# *   python -m lib.waveshare_epd.epdbench epd2in13_V3 epd7in5_V2
+# *
+# * Per operation it records the fastest of --repeat runs in ms of CPU
+# * (BUSY and transfers cost nothing at EPD_VIRTUAL_TIMESCALE 0), the SPI
+# * bytes and calls and their modelled transfer ms, and the peak memory
+# * allocated. --save stores the results as a JSON baseline, --compare
+# * reports what got slower or bigger since one. Operations over LIMITS
+# * are listed as too slow for live use. BUSY follows the controller
+# * epdvirtual.PANELS models each panel on, shown in the 'as' column and
+# * saved under 'controllers'.
+# ******************************************************************************
+
+import argparse
+import glob
+import inspect
+import json
+import logging
+import os
+import platform
+import time
+import tracemalloc
+
+from . import epdconfig
+from . import epdvirtual
+from . import load
+
+logger = logging.getLogger(__name__)
+
+REPEAT = 3
+IMAGES = ('text', 'photo', 'solid')
+ORIENTATIONS = ('portrait', 'landscape')
+
+# what an operation may cost and still be used on a live rotation
+LIMITS = {
+    'ms': 100.0,        # CPU per operation
+    'spi_calls': 200,   # per display, more means byte-at-a-time writes
+    'peak_kb': 4096,    # allocated on top of what was there before
+}
+# a compared result counts as a regression past these
+SLOWER = 1.25           # times the baseline ms ...
+SLOWER_MS = 1.0         # ... and at least this much slower
+BIGGER_KB = 64          # more peak_kb than the baseline
+
+
+def controller(panel):
+    """The controller epdvirtual models BUSY and timing on for a panel."""
+    return epdvirtual.PANELS.get(panel, epdvirtual.DEFAULT_PANEL)[0]
+
+
+def drivers():
+    here = os.path.dirname(os.path.abspath(__file__))
+    return sorted(os.path.basename(path)[:-3] for path in glob.glob(os.path.join(here, 'epd[0-9]*.py')))
+
+
+def image(kind, size):
+    """A synthetic test image: text-heavy, a photo to dither, or solid."""
+    from PIL import Image, ImageDraw, ImageFont
+
+    width, height = size
+    if kind == 'solid':
+        return Image.new('1', size, 0)
+    if kind == 'text':
+        picture = Image.new('1', size, 255)
+        draw = ImageDraw.Draw(picture)
+        font = ImageFont.load_default()
+        for y in range(0, height, 12):
+            draw.text((2, y), 'Ashland & Division 9 min 72 North %d' % y, font=font, fill=0)
+        return picture
+    # smooth gradients and fine detail, the same every run, in colour so
+    # the colour panels get something to dither as well
+    gradient = Image.linear_gradient('L').resize(size)
+    radial = Image.radial_gradient('L').resize(size)
+    detail = Image.effect_mandelbrot(size, (-2.0, -1.2, 0.8, 1.2), 64)
+    return Image.merge('RGB', (gradient, radial, detail))
+
+
+def _init(epd):
+    init = getattr(epd, 'init', None) or getattr(epd, 'Init')
+    if not inspect.signature(init).parameters:
+        return init()
+    for name in ('lut_full_update', 'FULL_UPDATE'):
+        if hasattr(epd, name):
+            return init(getattr(epd, name))
+    # init(mode), init(isPartial), init(update): 0 is the full refresh
+    return init(0)
+
+
+def _planes(method):
+    return len([p for p in inspect.signature(method).parameters if p != 'wait'])
+
+
+class Bench:
+    def __init__(self, panel, repeat=REPEAT):
+        self.panel = panel
+        self.repeat = repeat
+        self.backend = epdconfig.use('virtual', panel=panel, time_scale=0)
+        self.epd = load(panel).EPD()
+        self.calls = 0
+        self.bytes = 0
+        self.spi_ms = 0.0
+
+    def _observe(self, stage, seconds, nbytes):
+        if stage == 'spi':
+            self.calls += 1
+            self.bytes += nbytes
+            self.spi_ms += seconds * 1000.0
+
+    def measure(self, func, *args):
+        times = []
+        for _ in range(self.repeat):
+            self.calls, self.bytes, self.spi_ms = 0, 0, 0.0
+            start = time.perf_counter()
+            result = func(*args)
+            times.append((time.perf_counter() - start) * 1000.0)
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            func(*args)
+            peak = tracemalloc.get_traced_memory()[1] - before
+        finally:
+            tracemalloc.stop()
+        return result, {'ms': round(min(times), 3), 'bytes': self.bytes, 'spi_calls': self.calls,
+                        'spi_ms': round(self.spi_ms, 3), 'peak_kb': round(peak / 1024.0, 1)}
+
+    def run(self, images=IMAGES):
+        epdconfig.observe(self._observe)
+        results = {}
+        try:
+            _init(self.epd)
+            for kind in images:
+                for orientation in ORIENTATIONS:
+                    size = (self.epd.width, self.epd.height)
+                    if orientation == 'landscape':
+                        size = size[::-1]
+                    picture = image(kind, size)
+                    self._frame(results, '%s %s' % (kind, orientation), picture)
+        finally:
+            epdconfig.observe(None)
+            epdconfig.module_exit()
+        return results
+
+    def _frame(self, results, case, picture):
+        epd = self.epd
+        # (pack, show, init) for the 1 bpp and the 4 grey path; the grey
+        # one needs its own init before display_4Gray()
+        for pack, show, init in (('getbuffer', 'display', None),
+                                 ('getbuffer_4Gray', 'display_4Gray',
+                                  getattr(epd, 'init_4Gray', None) or getattr(epd, 'Init_4Gray', None))):
+            if not hasattr(epd, pack):
+                continue
+            op = pack
+            try:
+                buf, results['%s %s' % (pack, case)] = self.measure(getattr(epd, pack), picture)
+                if not hasattr(epd, show):
+                    continue
+                op = show
+                if init is not None:
+                    init()
+                planes = (buf,) * _planes(getattr(epd, show))
+                _, results['%s %s' % (show, case)] = self.measure(getattr(epd, show), *planes)
+                if init is not None:
+                    _init(epd)
+            except Exception as e:
+                logger.debug('%s %s %s failed', self.panel, op, case, exc_info=True)
+                results['%s %s' % (op, case)] = {'error': '%s: %s' % (type(e).__name__, e)}
+
+
+def run(panels, repeat=REPEAT, images=IMAGES):
+    results = {}
+    for panel in panels:
+        try:
+            results[panel] = Bench(panel, repeat).run(images)
+        except Exception as e:
+            results[panel] = {'error': '%s: %s' % (type(e).__name__, e)}
+    return results
+
+
+def over_limits(results):
+    """(panel, operation, reason) for each result too slow for live use."""
+    found = []
+    for panel, operations in sorted(results.items()):
+        if _failed(operations):
+            continue
+        for operation, r in sorted(operations.items()):
+            if 'error' in r:
+                continue
+            reasons = []
+            if r['ms'] > LIMITS['ms']:
+                reasons.append('%.1f ms CPU' % r['ms'])
+            if r['spi_calls'] > LIMITS['spi_calls']:
+                reasons.append('%d SPI calls' % r['spi_calls'])
+            if r['peak_kb'] > LIMITS['peak_kb']:
+                reasons.append('%.0f KB allocated' % r['peak_kb'])
+            if reasons:
+                found.append((panel, operation, ', '.join(reasons)))
+    return found
+
+
+def _failed(operations):
+    return isinstance(operations.get('error'), str)
+
+
+def compare(baseline, results):
+    """(panel, operation, change) for what got worse, appeared or went."""
+    found = []
+    for panel in sorted(set(baseline) | set(results)):
+        old, new = baseline.get(panel), results.get(panel)
+        if old is None or new is None:
+            found.append((panel, '', 'new' if old is None else 'missing'))
+            continue
+        if _failed(new) or _failed(old):
+            if _failed(new) and not _failed(old):
+                found.append((panel, '', 'now fails: ' + new['error']))
+            elif _failed(old) and not _failed(new):
+                found.append((panel, '', 'fixed'))
+            continue
+        for operation in sorted(set(old) | set(new)):
+            a, b = old.get(operation), new.get(operation)
+            if a is None or b is None:
+                found.append((panel, operation, 'new' if a is None else 'missing'))
+            elif 'error' in b:
+                if 'error' not in a:
+                    found.append((panel, operation, 'now fails: ' + b['error']))
+            elif 'error' in a:
+                found.append((panel, operation, 'fixed'))
+            else:
+                if b['ms'] > a['ms'] * SLOWER and b['ms'] - a['ms'] > SLOWER_MS:
+                    found.append((panel, operation, 'ms %.2f -> %.2f' % (a['ms'], b['ms'])))
+                for key in ('bytes', 'spi_calls'):
+                    if b[key] != a[key]:
+                        found.append((panel, operation, '%s %d -> %d' % (key, a[key], b[key])))
+                if b['peak_kb'] - a['peak_kb'] > BIGGER_KB:
+                    found.append((panel, operation, 'peak_kb %.0f -> %.0f' % (a['peak_kb'], b['peak_kb'])))
+    return found
+
+
+def report(results):
+    print('%-16s %-8s %-30s %9s %8s %6s %9s %9s' % ('panel', 'as', 'operation', 'ms', 'bytes', 'calls',
+                                                    'spi ms', 'peak KB'))
+    for panel, operations in sorted(results.items()):
+        modelled = controller(panel)
+        if _failed(operations):
+            print('%-16s %-8s %s' % (panel, modelled, operations['error']))
+            continue
+        for operation, r in sorted(operations.items()):
+            if 'error' in r:
+                print('%-16s %-8s %-30s %s' % (panel, modelled, operation, r['error']))
+            else:
+                print('%-16s %-8s %-30s %9.2f %8d %6d %9.2f %9.1f' % (panel, modelled, operation, r['ms'],
+                                                                      r['bytes'], r['spi_calls'], r['spi_ms'],
+                                                                      r['peak_kb']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the e-Paper drivers on the virtual backend')
+    parser.add_argument('panels', nargs='*', help='driver module names, default: all')
+    parser.add_argument('--images', nargs='+', choices=IMAGES, default=IMAGES)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--save', help='store the results as a JSON baseline')
+    parser.add_argument('--compare', help='JSON baseline to report regressions against')
+    parser.add_argument('--quiet', action='store_true', help='no per-operation table')
+    args = parser.parse_args(argv)
+
+    results = run(args.panels or drivers(), args.repeat, args.images)
+    if not args.quiet:
+        report(results)
+
+    slow = over_limits(results)
+    if slow:
+        print('\nToo slow for live use (limits: %s):' % ', '.join('%s %s' % item for item in LIMITS.items()))
+        for panel, operation, reason in slow:
+            print('  %-16s %-30s %s' % (panel, operation, reason))
+
+    status = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        changes = compare(baseline, results)
+        print('\nAgainst %s: %s' % (args.compare, 'no regressions' if not changes else '%d changes' % len(changes)))
+        for panel, operation, change in changes:
+            print('  %-16s %-30s %s' % (panel, operation, change))
+        status = 1 if changes else 0
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'repeat': args.repeat, 'results': results,
+                       'controllers': {panel: controller(panel) for panel in results}},
+                      f, indent=1, sort_keys=True)
+        print('\nsaved to %s' % args.save)
+    return status
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
+
+### END OF FILE ###
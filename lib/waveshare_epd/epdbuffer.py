@@ -0,0 +1,120 @@
+# *****************************************************************************
+# * | File        :	  epdbuffer.py
+# * | Function    :   Frame buffer helpers shared by the e-Paper drivers
+# * | Info        :
+# *----------------
+# * | Info        :
+# * Frame data is handled as bytes-like objects, never as lists of ints:
+# *  - solid fills come from fill(), a cached immutable bytes object, so
+# *    Clear() and the "old data" planes allocate nothing per call
+# *  - getbuffer() returns bytes or a bytearray (or a cached fill when the
+# *    image has the wrong size); treat it as read-only
+# *
+# * Buffers passed without copying:
+# *  - send_data2() -> epdconfig.spi_writebyte2() hands the object straight
+# *    to the SPI backend; bytes, bytearray and memoryview (including
+# *    slices of a memoryview) are streamed as they are
+# *  - display()/displayPartial()/displayPartBaseImage() and friends pass
+# *    the buffer on to send_data2() unchanged, so a memoryview over a
+# *    larger frame can be sent without building a new one
+# *  - invert() returns a new buffer; it is a single C-level pass and is
+# *    only used where the panel wants the opposite polarity
+# *
+# * Orientation is how far the drawn image is turned counter-clockwise onto
+# * the panel: 0 and 180 take width x height images, 90 and 270 take
+# * height x width ones. None picks 0 or 90 from the image size, which is
+# * what the drivers always did. The work for each (panel, orientation) is
+# * planned once by rotation_plan() and then done by PIL/bytes in C.
+# ******************************************************************************
+
+import collections
+import functools
+
+# byte -> byte with all bits flipped, used with bytes.translate()
+_INVERT = bytes(0xFF ^ i for i in range(256))
+# byte -> byte with the bit order reversed, MSB <-> LSB
+_REVERSE = bytes(int('{:08b}'.format(i)[::-1], 2) for i in range(256))
+
+# PIL Image.Transpose values, so this module does not import PIL
+_ROTATE_90 = 2
+_ROTATE_180 = 3
+_ROTATE_270 = 4
+
+ORIENTATIONS = (0, 90, 180, 270)
+
+# size     : (width, height) the drawn image must have
+# transpose: PIL transpose method onto the panel layout, None for 0
+# flip     : a packed 1 bpp frame can be turned by reversing its bytes and
+#            their bits instead of transposing the image
+RotationPlan = collections.namedtuple('RotationPlan', 'size transpose flip')
+
+
+@functools.lru_cache(maxsize=32)
+def fill(color, length):
+    """Immutable frame of length bytes, all set to color (cached)."""
+    return bytes((color & 0xFF,)) * int(length)
+
+
+def invert(data):
+    """Return data with every bit flipped, as bytes or bytearray."""
+    if not isinstance(data, (bytes, bytearray)):
+        data = bytes(data)
+    return data.translate(_INVERT)
+
+
+@functools.lru_cache(maxsize=32)
+def rotation_plan(width, height, orientation):
+    """Cached RotationPlan for a width x height panel."""
+    if orientation == 0:
+        return RotationPlan((width, height), None, False)
+    if orientation == 90:
+        return RotationPlan((height, width), _ROTATE_90, False)
+    if orientation == 180:
+        # rows without padding bits reverse cleanly as a byte stream
+        return RotationPlan((width, height), _ROTATE_180, width % 8 == 0)
+    if orientation == 270:
+        return RotationPlan((height, width), _ROTATE_270, False)
+    raise ValueError("orientation must be one of %s" % (ORIENTATIONS,))
+
+
+def _plan_for(image, width, height, orientation):
+    if orientation is None:
+        if image.size == (width, height):
+            orientation = 0
+        elif image.size == (height, width):
+            orientation = 90
+        else:
+            return None
+    plan = rotation_plan(width, height, orientation)
+    if image.size != plan.size:
+        return None
+    return plan
+
+
+def orient(image, width, height, orientation=None):
+    """image turned onto the panel layout, None if its size does not fit."""
+    plan = _plan_for(image, width, height, orientation)
+    if plan is None:
+        return None
+    if plan.transpose is None:
+        return image
+    return image.transpose(plan.transpose)
+
+
+def pack(image, width, height, orientation=None):
+    """1 bpp frame, MSB first, 1 = white, rows padded to whole bytes.
+
+    Returns None if the image size does not fit the orientation.
+    """
+    plan = _plan_for(image, width, height, orientation)
+    if plan is None:
+        return None
+    if image.mode != '1':
+        image = image.convert('1')
+    if plan.flip:
+        return image.tobytes('raw')[::-1].translate(_REVERSE)
+    if plan.transpose is not None:
+        image = image.transpose(plan.transpose)
+    return image.tobytes('raw')
+
+### END OF FILE ###
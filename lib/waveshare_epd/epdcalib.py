@@ -0,0 +1,159 @@
+# *****************************************************************************
+# * | File        :	  epdcalib.py
+# * | Function    :   SPI clock and chunk size calibration
+# * | Info        :
+# *----------------
+# * | Info        :
+# * Finds the fastest SPI settings a panel takes and stores them as its
+# * transfer profile, which epdconfig.module_init() loads from then on:
+# *
+# *   python -m lib.waveshare_epd.epdcalib epd7in5_V2 --save
+# *
+# * Known patterns are written to the controller's frame RAM (nothing is
+# * refreshed) at each clock rate, then at the fastest good rate across
+# * chunk sizes. The virtual backend hands back what it received, so
+# * every rate is verified. On real panels the data cannot be read back,
+# * so a rate only counts as good when it is also faster than the one
+# * before it (spidev rounds the clock to what the SoC can make). Show a
+# * test image after calibrating a real panel.
+# ******************************************************************************
+
+import argparse
+import collections
+import logging
+import time
+
+from . import epdconfig
+from . import epdemu
+from . import epdvirtual
+from . import load
+
+logger = logging.getLogger(__name__)
+
+SPEEDS = (2000000, 4000000, 8000000, 10000000, 16000000, 20000000, 32000000)
+CHUNKS = (0, 1024, 2048, 4096)
+REPEAT = 3
+
+# frame RAM write command per controller family
+RAM_COMMAND = {'ssd': 0x24, 'uc': 0x13}
+
+# verified is True or False with read-back, None without
+Result = collections.namedtuple('Result', 'max_speed_hz chunk ms verified')
+
+
+def patterns(length):
+    # every bit pattern a stuck or slipped bit would show up in
+    counting = bytes(range(256)) * (length // 256 + 1)
+    return [b'\x00' * length, b'\xff' * length, b'\xaa\x55' * (length // 2),
+            counting[:length]]
+
+
+def ram_command(panel):
+    controller = epdvirtual.PANELS.get(panel, epdvirtual.DEFAULT_PANEL)[0]
+    return RAM_COMMAND[epdemu.CONTROLLERS[controller].family]
+
+
+class Calibration:
+    def __init__(self, panel, repeat=REPEAT):
+        self.panel = panel
+        self.repeat = repeat
+        self.epd = load(panel).EPD()
+        self.length = (self.epd.width + 7) // 8 * self.epd.height
+        self.command = ram_command(panel)
+        self.backend = None
+
+    def _now_ms(self):
+        # the virtual backend models transfer time, use its clock
+        if hasattr(self.backend, 'now_ms'):
+            return self.backend.now_ms()
+        return time.perf_counter() * 1000.0
+
+    def _send(self, data):
+        self.epd.send_command(self.command)
+        epdconfig.digital_write(self.epd.dc_pin, 1)
+        epdconfig.digital_write(self.epd.cs_pin, 0)
+        start = self._now_ms()
+        epdconfig.spi_writebyte2(data)
+        elapsed = self._now_ms() - start
+        epdconfig.digital_write(self.epd.cs_pin, 1)
+        return elapsed
+
+    def measure(self, transfer):
+        self.backend.set_transfer(transfer)
+        read_back = getattr(self.backend, 'read_back', None)
+        verified = None if read_back is None else True
+        times = []
+        for data in patterns(self.length) * self.repeat:
+            times.append(self._send(data))
+            if read_back is not None and read_back() != data:
+                verified = False
+        return Result(transfer.max_speed_hz, transfer.chunk, min(times), verified)
+
+    def run(self, speeds=SPEEDS, chunks=CHUNKS):
+        if self.epd.init() != 0:
+            raise IOError("e-Paper init failed")
+        self.backend = epdconfig.implementation
+        base = self.backend.transfer
+        results = []
+        best = None
+        for hz in sorted(speeds):
+            result = self.measure(base._replace(max_speed_hz=hz, chunk=0))
+            results.append(result)
+            if result.verified is False:
+                break
+            if result.verified is None and best is not None and result.ms >= best.ms * 0.95:
+                break
+            best = result
+        if best is None:
+            return base, results
+        for chunk in chunks:
+            if chunk == 0:
+                continue
+            result = self.measure(base._replace(max_speed_hz=best.max_speed_hz, chunk=chunk))
+            results.append(result)
+            # a chunk size has to win clearly over handing spidev the lot
+            if result.verified is not False and result.ms < best.ms * 0.95:
+                best = result
+        profile = base._replace(max_speed_hz=best.max_speed_hz, chunk=best.chunk)
+        self.backend.set_transfer(profile)
+        return profile, results
+
+
+def report(panel, length, profile, results):
+    print('%s, %d byte frames' % (panel, length))
+    print('  %10s %6s %9s %9s  %s' % ('clock Hz', 'chunk', 'ms', 'KB/s', 'verified'))
+    for r in results:
+        print('  %10d %6d %9.2f %9.0f  %s' % (r.max_speed_hz, r.chunk, r.ms,
+                                              length / r.ms if r.ms else 0,
+                                              {True: 'yes', False: 'NO', None: '-'}[r.verified]))
+    print('  best: %d Hz, chunk %d' % (profile.max_speed_hz, profile.chunk))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Calibrate e-Paper SPI transfers')
+    parser.add_argument('panel', help='driver module name, e.g. epd7in5_V2')
+    parser.add_argument('--backend', help='epdconfig backend, default: detected')
+    parser.add_argument('--speeds', type=int, nargs='+', default=SPEEDS)
+    parser.add_argument('--chunks', type=int, nargs='+', default=CHUNKS)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--save', action='store_true', help='store the result as the panel profile')
+    parser.add_argument('--profile', help='profile file, default %s' % epdconfig.TRANSFER_PROFILE)
+    args = parser.parse_args(argv)
+
+    if args.backend:
+        epdconfig.use(args.backend)
+    calibration = Calibration(args.panel, args.repeat)
+    try:
+        profile, results = calibration.run(args.speeds, args.chunks)
+    finally:
+        epdconfig.module_exit()
+    report(args.panel, calibration.length, profile, results)
+    if args.save:
+        epdconfig.save_transfer_profile(args.panel, profile, args.profile)
+        print('  saved to %s' % (args.profile or epdconfig.TRANSFER_PROFILE))
+
+
+if __name__ == '__main__':
+    main()
+
+### END OF FILE ###
@@ -27,13 +27,132 @@
 # THE SOFTWARE.
 #
 
+import collections
+import glob
+import json
 import os
 import logging
 import sys
+import threading
 import time
 
 logger = logging.getLogger(__name__)
 
+# Longest a panel may hold BUSY before wait_busy() gives up. The slowest
+# colour panels need around 30 s for a full refresh.
+BUSY_TIMEOUT_MS = 60000
+# wait_for_edge() is re-armed at this interval, so an edge that lands
+# between reading the pin and arming the wait costs at most one slice.
+BUSY_SLICE_MS = 200
+
+
+def _wait_for_level(GPIO, pin, level, timeout_ms):
+    if GPIO.input(pin) == level:
+        return
+    edge = GPIO.RISING if level else GPIO.FALLING
+    deadline = time.monotonic() + timeout_ms / 1000.0
+    while GPIO.input(pin) != level:
+        remaining = int((deadline - time.monotonic()) * 1000)
+        if remaining <= 0:
+            raise TimeoutError("e-Paper busy pin %d not %s after %d ms"
+                               % (pin, "HIGH" if level else "LOW", timeout_ms))
+        try:
+            GPIO.wait_for_edge(pin, edge, timeout=min(remaining, BUSY_SLICE_MS))
+        except RuntimeError:
+            # edge detection unavailable on this pin, fall back to polling
+            time.sleep(0.01)
+
+
+# SPI settings per panel, written by epdcalib and read by module_init().
+# chunk is the most bytes handed to spidev per call, 0 for the whole
+# buffer (spidev still splits it at its bufsiz, 4096 by default).
+TRANSFER_PROFILE = os.environ.get(
+    'EPD_TRANSFER_PROFILE',
+    os.path.expanduser('~/.config/waveshare_epd/transfer.json'))
+TransferProfile = collections.namedtuple('TransferProfile', 'bus device max_speed_hz chunk')
+DEFAULT_TRANSFER = TransferProfile(0, 0, 4000000, 0)
+
+
+def _panel_name(panel):
+    # drivers pass their module __name__
+    return panel.rsplit('.', 1)[-1]
+
+
+def _read_profiles(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning("ignoring transfer profile %s: %s", path, e)
+        return {}
+
+
+def transfer_profile(panel, default=DEFAULT_TRANSFER, path=None):
+    if not panel:
+        return default
+    entry = _read_profiles(path or TRANSFER_PROFILE).get(_panel_name(panel), {})
+    return default._replace(**{k: int(v) for k, v in entry.items() if k in default._fields})
+
+
+def save_transfer_profile(panel, profile, path=None):
+    path = path or TRANSFER_PROFILE
+    profiles = _read_profiles(path)
+    profiles[_panel_name(panel)] = profile._asdict()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(profiles, f, indent=2, sort_keys=True)
+
+
+def _write_chunked(spi, data, chunk):
+    if not chunk or len(data) <= chunk:
+        spi.writebytes2(data)
+        return
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data)
+    view = memoryview(data)
+    for i in range(0, len(view), chunk):
+        spi.writebytes2(view[i:i + chunk])
+
+
+# GPIO lines of one panel, BCM numbers. Panels on one Pi only share SCLK
+# and MOSI, each needs its own RST, DC, CS and BUSY. pwr may be None, or
+# the line another panel already switches.
+PinSet = collections.namedtuple('PinSet', 'rst dc cs busy pwr', defaults=(None,))
+
+
+# Several panels on one SPI controller, one spidev device each, picked by
+# the CS line the driver pulls low. A thread owns the bus from CS low to
+# CS high, so transfers to different panels never interleave while their
+# refreshes (BUSY waits) still overlap. A transfer that raised keeps the
+# bus until its thread raises CS again.
+class _SharedBus:
+    def __init__(self, spi, cs_pin, transfer):
+        self.devices = {cs_pin: (spi, transfer)}
+        self.active = self.devices[cs_pin]
+        self.lock = threading.Lock()
+        self.owner = None
+
+    def add(self, cs_pin, spi, transfer):
+        self.devices[cs_pin] = (spi, transfer)
+
+    def write(self, pin, value, output):
+        device = self.devices.get(pin)
+        if device is None:
+            output(pin, value)
+        elif value:
+            output(pin, value)
+            if self.owner == threading.get_ident():
+                self.owner = None
+                self.lock.release()
+        else:
+            if self.owner != threading.get_ident():
+                self.lock.acquire()
+                self.owner = threading.get_ident()
+            self.active = device
+            output(pin, value)
+
 
 class RaspberryPi:
     # Pin definition
@@ -48,24 +167,73 @@ class RaspberryPi:
         import RPi.GPIO
 
         self.GPIO = RPi.GPIO
+        self.SpiDev = spidev.SpiDev
         self.SPI = spidev.SpiDev()
+        self.transfer = DEFAULT_TRANSFER
+        self.panels = []     # (pins, spidev, transfer) from add_panel()
+        self.bus = None      # _SharedBus once there is more than one panel
+        self.ready = False
 
     def digital_write(self, pin, value):
-        self.GPIO.output(pin, value)
+        if self.bus is None:
+            self.GPIO.output(pin, value)
+        else:
+            self.bus.write(pin, value, self.GPIO.output)
 
     def digital_read(self, pin):
         return self.GPIO.input(pin)
 
+    # sleep until pin reads level, raises TimeoutError after timeout_ms
+    def wait_busy(self, pin, level, timeout_ms=BUSY_TIMEOUT_MS):
+        _wait_for_level(self.GPIO, pin, level, timeout_ms)
+
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
     def spi_writebyte(self, data):
-        self.SPI.writebytes(data)
+        spi = self.SPI if self.bus is None else self.bus.active[0]
+        spi.writebytes(data)
 
+    # data may be any buffer (bytes, bytearray, memoryview), it is not copied
     def spi_writebyte2(self, data):
-        self.SPI.writebytes2(data)
-
-    def module_init(self):
+        if self.bus is None:
+            _write_chunked(self.SPI, data, self.transfer.chunk)
+        else:
+            spi, transfer = self.bus.active
+            _write_chunked(spi, data, transfer.chunk)
+
+    def set_transfer(self, transfer):
+        self.transfer = transfer
+        self.SPI.max_speed_hz = transfer.max_speed_hz
+        if self.bus is not None:
+            self.bus.add(self.CS_PIN, self.SPI, transfer)
+
+    # another panel on its own pins and spidev device, see epdconfig.attach()
+    def add_panel(self, pins, transfer, panel=None):
+        if self.bus is None:
+            self.bus = _SharedBus(self.SPI, self.CS_PIN, self.transfer)
+        spi = self.SpiDev()
+        self.bus.add(pins.cs, spi, transfer)
+        self.panels.append((pins, spi, transfer))
+        if self.ready:
+            self._open_panel(pins, spi, transfer)
+
+    def _open_panel(self, pins, spi, transfer):
+        for pin in (pins.rst, pins.dc, pins.cs):
+            self.GPIO.setup(pin, self.GPIO.OUT)
+        self.GPIO.setup(pins.busy, self.GPIO.IN)
+        if pins.pwr is not None:
+            self.GPIO.setup(pins.pwr, self.GPIO.OUT)
+            self.GPIO.output(pins.pwr, 1)
+        spi.open(transfer.bus, transfer.device)
+        spi.max_speed_hz = transfer.max_speed_hz
+        spi.mode = 0b00
+
+    # panel is the driver module name, it selects the transfer profile
+    # (of the first panel, added ones bring their own)
+    def module_init(self, panel=None):
+        if self.bus is None:
+            self.transfer = transfer_profile(panel, self.transfer)
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
         self.GPIO.setup(self.RST_PIN, self.GPIO.OUT)
@@ -76,22 +244,43 @@ class RaspberryPi:
         
         self.GPIO.output(self.PWR_PIN, 1)
 
-        # SPI device, bus = 0, device = 0
-        self.SPI.open(0, 0)
-        self.SPI.max_speed_hz = 4000000
+        self.SPI.open(self.transfer.bus, self.transfer.device)
+        self.SPI.max_speed_hz = self.transfer.max_speed_hz
         self.SPI.mode = 0b00
+        if self.bus is not None:
+            self.bus.add(self.CS_PIN, self.SPI, self.transfer)
+
+        if not self.ready:
+            for entry in self.panels:
+                self._open_panel(*entry)
+            self.ready = True
         return 0
 
-    def module_exit(self):
+    # with added panels the bus stays up for the others, force ends them all
+    def module_exit(self, force=False):
+        if self.panels and not force:
+            logger.debug("spi kept open for %d more panels", len(self.panels))
+            return
+
         logger.debug("spi end")
         self.SPI.close()
+        for pins, spi, transfer in self.panels:
+            spi.close()
 
         logger.debug("close 5V, Module enters 0 power consumption ...")
         self.GPIO.output(self.RST_PIN, 0)
         self.GPIO.output(self.DC_PIN, 0)
         self.GPIO.output(self.PWR_PIN, 0)
+        pins = [self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN, self.PWR_PIN]
+        for extra, spi, transfer in self.panels:
+            self.GPIO.output(extra.rst, 0)
+            self.GPIO.output(extra.dc, 0)
+            if extra.pwr is not None:
+                self.GPIO.output(extra.pwr, 0)
+            pins += [pin for pin in extra if pin is not None and pin not in pins]
 
-        self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN, self.PWR_PIN])
+        self.GPIO.cleanup(pins)
+        self.ready = False
 
 
 class JetsonNano:
@@ -102,6 +291,10 @@ class JetsonNano:
     BUSY_PIN = 24
     PWR_PIN  = 18
 
+    # whole-buffer entry point, void f(const uint8_t *data, uint32_t len).
+    # Libraries built without it are driven one byte per call.
+    BULK_SYMBOL = 'SYSFS_software_spi_writebytes'
+
     def __init__(self):
         import ctypes
         find_dirs = [
@@ -118,6 +311,16 @@ class JetsonNano:
         if self.SPI is None:
             raise RuntimeError('Cannot find sysfs_software_spi.so')
 
+        # typed once, so ctypes does not work out the conversion per call
+        self.ctypes = ctypes
+        self._transfer = self.SPI.SYSFS_software_spi_transfer
+        self._transfer.argtypes = [ctypes.c_uint8]
+        self._transfer.restype = ctypes.c_uint8
+        self._bulk = getattr(self.SPI, self.BULK_SYMBOL, None)
+        if self._bulk is not None:
+            self._bulk.argtypes = [ctypes.c_void_p, ctypes.c_uint32]
+            self._bulk.restype = None
+
         import Jetson.GPIO
         self.GPIO = Jetson.GPIO
 
@@ -127,17 +330,37 @@ class JetsonNano:
     def digital_read(self, pin):
         return self.GPIO.input(self.BUSY_PIN)
 
+    def wait_busy(self, pin, level, timeout_ms=BUSY_TIMEOUT_MS):
+        _wait_for_level(self.GPIO, self.BUSY_PIN, level, timeout_ms)
+
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
     def spi_writebyte(self, data):
-        self.SPI.SYSFS_software_spi_transfer(data[0])
+        self._transfer(data[0])
+
+    # bytes and writable buffers are handed to the library without a copy
+    def _pointer(self, data):
+        if isinstance(data, bytes):
+            return data
+        try:
+            return (self.ctypes.c_char * len(data)).from_buffer(data)
+        except (TypeError, ValueError):
+            # read-only memoryview or a list
+            return bytes(data)
 
     def spi_writebyte2(self, data):
-        for i in range(len(data)):
-            self.SPI.SYSFS_software_spi_transfer(data[i])
+        if self._bulk is not None:
+            data = self._pointer(data)
+            self._bulk(data, len(data))
+        else:
+            if not isinstance(data, (bytes, bytearray)):
+                data = bytes(data)
+            # still one FFI call per byte, but no Python bytecode per byte
+            collections.deque(map(self._transfer, data), maxlen=0)
 
-    def module_init(self):
+    # software SPI has no clock or chunk settings, panel is ignored
+    def module_init(self, panel=None):
         self.GPIO.setmode(self.GPIO.BCM)
         self.GPIO.setwarnings(False)
         self.GPIO.setup(self.RST_PIN, self.GPIO.OUT)
@@ -151,7 +374,14 @@ class JetsonNano:
         self.SPI.SYSFS_software_spi_begin()
         return 0
 
-    def module_exit(self):
+    def set_transfer(self, transfer):
+        raise ValueError("software SPI on the Jetson Nano has no clock or chunk settings")
+
+    def add_panel(self, pins, transfer, panel=None):
+        raise ValueError("e-Paper backend JetsonNano drives a single panel")
+
+    # a single panel, force is accepted for the same call on every backend
+    def module_exit(self, force=False):
         logger.debug("spi end")
         self.SPI.SYSFS_software_spi_end()
 
@@ -178,6 +408,7 @@ class SunriseX3:
 
         self.GPIO = Hobot.GPIO
         self.SPI = spidev.SpiDev()
+        self.transfer = DEFAULT_TRANSFER._replace(bus=2)
 
     def digital_write(self, pin, value):
         self.GPIO.output(pin, value)
@@ -185,6 +416,10 @@ class SunriseX3:
     def digital_read(self, pin):
         return self.GPIO.input(pin)
 
+    # sleep until pin reads level, raises TimeoutError after timeout_ms
+    def wait_busy(self, pin, level, timeout_ms=BUSY_TIMEOUT_MS):
+        _wait_for_level(self.GPIO, pin, level, timeout_ms)
+
     def delay_ms(self, delaytime):
         time.sleep(delaytime / 1000.0)
 
@@ -194,11 +429,21 @@ class SunriseX3:
     def spi_writebyte2(self, data):
         # for i in range(len(data)):
         #     self.SPI.writebytes([data[i]])
-        self.SPI.xfer3(data)
+        if self.transfer.chunk and len(data) > self.transfer.chunk:
+            view = memoryview(bytes(data))
+            for i in range(0, len(view), self.transfer.chunk):
+                self.SPI.xfer3(view[i:i + self.transfer.chunk])
+        else:
+            self.SPI.xfer3(data)
+
+    def set_transfer(self, transfer):
+        self.transfer = transfer
+        self.SPI.max_speed_hz = transfer.max_speed_hz
 
-    def module_init(self):
+    def module_init(self, panel=None):
         if self.Flag == 0:
             self.Flag = 1
+            self.transfer = transfer_profile(panel, self.transfer)
             self.GPIO.setmode(self.GPIO.BCM)
             self.GPIO.setwarnings(False)
             self.GPIO.setup(self.RST_PIN, self.GPIO.OUT)
@@ -209,15 +454,18 @@ class SunriseX3:
 
             self.GPIO.output(self.PWR_PIN, 1)
         
-            # SPI device, bus = 0, device = 0
-            self.SPI.open(2, 0)
-            self.SPI.max_speed_hz = 4000000
+            self.SPI.open(self.transfer.bus, self.transfer.device)
+            self.SPI.max_speed_hz = self.transfer.max_speed_hz
             self.SPI.mode = 0b00
             return 0
         else:
             return 0
 
-    def module_exit(self):
+    def add_panel(self, pins, transfer, panel=None):
+        raise ValueError("e-Paper backend SunriseX3 drives a single panel")
+
+    # a single panel, force is accepted for the same call on every backend
+    def module_exit(self, force=False):
         logger.debug("spi end")
         self.SPI.close()
 
@@ -230,14 +478,386 @@ class SunriseX3:
         self.GPIO.cleanup([self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN], self.PWR_PIN)
 
 
-if os.path.exists('/sys/bus/platform/drivers/gpiomem-bcm2835'):
-    implementation = RaspberryPi()
-elif os.path.exists('/sys/bus/platform/drivers/gpio-x3'):
-    implementation = SunriseX3()
-else:
-    implementation = JetsonNano()
+class GpiodPi:
+    # Pin definition, BCM numbering = line offsets on the header gpiochip
+    RST_PIN  = 17
+    DC_PIN   = 25
+    CS_PIN   = 8
+    BUSY_PIN = 24
+    PWR_PIN  = 18
+
+    # header gpiochip labels, Pi 5 (RP1) first
+    CHIP_LABELS = ('pinctrl-rp1', 'pinctrl-bcm2712', 'pinctrl-bcm2711', 'pinctrl-bcm2835')
+
+    def __init__(self, chip=None):
+        import spidev
+        import gpiod
+        from gpiod.line import Direction, Edge, Value
+
+        self.gpiod = gpiod
+        self.Direction = Direction
+        self.Edge = Edge
+        self.ACTIVE = Value.ACTIVE
+        self.INACTIVE = Value.INACTIVE
+        self.chip = chip or os.environ.get('EPD_GPIOCHIP')
+        self.SpiDev = spidev.SpiDev
+        self.SPI = spidev.SpiDev()
+        self.transfer = DEFAULT_TRANSFER
+        self.request = None
+        self.lines = {}      # line -> the request holding it, one per panel
+        self.values = {}     # level last driven on each output line
+        self.pending = {}    # writes not yet sent to the kernel
+        self.lock = threading.Lock()
+        self.panels = []     # (pins, spidev, transfer) from add_panel()
+        self.bus = None      # _SharedBus once there is more than one panel
+
+    def _chip_path(self):
+        if self.chip:
+            return self.chip
+        for path in sorted(glob.glob('/dev/gpiochip*')):
+            if not self.gpiod.is_gpiochip_device(path):
+                continue
+            with self.gpiod.Chip(path) as chip:
+                if chip.get_info().label in self.CHIP_LABELS:
+                    return path
+        return '/dev/gpiochip0'
+
+    # Writes are queued and set together in one ioctl before the next SPI
+    # transfer, read or delay, so send_command()/send_data() cost two line
+    # updates per byte instead of three. A pin written twice with different
+    # levels flushes first, so CS pulses are never merged away. Panel
+    # threads share the queue, each request gets its own set_values().
+    def _flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self.pending:
+            return
+        if self.bus is None:
+            self.request.set_values({pin: self.ACTIVE if value else self.INACTIVE
+                                     for pin, value in self.pending.items()})
+        else:
+            batches = {}
+            for pin, value in self.pending.items():
+                batches.setdefault(self.lines[pin], {})[pin] = self.ACTIVE if value else self.INACTIVE
+            for request, values in batches.items():
+                request.set_values(values)
+        self.values.update(self.pending)
+        self.pending.clear()
+
+    def _queue(self, pin, value):
+        if pin not in self.lines:
+            return
+        value = 1 if value else 0
+        with self.lock:
+            if pin in self.pending:
+                if self.pending[pin] == value:
+                    return
+                self._flush_locked()
+            if self.values.get(pin) != value:
+                self.pending[pin] = value
+
+    def digital_write(self, pin, value):
+        if self.bus is None:
+            self._queue(pin, value)
+        else:
+            # CS picks the spidev device even when the kernel drives the line
+            self.bus.write(pin, value, self._queue)
+
+    def digital_read(self, pin):
+        self._flush()
+        if pin not in self.lines:
+            return self.values.get(pin, 0)
+        return int(self.lines[pin].get_value(pin) == self.ACTIVE)
+
+    # BUSY is requested with edge detection, edges that happen between the
+    # read and the wait stay queued in the kernel, so no polling slices.
+    # Each panel's BUSY sits in its own request, so waits do not steal
+    # each other's events.
+    def wait_busy(self, pin, level, timeout_ms=BUSY_TIMEOUT_MS):
+        deadline = time.monotonic() + timeout_ms / 1000.0
+        while self.digital_read(pin) != level:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("e-Paper busy pin %d not %s after %d ms"
+                                   % (pin, "HIGH" if level else "LOW", timeout_ms))
+            request = self.lines[pin]
+            if request.wait_edge_events(remaining):
+                request.read_edge_events()
+
+    def delay_ms(self, delaytime):
+        self._flush()
+        time.sleep(delaytime / 1000.0)
+
+    def spi_writebyte(self, data):
+        self._flush()
+        spi = self.SPI if self.bus is None else self.bus.active[0]
+        spi.writebytes(data)
+
+    # data may be any buffer (bytes, bytearray, memoryview), it is not copied
+    def spi_writebyte2(self, data):
+        self._flush()
+        if self.bus is None:
+            _write_chunked(self.SPI, data, self.transfer.chunk)
+        else:
+            spi, transfer = self.bus.active
+            _write_chunked(spi, data, transfer.chunk)
+
+    def set_transfer(self, transfer):
+        self.transfer = transfer
+        self.SPI.max_speed_hz = transfer.max_speed_hz
+        if self.bus is not None:
+            self.bus.add(self.CS_PIN, self.SPI, transfer)
+
+    def _request_lines(self, outputs, busy):
+        LineSettings = self.gpiod.LineSettings
+        return self.gpiod.request_lines(
+            self._chip_path(),
+            consumer="waveshare_epd",
+            config={
+                tuple(outputs): LineSettings(direction=self.Direction.OUTPUT,
+                                             output_value=self.INACTIVE),
+                busy: LineSettings(direction=self.Direction.INPUT,
+                                   edge_detection=self.Edge.BOTH),
+            })
+
+    # returns the request and the lines it holds
+    def _request_panel(self, outputs, cs, busy):
+        # a line another panel already holds (a shared PWR) stays with it
+        outputs = [pin for pin in outputs if pin not in self.lines]
+        try:
+            request = self._request_lines(outputs, busy)
+        except OSError:
+            # spi0 already owns CE0/CE1 on current kernels, it drives CS itself
+            logger.debug("CS line %d busy, left to the SPI controller", cs)
+            outputs.remove(cs)
+            request = self._request_lines(outputs, busy)
+        for pin in outputs + [busy]:
+            self.lines[pin] = request
+        self.values.update(dict.fromkeys(outputs, 0))
+        return request
+
+    def _open_panel(self, pins, spi, transfer):
+        self._request_panel([pins.rst, pins.dc, pins.cs] +
+                            ([pins.pwr] if pins.pwr is not None else []),
+                            pins.cs, pins.busy)
+        spi.open(transfer.bus, transfer.device)
+        spi.max_speed_hz = transfer.max_speed_hz
+        spi.mode = 0b00
+        if pins.pwr is not None:
+            self.digital_write(pins.pwr, 1)
+
+    # another panel on its own pins and spidev device, see epdconfig.attach()
+    def add_panel(self, pins, transfer, panel=None):
+        if self.bus is None:
+            self.bus = _SharedBus(self.SPI, self.CS_PIN, self.transfer)
+        spi = self.SpiDev()
+        self.bus.add(pins.cs, spi, transfer)
+        self.panels.append((pins, spi, transfer))
+        if self.request is not None:
+            self._open_panel(pins, spi, transfer)
+            self._flush()
+
+    def module_init(self, panel=None):
+        if self.request is None:
+            self.transfer = transfer_profile(panel, self.transfer)
+            self.request = self._request_panel(
+                [self.RST_PIN, self.DC_PIN, self.CS_PIN, self.PWR_PIN],
+                self.CS_PIN, self.BUSY_PIN)
+
+            self.SPI.open(self.transfer.bus, self.transfer.device)
+            self.SPI.max_speed_hz = self.transfer.max_speed_hz
+            self.SPI.mode = 0b00
+            if self.bus is not None:
+                self.bus.add(self.CS_PIN, self.SPI, self.transfer)
+            for entry in self.panels:
+                self._open_panel(*entry)
 
-for func in [x for x in dir(implementation) if not x.startswith('_')]:
-    setattr(sys.modules[__name__], func, getattr(implementation, func))
+        self.digital_write(self.PWR_PIN, 1)
+        self._flush()
+        return 0
+
+    # with added panels the bus stays up for the others, force ends them all
+    def module_exit(self, force=False):
+        if self.panels and not force:
+            logger.debug("spi kept open for %d more panels", len(self.panels))
+            return
+
+        logger.debug("spi end")
+        self.SPI.close()
+        for pins, spi, transfer in self.panels:
+            spi.close()
+
+        logger.debug("close 5V, Module enters 0 power consumption ...")
+        with self.lock:
+            self.pending.clear()
+        if self.request is not None:
+            for pins in [PinSet(self.RST_PIN, self.DC_PIN, self.CS_PIN, self.BUSY_PIN, self.PWR_PIN)] + \
+                    [entry[0] for entry in self.panels]:
+                self.digital_write(pins.rst, 0)
+                self.digital_write(pins.dc, 0)
+                if pins.pwr is not None:
+                    self.digital_write(pins.pwr, 0)
+            self._flush()
+            for request in set(self.lines.values()):
+                request.release()
+        self.request = None
+        self.lines = {}
+
+
+# returns the class, so epdvirtual is only imported when asked for
+def _virtual():
+    from .epdvirtual import VirtualPanel
+    return VirtualPanel
+
+
+# name -> backend class, or a function returning the class
+backends = {
+    'rpi': RaspberryPi,
+    'gpiod': GpiodPi,
+    'x3': SunriseX3,
+    'jetson': JetsonNano,
+    'virtual': _virtual,
+}
+
+# the backend in use, set up by use() or on first use of the hardware
+implementation = None
+
+
+def register(name, factory):
+    backends[name] = factory
+
+
+def backend_class(name):
+    if name not in backends:
+        raise ValueError("unknown e-Paper backend %r, expected one of %s"
+                         % (name, ', '.join(sorted(backends))))
+    cls = backends[name]
+    if not isinstance(cls, type):
+        cls = cls()
+    return cls
+
+
+# switch every module-level function over to the named backend
+def use(name, **kwargs):
+    global implementation
+    implementation = backend_class(name)(**kwargs)
+    for func in [x for x in dir(implementation) if not x.startswith('_')]:
+        setattr(sys.modules[__name__], func, getattr(implementation, func))
+    if observer is not None:
+        _observe_functions()
+    return implementation
+
+
+# Set with observe(), called as observer(stage, seconds, nbytes) after
+# every SPI write (stage 'spi') and BUSY wait ('busy'); see epdmetrics.
+# Timed on the virtual backend's modelled clock when there is one.
+observer = None
+
+# module-level function -> stage it is timed as
+OBSERVED = {'spi_writebyte': 'spi', 'spi_writebyte2': 'spi', 'wait_busy': 'busy'}
+
+
+# seconds on the virtual backend's modelled clock, else time.perf_counter()
+def now():
+    now_ms = getattr(implementation, 'now_ms', None)
+    return now_ms() / 1000.0 if now_ms else time.perf_counter()
+
+
+def _observed(stage, func):
+    def timed(*args, **kwargs):
+        start = now()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if observer is not None:
+                observer(stage, now() - start, len(args[0]) if stage == 'spi' else 0)
+    return timed
+
+
+def _observe_functions():
+    for func, stage in OBSERVED.items():
+        method = getattr(implementation, func)
+        if observer is not None:
+            method = _observed(stage, method)
+        setattr(sys.modules[__name__], func, method)
+
+
+# start (or with None stop) reporting SPI and BUSY timings to callback
+def observe(callback):
+    global observer
+    observer = callback
+    if implementation is not None:
+        _observe_functions()
+
+
+# libgpiod v2 bindings, v1 has no request_lines()
+def _has_gpiod():
+    try:
+        import gpiod
+    except ImportError:
+        return False
+    return hasattr(gpiod, 'request_lines')
+
+
+def _is_raspberry_pi():
+    if os.path.exists('/sys/bus/platform/drivers/gpiomem-bcm2835'):
+        return True
+    try:
+        with open('/proc/device-tree/model') as f:
+            return f.read().startswith('Raspberry Pi')
+    except OSError:
+        return False
+
+
+# EPD_BACKEND wins, otherwise probe the board. On a Pi, gpiod is used when
+# the v2 bindings are installed (RPi.GPIO does not work on a Pi 5)
+def detect():
+    name = os.environ.get('EPD_BACKEND')
+    if name:
+        return name
+    if _is_raspberry_pi():
+        return 'gpiod' if _has_gpiod() else 'rpi'
+    elif os.path.exists('/sys/bus/platform/drivers/gpio-x3'):
+        return 'x3'
+    return 'jetson'
+
+
+# Importing this module no longer touches the hardware. The backend (and
+# spidev/RPi.GPIO with it) is set up by the first module_init(), or by
+# the first call to anything else the drivers use. Pin numbers come
+# straight from the backend class.
+def module_init(*args, **kwargs):
+    if implementation is None:
+        use(detect())
+    return implementation.module_init(*args, **kwargs)
+
+
+# Puts another panel on its own pins and spidev device (bus, device), e.g.
+# a second HAT on CE1:
+#   attach(PinSet(rst=5, dc=6, cs=7, busy=13), (0, 1), 'epd7in5_V2')
+# The driver's transfer profile still sets clock and chunk size. Returns
+# the profile; the EPD instance is pointed at the pins by the caller,
+# see waveshare_epd.panel().
+def attach(pins, device, panel=None):
+    if implementation is None:
+        use(detect())
+    if not hasattr(implementation, 'add_panel'):
+        raise ValueError("e-Paper backend %s drives a single panel"
+                         % type(implementation).__name__)
+    transfer = transfer_profile(panel)._replace(bus=device[0], device=device[1])
+    implementation.add_panel(pins, transfer, panel)
+    return transfer
+
+
+def __getattr__(name):
+    if implementation is None and not name.startswith('__'):
+        cls = backend_class(detect())
+        if name.endswith('_PIN') and hasattr(cls, name):
+            return getattr(cls, name)
+        use(detect())
+        return getattr(implementation, name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 ### END OF FILE ###
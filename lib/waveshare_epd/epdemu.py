@@ -0,0 +1,264 @@
+# *****************************************************************************
+# * | File        :	  epdemu.py
+# * | Function    :   Controller emulators for the virtual panel backend
+# * | Info        :
+# *----------------
+# * | Info        :
+# * Interprets the command stream the drivers send and keeps the
+# * controller's RAM, so the virtual backend can show what a real panel
+# * would display, including windowed and partial writes.
+# *
+# * SSD1680 (and the SSD16xx parts driven the same way):
+# *  0x11 data entry mode, 0x44/0x45 RAM window, 0x4E/0x4F address counter,
+# *  0x24/0x26 BW/RED RAM, 0x21 BW RAM option, 0x32 LUT, 0x22/0x20 update
+# * UC8151/UC8176/UC8179:
+# *  0x10/0x13 old/new data, 0x91/0x92 partial in/out, 0x90 partial window
+# *  (7 byte UC8151 or 9 byte UC8176 form), 0x12 refresh, 0x04/0x02 power
+# *
+# * command() returns (kind, ms) when the panel goes busy, kind is 'full',
+# * 'partial' or None for power and reset, ms comes from the timing model.
+# * image() returns the visible frame, bits at 1 are white. Polarity comes
+# * from the controller, waveforms uploaded to the UC81xx LUT registers
+# * (0x20-0x24) are not interpreted, so the partial LUTs of 2in13d, 2in9d
+# * and 4in2, which take inverted new data, show up inverted.
+# ******************************************************************************
+
+# BUSY periods outside of refreshes, typical datasheet figures
+RESET_MS = 10
+POWER_MS = 80
+
+
+class SSD1680:
+    family = 'ssd'
+
+    def __init__(self, width, height, full_ms, partial_ms):
+        self.width = width
+        self.height = height
+        self.stride = (width + 7) // 8
+        self.full_ms = full_ms
+        self.partial_ms = partial_ms
+        size = self.stride * height
+        self.ram = {0x24: bytearray(b'\xff' * size), 0x26: bytearray(b'\xff' * size)}
+        self.visible = bytearray(b'\xff' * size)
+        self.reset()
+
+    # registers after a hardware or software reset, RAM is kept
+    def reset(self):
+        self.lut = None
+        self.entry = 0x03
+        self.x_window = (0, self.stride - 1)
+        self.y_window = (0, self.height - 1)
+        self.x = 0
+        self.y = 0
+        self.bw_option = 0
+        self.update = 0xC7
+        self.cmd = None
+        self.params = bytearray()
+
+    def command(self, cmd):
+        self._commit()
+        self.cmd = cmd
+        self.params = bytearray()
+        if cmd == 0x12:
+            self.reset()
+            return None, RESET_MS
+        if cmd == 0x20:
+            return self._activate()
+        return None
+
+    def data(self, data):
+        if self.cmd in self.ram:
+            self._write(self.ram[self.cmd], data)
+        else:
+            self.params += data
+
+    def _commit(self):
+        cmd, p = self.cmd, self.params
+        if cmd == 0x11 and p:
+            self.entry = p[0] & 0x07
+        elif cmd == 0x44 and len(p) >= 2:
+            self.x_window = (p[0] & 0x3F, p[1] & 0x3F)
+        elif cmd == 0x45 and len(p) >= 4:
+            self.y_window = (p[0] | (p[1] & 0x01) << 8, p[2] | (p[3] & 0x01) << 8)
+        elif cmd == 0x4E and p:
+            self.x = p[0] & 0x3F
+        elif cmd == 0x4F and len(p) >= 2:
+            self.y = p[0] | (p[1] & 0x01) << 8
+        elif cmd == 0x21 and p:
+            self.bw_option = p[0] & 0x0F
+        elif cmd == 0x22 and p:
+            self.update = p[0]
+        elif cmd == 0x32 and len(p) >= 153:
+            self.lut = bytes(p[:153])
+
+    # the address counter walks the window, wrapping back to its start
+    def _write(self, plane, data):
+        dx = 1 if self.entry & 0x01 else -1
+        dy = 1 if self.entry & 0x02 else -1
+        y_first = self.entry & 0x04
+        x_start, x_end = self.x_window
+        y_start, y_end = self.y_window
+        for b in data:
+            if 0 <= self.x < self.stride and 0 <= self.y < self.height:
+                plane[self.y * self.stride + self.x] = b
+            if y_first:
+                self.y, wrapped = _step(self.y, dy, y_start, y_end)
+                if wrapped:
+                    self.x, _ = _step(self.x, dx, x_start, x_end)
+            else:
+                self.x, wrapped = _step(self.x, dx, x_start, x_end)
+                if wrapped:
+                    self.y, _ = _step(self.y, dy, y_start, y_end)
+
+    def _activate(self):
+        if not self.update & 0x04:
+            # clock/analog power sequencing only
+            return None, POWER_MS
+        bw = self.ram[0x24]
+        if self.bw_option == 0x08:
+            bw = bytes(0xFF ^ b for b in bw)
+        self.visible[:] = bw
+        if self.update & 0x08:
+            # display mode 2 keeps the shown frame in RED RAM for the next diff
+            self.ram[0x26][:] = self.ram[0x24]
+            return 'partial', self._waveform_ms(self.partial_ms)
+        return 'full', self._waveform_ms(self.full_ms)
+
+    # frames in the loaded LUT at its frame rate, OTP figure otherwise
+    def _waveform_ms(self, default):
+        if self.lut is None:
+            return default
+        frames = 0
+        for group in range(12):
+            tp = self.lut[60 + group * 7:67 + group * 7]
+            frames += (tp[0] + tp[1] + tp[3] + tp[4]) * (tp[6] + 1)
+        hz = 25 * (self.lut[144] & 0x0F or 2)
+        return frames * 1000.0 / hz + POWER_MS
+
+    def image(self):
+        return bytes(self.visible)
+
+
+class UC8176:
+    family = 'uc'
+    # new data bit meaning white, UC8179 panels in this tree send it inverted
+    white = 1
+
+    def __init__(self, width, height, full_ms, partial_ms):
+        self.width = width
+        self.height = height
+        self.stride = (width + 7) // 8
+        self.full_ms = full_ms
+        self.partial_ms = partial_ms
+        size = self.stride * height
+        self.ram = {0x10: bytearray(b'\xff' * size), 0x13: bytearray(b'\xff' * size)}
+        self.visible = bytearray(b'\xff' * size)
+        self.reset()
+
+    def reset(self):
+        self.partial = False
+        self.window = (0, self.stride - 1, 0, self.height - 1)
+        self.pos = 0
+        self.cmd = None
+        self.params = bytearray()
+
+    def command(self, cmd):
+        self._commit()
+        self.cmd = cmd
+        self.params = bytearray()
+        if cmd in self.ram:
+            self.pos = 0
+        elif cmd == 0x12:
+            return self._refresh()
+        elif cmd in (0x04, 0x02):
+            return None, POWER_MS
+        elif cmd == 0x91:
+            self.partial = True
+        elif cmd == 0x92:
+            self.partial = False
+        return None
+
+    def data(self, data):
+        if self.cmd not in self.ram:
+            self.params += data
+            return
+        plane = self.ram[self.cmd]
+        x0, x1, y0, y1 = self._area()
+        width = x1 - x0 + 1
+        for b in data:
+            x = x0 + self.pos % width
+            y = y0 + self.pos // width
+            if y <= y1 and x < self.stride and y < self.height:
+                plane[y * self.stride + x] = b
+            self.pos += 1
+
+    def _commit(self):
+        cmd, p = self.cmd, self.params
+        if cmd != 0x90:
+            return
+        if len(p) >= 9:
+            # UC8176: HRST, HRED, VRST, VRED as 16 bit values
+            h0, h1 = p[0] << 8 | p[1], p[2] << 8 | p[3]
+            v0, v1 = p[4] << 8 | p[5], p[6] << 8 | p[7]
+        elif len(p) >= 7:
+            # UC8151: 8 bit HRST, HRED
+            h0, h1 = p[0], p[1]
+            v0, v1 = p[2] << 8 | p[3], p[4] << 8 | p[5]
+        else:
+            return
+        self.window = (h0 >> 3, h1 >> 3, v0, v1)
+
+    def _area(self):
+        if self.partial:
+            return self.window
+        return (0, self.stride - 1, 0, self.height - 1)
+
+    def _refresh(self):
+        x0, x1, y0, y1 = self._area()
+        new = self.ram[0x13]
+        for y in range(y0, min(y1, self.height - 1) + 1):
+            row = y * self.stride
+            line = new[row + x0:row + min(x1, self.stride - 1) + 1]
+            if not self.white:
+                line = bytes(0xFF ^ b for b in line)
+            self.visible[row + x0:row + x0 + len(line)] = line
+        if self.partial:
+            return 'partial', self.partial_ms
+        return 'full', self.full_ms
+
+    def image(self):
+        return bytes(self.visible)
+
+
+class UC8179(UC8176):
+    white = 0
+
+
+def _step(value, d, start, end):
+    value += d
+    if (d > 0 and value > end) or (d < 0 and value < end):
+        return start, True
+    return value, False
+
+
+# The SSD16xx parts share the SSD1680 model, and the UC81xx-like ones
+# (JD79661, ACeP) the UC8176 one: same BUSY polarity and refresh
+# commands. The colour panels' extra planes and 2/4 bpp pixels are
+# written to RAM as they come, so their image() is only approximate.
+CONTROLLERS = {
+    'ssd1608': SSD1680,
+    'ssd1675': SSD1680,
+    'ssd1677': SSD1680,
+    'ssd1680': SSD1680,
+    'ssd1681': SSD1680,
+    'uc8151': UC8176,
+    'uc8159': UC8176,
+    'uc8175': UC8176,
+    'uc8176': UC8176,
+    'uc8253': UC8176,
+    'jd79661': UC8176,
+    'acep': UC8176,
+    'uc8179': UC8179,
+}
+
+### END OF FILE ###
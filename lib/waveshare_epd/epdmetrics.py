@@ -0,0 +1,194 @@
+# *****************************************************************************
+# * | File        :	  epdmetrics.py
+# * | Function    :   In-process latency histograms and counters
+# * | Info        :
+# *----------------
+# * | Info        :
+# * Where the time per frame goes, kept in the process and exported in
+# * the Prometheus text format:
+# *
+# *   with epdmetrics.span('render', screen='weatherScreen'):
+# *       ...
+# *   epdmetrics.count('refreshes', mode='partial')
+# *
+# * span() adds to the histogram epd_<name>_seconds, and counts
+# * epd_<name>_errors_total when the block raises. enable() also times
+# * every SPI write and BUSY wait through epdconfig.observe(), as
+# * epd_spi_seconds, epd_spi_bytes_total and epd_busy_seconds. Those, and
+# * panel_span() for sleep and wake, run on the panel's clock: modelled
+# * time on the virtual backend.
+# *
+# * serve() answers GET on a local TCP port or a Unix socket:
+# *   curl localhost:9464/metrics
+# *   curl --unix-socket /run/epd-metrics.sock http://localhost/metrics
+# * and write() stores the same text in a file, atomically, for
+# * node_exporter's textfile collector.
+# ******************************************************************************
+
+import bisect
+import contextlib
+import http.server
+import os
+import socketserver
+import threading
+import time
+
+from . import epdconfig
+
+PREFIX = 'epd_'
+# upper bounds in seconds, from a single SPI command to a colour refresh
+BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+           2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+_lock = threading.Lock()
+# (name, labels) -> Histogram, labels a sorted tuple of (key, value)
+histograms = {}
+# (name, labels) -> number
+counters = {}
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def observe(name, seconds, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+
+def count(name, n=1, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        counters[key] = counters.get(key, 0) + n
+
+
+@contextlib.contextmanager
+def _span(name, clock, labels):
+    start = clock()
+    try:
+        yield
+    except BaseException:
+        count(name + '_errors', **labels)
+        raise
+    finally:
+        observe(name, clock() - start, **labels)
+
+
+def span(name, **labels):
+    return _span(name, time.perf_counter, labels)
+
+
+# a span for what the panel does (sleep, wake), on the same clock as the
+# SPI and BUSY timings
+def panel_span(name, **labels):
+    return _span(name, epdconfig.now, labels)
+
+
+def reset():
+    with _lock:
+        histograms.clear()
+        counters.clear()
+
+
+def _hardware(stage, seconds, nbytes):
+    observe(stage, seconds)
+    if nbytes:
+        count(stage + '_bytes', nbytes)
+
+
+# time SPI writes and BUSY waits too, False stops that again
+def enable(on=True):
+    epdconfig.observe(_hardware if on else None)
+
+
+# ---- Prometheus text format
+def _format(labels, extra=()):
+    pairs = labels + extra
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (key, value.replace('\\', '\\\\').replace('"', '\\"'))
+                             for key, value in pairs)
+
+
+def render():
+    lines = []
+    with _lock:
+        for name in sorted({name for name, _ in histograms}):
+            family = PREFIX + name + '_seconds'
+            lines.append('# TYPE %s histogram' % family)
+            for (other, labels), histogram in sorted(histograms.items()):
+                if other != name:
+                    continue
+                total = 0
+                for bound, n in zip(histogram.buckets + (None,), histogram.counts):
+                    total += n
+                    le = '+Inf' if bound is None else repr(bound)
+                    lines.append('%s_bucket%s %d' % (family, _format(labels, (('le', le),)), total))
+                lines.append('%s_sum%s %r' % (family, _format(labels), histogram.sum))
+                lines.append('%s_count%s %d' % (family, _format(labels), histogram.count))
+        for name in sorted({name for name, _ in counters}):
+            family = PREFIX + name + '_total'
+            lines.append('# TYPE %s counter' % family)
+            for (other, labels), value in sorted(counters.items()):
+                if other == name:
+                    lines.append('%s%s %d' % (family, _format(labels), value))
+    return '\n'.join(lines) + '\n'
+
+
+def write(path):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(render())
+    os.replace(tmp, path)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+# Serve the metrics on a thread: address is 'host:port' (a bare port
+# listens on 127.0.0.1) or the path of a Unix socket. Returns the server.
+def serve(address):
+    address = str(address)
+    if address.startswith('/') or address.startswith('.'):
+        if os.path.exists(address):
+            os.unlink(address)
+        server = _UnixHTTPServer(address, _Handler)
+    else:
+        host, _, port = address.rpartition(':')
+        server = http.server.ThreadingHTTPServer((host or '127.0.0.1', int(port)), _Handler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
+
+### END OF FILE ###
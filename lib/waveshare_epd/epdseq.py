@@ -0,0 +1,91 @@
+# *****************************************************************************
+# * | File        :	  epdseq.py
+# * | Function    :   Init sequences as data, and the engine that runs them
+# * | Info        :
+# *----------------
+# * | Info        :
+# * A driver describes its init() as a tuple of steps: commands with their
+# * payload, hardware reset, BUSY waits and delays. Each step carries the
+# * sleep level that loses it:
+# *  DEEP   gone after deep sleep, which needs a hardware reset to leave
+# *         (register setup, the reset itself)
+# *  LIGHT  gone after the panel is only powered off (power on, boosters)
+# * run(epd, sequence, level) replays the steps lost at that level, so
+# * init() is run(..., DEEP) and waking from a power off only sends the
+# * few LIGHT steps. Frame RAM is not part of any sequence.
+# *
+# * The engine remembers which sequence and level each panel ran last and
+# * how long it took, in milliseconds, in timings.
+# ******************************************************************************
+
+import collections
+import functools
+import time
+
+from . import epdconfig
+
+LIGHT = 1
+DEEP = 2
+
+# op markers for the steps that are not controller commands
+RESET = 'reset'
+BUSY = 'busy'
+DELAY = 'delay'
+
+Step = collections.namedtuple('Step', 'level op data')
+
+# Pause between the deep sleep command and module_exit() cutting power.
+# The drivers that wait for BUSY before it use this instead of the
+# stock 2 s: the controller is idle by then, and an SSD16xx in deep
+# sleep holds BUSY high, so there is nothing left to wait for.
+SLEEP_SETTLE_MS = 100
+
+# (driver module, level) -> ms the last run took
+timings = {}
+
+
+def command(op, data=(), level=DEEP):
+    return Step(level, op, bytes(data))
+
+
+def reset(level=DEEP):
+    return Step(level, RESET, None)
+
+
+def busy(level=DEEP):
+    return Step(level, BUSY, None)
+
+
+def delay(ms, level=DEEP):
+    return Step(level, DELAY, ms)
+
+
+def _now_ms():
+    # the virtual backend keeps a modelled clock, use it when there is one
+    now_ms = getattr(epdconfig.implementation, 'now_ms', None)
+    return now_ms() if now_ms else time.monotonic() * 1000.0
+
+
+# the steps for a level, filtered once per sequence
+@functools.lru_cache(maxsize=64)
+def plan(sequence, level):
+    return tuple(step for step in sequence if step.level <= level)
+
+
+def run(epd, sequence, level=DEEP):
+    start = _now_ms()
+    for step in plan(sequence, level):
+        if step.op == RESET:
+            epd.reset()
+        elif step.op == BUSY:
+            epd.ReadBusy()
+        elif step.op == DELAY:
+            epdconfig.delay_ms(step.data)
+        else:
+            epd.cmd(step.op, step.data)
+    ms = _now_ms() - start
+    epd.sequence = (sequence, level)
+    timings[(type(epd).__module__, level)] = ms
+    return ms
+
+### END OF FILE ###
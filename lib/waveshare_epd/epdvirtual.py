@@ -0,0 +1,325 @@
+# *****************************************************************************
+# * | File        :	  epdvirtual.py
+# * | Function    :   Virtual panel backend for running without hardware
+# * | Info        :
+# *----------------
+# * | Info        :
+# * Stands in for RaspberryPi/JetsonNano/SunriseX3 in epdconfig:
+# *  - every SPI write is captured as (command, data) transactions, the
+# *    latest EPD_VIRTUAL_HISTORY of them are kept
+# *  - the stream drives a controller emulator (epdemu) holding panel RAM
+# *  - BUSY follows the emulator's timing model, on a modelled clock that
+# *    also counts delay_ms() and SPI transfer time
+# *  - each refresh can be dumped as a PNG of what the panel shows
+# *  - panels added with epdconfig.attach() are emulated separately, picked
+# *    by their pins, and dump into a subdirectory named after the driver
+# *
+# * Select it with EPD_BACKEND=virtual or epdconfig.use('virtual'), and
+# * tune it with:
+# *  EPD_VIRTUAL_PANEL     driver module name, default: the driver that
+# *                        calls module_init(), else epd2in13_V3
+# *  EPD_VIRTUAL_DUMP      directory for frame-NNNN.png, unset: no dumps
+# *  EPD_VIRTUAL_TIMESCALE real seconds per modelled second, default 1.0,
+# *                        0 runs as fast as possible
+# *  EPD_VIRTUAL_MAX_HZ    fastest SPI clock the panel reads correctly,
+# *                        default 20 MHz, data bits flip above it
+# *  EPD_VIRTUAL_HISTORY   transactions and refreshes kept, default 4096
+# ******************************************************************************
+
+import collections
+import importlib
+import logging
+import os
+import time
+
+from . import epdconfig
+from . import epdemu
+
+logger = logging.getLogger(__name__)
+
+# controller, full refresh ms, partial refresh ms (typical datasheet
+# figures, SSD1680 uses the uploaded LUT instead when there is one). The
+# controller sets the BUSY polarity, see epdemu.CONTROLLERS; panels
+# without a partial refresh repeat the full figure.
+PANELS = {
+    # SSD16xx: BUSY high while busy, refresh on 0x20
+    'epd1in54':        ('ssd1608', 2000, 300),
+    'epd1in54_V2':     ('ssd1681', 2000, 300),
+    'epd2in13':        ('ssd1608', 2000, 300),
+    'epd2in13_V2':     ('ssd1680', 2000, 300),
+    'epd2in13_V3':     ('ssd1680', 2000, 300),
+    'epd2in66':        ('ssd1675', 3000, 300),
+    'epd2in7_V2':      ('ssd1680', 3000, 300),
+    'epd2in9':         ('ssd1608', 3000, 300),
+    'epd2in9_V2':      ('ssd1680', 3000, 300),
+    'epd3in7':         ('ssd1677', 3000, 300),
+    'epd7in5_HD':      ('ssd1677', 4000, 4000),
+    'epd1in54b_V2':    ('ssd1681', 15000, 15000),
+    'epd2in13b_V4':    ('ssd1680', 15000, 15000),
+    'epd2in66b':       ('ssd1675', 15000, 15000),
+    'epd2in7b_V2':     ('ssd1680', 15000, 15000),
+    'epd7in5b_HD':     ('ssd1677', 22000, 22000),
+    # UC81xx and friends: BUSY low while busy, refresh on 0x12
+    'epd1in02':        ('uc8175', 2000, 400),
+    'epd2in13d':       ('uc8151', 2000, 400),
+    'epd2in7':         ('uc8151', 4000, 4000),
+    'epd2in9d':        ('uc8151', 2000, 400),
+    'epd3in52':        ('uc8253', 3000, 400),
+    'epd4in2':         ('uc8176', 4000, 600),
+    'epd5in83':        ('uc8159', 5000, 5000),
+    'epd5in83_V2':     ('uc8179', 4000, 4000),
+    'epd7in5':         ('uc8159', 5000, 5000),
+    'epd7in5_V2':      ('uc8179', 4000, 1500),
+    'epd7in5_V2_fast': ('uc8179', 1500, 1500),
+    'epd1in54b':       ('uc8151', 15000, 15000),
+    'epd1in54c':       ('uc8151', 15000, 15000),
+    'epd2in13b_V3':    ('uc8151', 15000, 15000),
+    'epd2in13bc':      ('uc8151', 15000, 15000),
+    'epd2in7b':        ('uc8151', 15000, 15000),
+    'epd2in9b_V3':     ('uc8151', 15000, 15000),
+    'epd2in9bc':       ('uc8151', 15000, 15000),
+    'epd4in2b_V2':     ('uc8176', 15000, 15000),
+    'epd4in2bc':       ('uc8176', 15000, 15000),
+    'epd5in83b_V2':    ('uc8179', 16000, 16000),
+    'epd5in83bc':      ('uc8159', 16000, 16000),
+    'epd7in5b_V2':     ('uc8179', 16000, 16000),
+    'epd7in5bc':       ('uc8159', 16000, 16000),
+    # four colour (JD79661) and seven colour (ACeP) panels, UC polarity
+    'epd1in64g':       ('jd79661', 20000, 20000),
+    'epd2in13g':       ('jd79661', 20000, 20000),
+    'epd2in36g':       ('jd79661', 20000, 20000),
+    'epd3in0g':        ('jd79661', 20000, 20000),
+    'epd4in37g':       ('jd79661', 20000, 20000),
+    'epd7in3g':        ('jd79661', 20000, 20000),
+    'epd4in01f':       ('acep', 30000, 30000),
+    'epd5in65f':       ('acep', 30000, 30000),
+    'epd7in3f':        ('acep', 30000, 30000),
+}
+# for a driver not listed above
+DEFAULT_PANEL = ('ssd1680', 2000, 300)
+
+# transactions and refreshes kept, older ones are dropped
+HISTORY = 4096
+
+# BUSY after a hardware reset
+RESET_MS = epdemu.RESET_MS
+# spidev splits writes at its bufsiz, each ioctl costs about this much
+SPIDEV_BUFSIZ = 4096
+IOCTL_MS = 0.05
+# a byte with its lowest bit flipped, for data clocked in too fast
+_GARBLE = bytes(i ^ 0x01 for i in range(256))
+
+
+class VirtualSPI:
+    # drivers that call epdconfig.SPI.writebytes2() directly land here
+    def __init__(self, panel):
+        self.panel = panel
+
+    def writebytes(self, data):
+        self.panel.spi_writebyte(data)
+
+    def writebytes2(self, data):
+        self.panel.spi_writebyte2(data)
+
+
+class VirtualPanel:
+    # Pin definition
+    RST_PIN  = 17
+    DC_PIN   = 25
+    CS_PIN   = 8
+    BUSY_PIN = 24
+    PWR_PIN  = 18
+
+    def __init__(self, panel=None, dump_dir=None, time_scale=None, max_hz=None, history=None):
+        self.fixed_panel = panel or os.environ.get('EPD_VIRTUAL_PANEL')
+        self.dump_dir = dump_dir or os.environ.get('EPD_VIRTUAL_DUMP')
+        if time_scale is None:
+            time_scale = float(os.environ.get('EPD_VIRTUAL_TIMESCALE', '1.0'))
+        self.time_scale = time_scale
+        self.max_hz = max_hz or int(os.environ.get('EPD_VIRTUAL_MAX_HZ', '20000000'))
+        self.history = history or int(os.environ.get('EPD_VIRTUAL_HISTORY', HISTORY))
+        self.transfer = epdconfig.DEFAULT_TRANSFER
+        self._select(self.fixed_panel or 'epd2in13_V3')
+        self.SPI = VirtualSPI(self)
+        self._emu = None
+
+        self.pins = {}
+        self.routes = {}         # pin -> added VirtualPanel owning it
+        self.bus = None
+        # the latest history of each, so long runs stay in bounded memory
+        self.transactions = collections.deque(maxlen=self.history)   # [command, bytearray data], in order sent
+        self.refreshes = collections.deque(maxlen=self.history)      # (kind, start ms, duration ms)
+        self.frames = 0
+        self.bytes_sent = 0
+        self.clock_ms = 0.0
+        self.busy_until = 0.0
+        self._t0 = time.monotonic()
+
+    def _select(self, panel):
+        self.panel = panel
+        if panel not in PANELS:
+            logger.warning("%s is not in epdvirtual.PANELS, BUSY follows an SSD1680", panel)
+        self.controller, self.full_ms, self.partial_ms = PANELS.get(panel, DEFAULT_PANEL)
+        self.family = epdemu.CONTROLLERS[self.controller].family
+
+    # built on first use, the driver module may still be importing us
+    def _emulator(self):
+        if self._emu is None:
+            width, height = self.size()
+            self._emu = epdemu.CONTROLLERS[self.controller](
+                width, height, self.full_ms, self.partial_ms)
+        return self._emu
+
+    # ---- modelled clock
+    def now_ms(self):
+        if self.time_scale:
+            real = (time.monotonic() - self._t0) * 1000.0 / self.time_scale
+            self.clock_ms = max(self.clock_ms, real)
+        return self.clock_ms
+
+    def _advance(self, ms):
+        self.now_ms()
+        self.clock_ms += ms
+        if self.time_scale:
+            time.sleep(ms * self.time_scale / 1000.0)
+
+    def _busy(self, kind, ms):
+        start = max(self.now_ms(), self.busy_until)
+        self.busy_until = start + ms
+        if kind:
+            self.refreshes.append((kind, start, ms))
+
+    def is_busy(self):
+        return self.now_ms() < self.busy_until
+
+    # ---- backend interface
+    def digital_write(self, pin, value):
+        target = self.routes.get(pin, self)
+        if self.bus is None:
+            target._set_pin(pin, value)
+        else:
+            self.bus.write(pin, value, target._set_pin)
+
+    def _set_pin(self, pin, value):
+        if pin == self.RST_PIN and value and self.pins.get(pin) == 0:
+            self._emulator().reset()
+            self._busy(None, RESET_MS)
+        self.pins[pin] = value
+
+    def digital_read(self, pin):
+        if pin in self.routes:
+            return self.routes[pin].digital_read(pin)
+        if pin != self.BUSY_PIN:
+            return self.pins.get(pin, 0)
+        # SSD16xx drive BUSY high while busy, UC81xx drive it low
+        busy = self.is_busy()
+        return int(busy) if self.family == 'ssd' else int(not busy)
+
+    def wait_busy(self, pin, level, timeout_ms=60000):
+        if pin in self.routes:
+            return self.routes[pin].wait_busy(pin, level, timeout_ms)
+        if self.digital_read(pin) == level:
+            return
+        remaining = self.busy_until - self.now_ms()
+        if remaining <= 0 or remaining > timeout_ms:
+            # the panel never goes to that level, or not in time
+            self._advance(timeout_ms)
+            raise TimeoutError("e-Paper busy pin %d not %s after %d ms"
+                               % (pin, "HIGH" if level else "LOW", timeout_ms))
+        self._advance(remaining)
+
+    def delay_ms(self, delaytime):
+        self._advance(delaytime)
+
+    def spi_writebyte(self, data):
+        if self.bus is not None and self.bus.active[0] is not self:
+            return self.bus.active[0].spi_writebyte(data)
+        self._write(data)
+
+    def spi_writebyte2(self, data):
+        if self.bus is not None and self.bus.active[0] is not self:
+            return self.bus.active[0].spi_writebyte2(data)
+        chunk = min(self.transfer.chunk or SPIDEV_BUFSIZ, SPIDEV_BUFSIZ)
+        self._advance(-(-len(data) // chunk) * IOCTL_MS)
+        self._write(data)
+
+    def set_transfer(self, transfer):
+        self.transfer = transfer
+
+    # the calling driver picks the emulated panel unless one was given
+    def module_init(self, panel=None):
+        if panel and not self.fixed_panel and self._emu is None:
+            self._select(epdconfig._panel_name(panel))
+        if self.bus is None:
+            self.transfer = epdconfig.transfer_profile(panel, self.transfer)
+        self.pins[self.PWR_PIN] = 1
+        return 0
+
+    # a separate emulated panel behind pins, see epdconfig.attach()
+    def add_panel(self, pins, transfer, panel=None):
+        name = epdconfig._panel_name(panel) if panel else self.panel
+        dump_dir = os.path.join(self.dump_dir, name) if self.dump_dir else None
+        added = VirtualPanel(name, dump_dir, self.time_scale, self.max_hz, self.history)
+        added.RST_PIN, added.DC_PIN, added.CS_PIN, added.BUSY_PIN = pins[:4]
+        added.transfer = transfer
+        added._t0 = self._t0
+        for pin in pins[:4]:
+            self.routes[pin] = added
+        if self.bus is None:
+            self.bus = epdconfig._SharedBus(self, self.CS_PIN, self.transfer)
+        self.bus.add(pins.cs, added, transfer)
+        return added
+
+    def module_exit(self, force=False):
+        logger.debug("virtual panel off, %d bytes sent, %d refreshes",
+                     self.bytes_sent, self.frames)
+        self.pins[self.PWR_PIN] = 0
+
+    # ---- capture
+    def _write(self, data):
+        data = bytes(data)
+        self.bytes_sent += len(data)
+        self._advance(len(data) * 8000.0 / self.transfer.max_speed_hz)
+        if self.transfer.max_speed_hz > self.max_hz:
+            data = data.translate(_GARBLE)
+        if self.pins.get(self.DC_PIN, 0) == 0:
+            for command in data:
+                self.transactions.append([command, bytearray()])
+                busy = self._emulator().command(command)
+                if busy is not None:
+                    self._busy(*busy)
+                    if busy[0]:
+                        self._refreshed()
+        else:
+            if self.transactions:
+                self.transactions[-1][1] += data
+            else:
+                self.transactions.append([None, bytearray(data)])
+            self._emulator().data(data)
+
+    # data of the last command as the panel received it
+    def read_back(self):
+        return bytes(self.transactions[-1][1]) if self.transactions else b''
+
+    def _refreshed(self):
+        self.frames += 1
+        if self.dump_dir:
+            self.dump(os.path.join(self.dump_dir, 'frame-%04d.png' % self.frames))
+
+    # ---- frames
+    def size(self):
+        module = importlib.import_module('.' + self.panel, __package__)
+        return module.EPD_WIDTH, module.EPD_HEIGHT
+
+    def frame(self):
+        """What the panel shows as a PIL image, white where bits are 1."""
+        from PIL import Image
+
+        width, height = self.size()
+        return Image.frombytes('1', (width, height), self._emulator().image())
+
+    def dump(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.frame().save(path)
+
+### END OF FILE ###
@@ -0,0 +1,369 @@
+# Run a recorded session again, on the virtual panel and a clock that
+# follows the recording (see [recording] in display.toml):
+#
+#   python replay.py recordings/session-20261019-*.jsonl.gz
+#   python replay.py --save before.json recordings/*.jsonl.gz
+#   python replay.py --compare before.json recordings/*.jsonl.gz
+#
+# Fetches are answered with the recorded responses, and every recorded
+# render and frame is done again at its recorded time: each screen is
+# drawn with the same content and arguments, packed by the same driver,
+# and sent through the same refresh choice as on the unit. Images,
+# frame buffers and refresh modes that come out different are reported,
+# --dump writes both images of each. Which screen was shown when is
+# taken from the recording, not decided again: the rotation, dwell and
+# scheduler are not replayed.
+#
+# Timings are reported per screen function and refresh mode, recorded
+# next to replayed, the fastest of --repeat replays. Replayed frames
+# cost only CPU, the virtual panel runs at EPD_VIRTUAL_TIMESCALE 0.
+# --save and --compare keep them for an A/B run of the same session
+# before and after a change.
+
+import argparse
+import base64
+import collections
+import json
+import os
+import platform
+import sys
+import time as _time
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+
+os.environ.setdefault('EPD_BACKEND', 'virtual')
+os.environ.setdefault('EPD_VIRTUAL_TIMESCALE', '0')
+
+import displaymanager
+from displaymanager import DisplayManager, BusTracker, WeatherTracker, Screen, Recorder, readRecording
+from lib.waveshare_epd.epdbench import REPEAT, SLOWER, SLOWER_MS
+
+
+class Clock:
+    # the wall clock of the recorded unit: time.time(), datetime.now()
+    # and local time follow set(), in the unit's time zone; perf_counter
+    # and monotonic stay real so the replay is still timed
+    def __init__(self, utcoffset=0) -> None:
+        self.t = _time.time()
+        self.utcoffset = utcoffset
+
+    def set(self, t):
+        self.t = t
+
+    def install(self, module):
+        clock = self
+
+        class FakeDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                now = datetime.fromtimestamp(clock.t, timezone.utc)
+                if tz is not None:
+                    return now.astimezone(tz)
+                return (now + timedelta(seconds=clock.utcoffset)).replace(tzinfo=None)
+
+            @classmethod
+            def fromtimestamp(cls, t, tz=None):
+                if tz is not None:
+                    return datetime.fromtimestamp(t, tz)
+                return datetime.fromtimestamp(t + clock.utcoffset, timezone.utc).replace(tzinfo=None)
+
+        class FakeTime:
+            def __getattr__(self, name):
+                return getattr(_time, name)
+
+            def time(self):
+                return clock.t
+
+            def localtime(self, secs=None):
+                return _time.gmtime((clock.t if secs is None else secs) + clock.utcoffset)
+
+            def strftime(self, format, t=None):
+                return _time.strftime(format, self.localtime() if t is None else t)
+
+        module.datetime = FakeDatetime
+        module.time = FakeTime()
+
+
+class Response:
+    def __init__(self, record) -> None:
+        self.status_code = record.get('status', 599)
+        self.content = base64.b64decode(record.get('content', ''))
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', 'replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class Requests:
+    # stands in for requests: each get() is answered with the next
+    # recorded response to the same URL and parameters (API keys left
+    # out), or else the next one from the same host and path
+    def __init__(self, records) -> None:
+        self.exact = collections.defaultdict(collections.deque)
+        self.by_path = collections.defaultdict(collections.deque)
+        for record in records:
+            self.exact[self._key(record['url'], record['params'])].append(record)
+            self.by_path[record['url'].split('?')[0]].append(record)
+        self.missing = 0
+
+    @staticmethod
+    def _key(url, params):
+        return url, json.dumps(params, sort_keys=True)
+
+    def get(self, url, params=None, **kwargs):
+        url, params = Recorder.redact(url, params)
+        queue = self.exact.get(self._key(url, params))
+        if not queue:
+            queue = self.by_path.get(url.split('?')[0])
+        if not queue:
+            self.missing += 1
+            raise IOError(f'not in the recording: {url}')
+        record = queue[0]
+        self._drop(record)
+        if 'error' in record:
+            raise IOError(record['error'])
+        return Response(record)
+
+    def _drop(self, record):
+        # taken from one index, take it from the other too
+        for queue in (self.exact.get(self._key(record['url'], record['params'])),
+                      self.by_path.get(record['url'].split('?')[0])):
+            if queue and record in queue:
+                queue.remove(record)
+
+
+class Capture:
+    # takes the place of the recorder during a replay, for what the
+    # replayed render or frame came out as
+    def __init__(self) -> None:
+        self.last = None
+
+    def fetched(self, *args):
+        pass
+
+    def rendered(self, screen, started, seconds):
+        self.last = {'image': screen._image, 'ms': seconds * 1000.0}
+
+    def refreshed(self, panel, screen, mode, buf, window, started, seconds):
+        self.last = {'mode': mode, 'window': window, 'buf': bytes(buf), 'ms': seconds * 1000.0}
+
+
+class _NoScheduler:
+    def after(self, delay, func, *args):
+        return None
+
+
+def _image(data):
+    from PIL import Image
+    return Image.open(BytesIO(base64.b64decode(data)))
+
+
+def _sameImage(a, b):
+    return a.size == b.size and a.convert(b.mode).tobytes() == b.tobytes()
+
+
+class Replay:
+    def __init__(self, records, dump=None) -> None:
+        self.records = list(records)
+        if not self.records or self.records[0]['kind'] != 'session':
+            raise ValueError('no session record, not a recording')
+        self.session = self.records[0]
+        self.dump = dump
+        self.clock = Clock(self.session['utcoffset'])
+        self.clock.set(self.session['t'])
+        self.capture = Capture()
+        self.requests = Requests([r for r in self.records if r['kind'] == 'fetch'])
+        # (what, key) -> {'n', 'recorded_ms', 'replay_ms'}
+        self.timings = {}
+        self.mismatches = []
+        self.skipped = collections.Counter()
+
+    def run(self):
+        self.clock.install(displaymanager)
+        displaymanager.requests = self.requests
+        displaymanager.recorder = self.capture
+        # no startup report halfway through the replay
+        displaymanager.startup_times['first screen'] = 0
+
+        main = self.session['panels'][0]
+        self.manager = DisplayManager(main['orientation'], panel=main['driver'])
+        self.panel = self.manager.main
+        self.buses = BusTracker(self.manager, api_key='')
+        self.weather = None
+        self.screens = {}
+        try:
+            for record in self.records[1:]:
+                if record['kind'] == 'session':
+                    # every file of a session starts with the same one
+                    if record['t'] != self.session['t']:
+                        raise ValueError('files from more than one session')
+                    continue
+                self.clock.set(record['t'])
+                try:
+                    getattr(self, '_' + record['kind'])(record)
+                except Exception as e:
+                    self.mismatches.append((record['t'], record.get('screen', record['kind']),
+                                            f'{type(e).__name__}: {e}'))
+            self.panel.waitForRefresh()
+        finally:
+            displaymanager.recorder = None
+            displaymanager.epdconfig.module_exit(force=True)
+
+    def _time(self, what, key, recorded_ms, replay_ms):
+        timing = self.timings.setdefault(f'{what} {key}', {'n': 0, 'recorded_ms': 0.0, 'replay_ms': 0.0})
+        timing['n'] += 1
+        timing['recorded_ms'] += recorded_ms
+        timing['replay_ms'] += replay_ms
+
+    def _fetch(self, record):
+        # the weather is fetched on its own schedule, not while drawing
+        if record['upstream'] != 'weather' or 'error' in record:
+            return
+        if self.weather is None:
+            params = record['params']
+            self.weather = WeatherTracker(self.manager, '', params['lat'], params['lon'])
+        else:
+            self.weather.update()
+
+    def _screen(self, record):
+        if record['args'] is None:
+            self.skipped[record['screen']] += 1
+            return None
+        key = (record['screen'], json.dumps(record['args'], sort_keys=True))
+        screen = self.screens.get(key)
+        if screen is None:
+            owner, method = record['screen'].split('.')
+            owners = {'DisplayManager': self.manager, 'BusTracker': self.buses, 'WeatherTracker': self.weather}
+            screen = self.screens[key] = Screen(getattr(owners[owner], method), *record['args'])
+        return screen
+
+    def _render(self, record):
+        screen = self._screen(record)
+        if screen is None:
+            return
+        self.capture.last = None
+        screen.update()
+        self._time('render', record['screen'], record['ms'], self.capture.last['ms'])
+        recorded = _image(record['image'])
+        if not _sameImage(recorded, screen._image):
+            self._mismatch(record, 'image differs', recorded, screen._image)
+
+    def _frame(self, record):
+        if record['panel'] != self.panel.name:
+            self.skipped['frames for ' + record['panel']] += 1
+            return
+        self.capture.last = None
+        if record['mode'] == 'window':
+            self.manager.tickClock(_NoScheduler())
+        else:
+            screen = self._screen(record)
+            if screen is None:
+                return
+            screen.partial = record['partial']
+            self.panel.refreshScreen(screen)
+        replayed = self.capture.last
+        if replayed is None:
+            self.mismatches.append((record['t'], record.get('screen', 'clock'), 'no frame sent'))
+            return
+        self._time('frame', record['mode'], record['ms'], replayed['ms'])
+        problems = []
+        if replayed['mode'] != record['mode']:
+            problems.append(f"mode {record['mode']} -> {replayed['mode']}")
+        if record['window'] is not None and list(replayed['window']) != record['window']:
+            problems.append(f"window {record['window']} -> {list(replayed['window'])}")
+        if replayed['buf'] != base64.b64decode(record['buf']):
+            problems.append('buffer differs')
+        if problems:
+            self._mismatch(record, ', '.join(problems))
+
+    def _mismatch(self, record, problem, recorded=None, replayed=None):
+        self.mismatches.append((record['t'], record.get('screen', 'clock'), problem))
+        if self.dump and recorded is not None:
+            os.makedirs(self.dump, exist_ok=True)
+            name = '%.3f-%s' % (record['t'], record['screen'].replace('.', '-'))
+            recorded.save(os.path.join(self.dump, name + '-recorded.png'))
+            replayed.save(os.path.join(self.dump, name + '-replayed.png'))
+
+    def results(self):
+        return {key: {'n': t['n'], 'recorded_ms': round(t['recorded_ms'] / t['n'], 3),
+                      'replay_ms': round(t['replay_ms'] / t['n'], 3)}
+                for key, t in sorted(self.timings.items())}
+
+
+# the fastest of each timing over replays
+def fastest(results):
+    best = {}
+    for result in results:
+        for key, r in result.items():
+            if key not in best or r['replay_ms'] < best[key]['replay_ms']:
+                best[key] = r
+    return best
+
+
+def compare(baseline, results):
+    """(what, change) for what got slower or went since baseline."""
+    found = []
+    for key in sorted(set(baseline) | set(results)):
+        a, b = baseline.get(key), results.get(key)
+        if a is None or b is None:
+            found.append((key, 'new' if a is None else 'missing'))
+        elif b['replay_ms'] > a['replay_ms'] * SLOWER and b['replay_ms'] - a['replay_ms'] > SLOWER_MS:
+            found.append((key, 'ms %.2f -> %.2f' % (a['replay_ms'], b['replay_ms'])))
+    return found
+
+
+def report(replay, results):
+    print('%-40s %6s %12s %12s' % ('', 'n', 'recorded ms', 'replay ms'))
+    for key, r in results.items():
+        print('%-40s %6d %12.2f %12.2f' % (key, r['n'], r['recorded_ms'], r['replay_ms']))
+    for what, n in sorted(replay.skipped.items()):
+        print(f'skipped {n} x {what}')
+    if replay.requests.missing:
+        print(f'{replay.requests.missing} fetches not in the recording')
+    print(f'\n{len(replay.mismatches)} differences from the recording')
+    for t, what, problem in replay.mismatches:
+        stamp = datetime.fromtimestamp(t + replay.session['utcoffset'], timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        print(f'  {stamp} {what}: {problem}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a recorded display session on the virtual panel')
+    parser.add_argument('files', nargs='+', help='session-*.jsonl.gz files of one session')
+    parser.add_argument('--dump', help='directory for the recorded and replayed images that differ')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='replays to take the fastest timings of')
+    parser.add_argument('--save', help='store the replay timings as JSON')
+    parser.add_argument('--compare', help='JSON timings of an earlier replay to report slowdowns against')
+    args = parser.parse_args(argv)
+
+    records = list(readRecording(args.files))
+    replay = Replay(records, args.dump)
+    replay.run()
+    results = [replay.results()]
+    for _ in range(args.repeat - 1):
+        again = Replay(records)
+        again.run()
+        results.append(again.results())
+    results = fastest(results)
+    report(replay, results)
+
+    status = 1 if replay.mismatches else 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        changes = compare(baseline, results)
+        print('\nAgainst %s: %s' % (args.compare, 'no slowdowns' if not changes else '%d changes' % len(changes)))
+        for key, change in changes:
+            print('  %-40s %s' % (key, change))
+        status = status or (1 if changes else 0)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'repeat': args.repeat, 'results': results}, f, indent=1, sort_keys=True)
+        print('\nsaved to %s' % args.save)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
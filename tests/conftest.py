@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+# every test drives the virtual panel, at no modelled cost
+os.environ['EPD_BACKEND'] = 'virtual'
+os.environ['EPD_VIRTUAL_TIMESCALE'] = '0'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# a 2.13" V3 panel on the virtual backend, closed again after the test
+@pytest.fixture
+def panel():
+    import displaymanager
+    from lib.waveshare_epd import epdconfig
+
+    panel = displaymanager.Panel('epd2in13_V3')
+    yield panel
+    panel.waitForRefresh()
+    epdconfig.module_exit(force=True)
+
+
+# the screens and header clock measure text with the Pillow 9 calls, gone
+# from Pillow 10; put them back for the test where they are missing
+@pytest.fixture
+def pillow9(monkeypatch):
+    from PIL import Image, ImageDraw, ImageFont
+
+    if not hasattr(ImageDraw.ImageDraw, 'textsize'):
+        monkeypatch.setattr(ImageDraw.ImageDraw, 'textsize',
+                            lambda self, text, font=None, **kwargs: self.textbbox((0, 0), text, font=font)[2:],
+                            raising=False)
+        monkeypatch.setattr(ImageFont.FreeTypeFont, 'getsize',
+                            lambda self, text, *args, **kwargs: self.getbbox(text)[2:], raising=False)
+        monkeypatch.setattr(Image, 'ANTIALIAS', Image.LANCZOS, raising=False)
@@ -0,0 +1,65 @@
+from PIL import Image, ImageDraw
+
+from displaymanager import Screen, changedWindow
+
+
+def test_changed_window():
+    old = bytes(4 * 3)
+    assert changedWindow(old, old, 32) is None
+    new = bytearray(old)
+    new[1 * 4 + 2] = 0x01
+    assert changedWindow(old, bytes(new), 32) == (16, 1, 23, 1)
+    new[2 * 4 + 0] = 0x80
+    assert changedWindow(old, bytes(new), 32) == (0, 1, 23, 2)
+
+
+def test_changed_window_partial_byte_rows():
+    # 250 pixels take 32 bytes a row, the last one part padding
+    old = bytes(32 * 2)
+    new = bytearray(old)
+    new[32 + 31] = 0xFF
+    assert changedWindow(old, bytes(new), 250) == (248, 1, 255, 1)
+
+
+def picture(text):
+    image = Image.new('1', (250, 122), 255)
+    ImageDraw.Draw(image).text((5, 60), text, fill=0)
+    return image
+
+
+class Scheduler:
+    def __init__(self) -> None:
+        self.booked = []
+
+    def after(self, delay, func, *args):
+        self.booked.append((delay, func, args))
+
+
+def test_patch_sends_only_the_change(panel):
+    panel.showScreen(Screen(picture, 'a'))
+    assert panel.patch(picture('a')) is None
+    future = panel.patch(picture('b'))
+    assert future is not None
+    future.result()
+    assert bytes(panel.frame) == bytes(panel.pack(picture('b')))
+    assert panel.partials == 1
+
+
+def test_no_patch_without_a_frame(panel):
+    assert panel.patch(picture('a')) is None
+    panel.showScreen(Screen(picture, 'a'))
+    panel.clear()
+    assert panel.patch(picture('b')) is None
+
+
+def test_patch_books_the_rest_it_interrupted(panel):
+    panel.showScreen(Screen(picture, 'a'))
+    panel.scheduler = Scheduler()
+    panel.rest_until, panel.generation = 1000.0, 7
+    panel.patch(picture('b'))
+    # a rotation step before the refresh is done makes the booking stale
+    panel.generation = 8
+    panel.waitForRefresh()
+    # done callbacks run on the refresh thread before its next job
+    panel.refresh_executor.submit(lambda: None).result()
+    assert panel.scheduler.booked == [(0, panel._rest, (1000.0, 7))]
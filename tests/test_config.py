@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from displaymanager import (BusTracker, ConfigWatcher, Scheduler, Screen, ScreenQueue, currentDayPart,
+                            loadConfig, secondsToNextDayPart)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PARTS = '''
+[[day_parts]]
+name = "night"
+start = 22:00:00
+screens = ["weather"]
+display_time = 10
+
+[[day_parts]]
+name = "morning"
+start = 06:30:00
+screens = ["message", "buses"]
+display_time = 5
+message = "hello"
+'''
+
+
+def written(tmp_path, text):
+    path = tmp_path / 'display.toml'
+    path.write_text(text)
+    return str(path)
+
+
+def test_shipped_config_loads():
+    config = loadConfig(os.path.join(os.path.dirname(HERE), 'display.toml'))
+    assert [part.name for part in config.day_parts] == ['morning', 'afternoon', 'evening', 'night']
+    assert config.refreshes_per_hour == 240
+    assert config.buses[0]['route'] == 'X9'
+    assert config.location is None
+
+
+def test_day_parts_sorted_by_start(tmp_path):
+    config = loadConfig(written(tmp_path, PARTS + '[location]\nlat = 41.9\nlon = -87.6\n'))
+    assert [part.name for part in config.day_parts] == ['morning', 'night']
+    assert config.day_parts[0].message == 'hello'
+    assert config.location == (41.9, -87.6)
+    assert config.refreshes_per_hour is None
+    assert config.buses == []
+
+
+@pytest.mark.parametrize('text, error', [
+    (PARTS.replace('"weather"', '"news"'), 'unknown screens news'),
+    (PARTS.replace('message = "hello"', ''), 'shows a message but has none'),
+    (PARTS.replace('start = 22:00:00', 'start = "22:00"'), 'start is not a time of day'),
+    (PARTS.replace('display_time = 10', ''), 'display_time'),
+    ('[rotation]\nrefreshes_per_hour = 60\n', 'day_parts'),
+    (PARTS + '[[buses]]\nroute = "9"\n', 'stop_id'),
+])
+def test_invalid_config(tmp_path, text, error):
+    with pytest.raises(ValueError, match=error):
+        loadConfig(written(tmp_path, text))
+
+
+def test_missing_config(tmp_path):
+    with pytest.raises(OSError):
+        loadConfig(str(tmp_path / 'nothing.toml'))
+
+
+def test_current_day_part_runs_past_midnight(tmp_path):
+    parts = loadConfig(written(tmp_path, PARTS)).day_parts
+    assert currentDayPart(parts, datetime(2026, 10, 19, 3, 0)).name == 'night'
+    assert currentDayPart(parts, datetime(2026, 10, 19, 6, 30)).name == 'morning'
+    assert currentDayPart(parts, datetime(2026, 10, 19, 23, 0)).name == 'night'
+    assert secondsToNextDayPart(parts, datetime(2026, 10, 19, 21, 0)) == 3600
+    assert secondsToNextDayPart(parts, datetime(2026, 10, 19, 23, 0)) == 7.5 * 3600
+
+
+def test_watcher_calls_changed_once_per_burst(tmp_path):
+    path = written(tmp_path, PARTS)
+    scheduler = Scheduler()
+    threading.Thread(target=scheduler.run, daemon=True).start()
+    changes = []
+    changed = threading.Event()
+
+    def reload():
+        changes.append(loadConfig(path))
+        changed.set()
+
+    ConfigWatcher(path, reload, scheduler, settle=0.05, poll=0.05).start()
+    time.sleep(0.1)
+    for display_time in (20, 30):
+        with open(path, 'w') as f:
+            f.write(PARTS.replace('display_time = 10', f'display_time = {display_time}'))
+    assert changed.wait(5)
+    time.sleep(0.2)
+    assert len(changes) == 1
+    assert changes[0].day_parts[1].display_time == 30
+
+
+def test_watcher_polls_mtime(tmp_path):
+    path = written(tmp_path, PARTS)
+    changes = []
+    watcher = ConfigWatcher(path, lambda: changes.append(1), None)
+    watcher._check()
+    assert changes == []
+    os.utime(path, ns=(0, 0))
+    watcher._check()
+    watcher._check()
+    assert changes == [1]
+
+
+class Manager:
+    def __init__(self) -> None:
+        self.queue = ScreenQueue()
+
+    def removeScreens(self, match):
+        self.queue.remove(match)
+
+
+def test_reload_drops_removed_stops():
+    stops = [{'route': route, 'stop_id': route, 'stop_number': route, 'stop_name': route, 'direction': 'North'}
+             for route in ('9', '72')]
+    manager = Manager()
+    buses = BusTracker(manager, '', list(stops))
+    for bus in stops:
+        manager.queue.push(Screen(buses.busScheduleScreen, bus))
+    buses.soonest[('72', '72')] = 4
+    assert buses.setTrackedBuses(stops[:1] + [dict(stops[1], route='X9')]) == [dict(stops[1], route='X9')]
+    assert [screen.content_args[0]['route'] for screen in manager.queue] == ['9']
+    assert buses.soonest == {}
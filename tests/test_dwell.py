@@ -0,0 +1,87 @@
+import time
+
+from PIL import Image, ImageDraw
+
+from displaymanager import URGENT, DwellPolicy, Screen, contentDigest
+
+
+def drawn(text):
+    image = Image.new('1', (250, 122), 255)
+    ImageDraw.Draw(image).text((5, 50), text, fill=0)
+    return image
+
+
+def test_decide():
+    policy = DwellPolicy(max_skips=2)
+    screen = Screen(drawn, 'a')
+    assert policy.decide(screen, 1, glass=1) == 'hold'
+    assert policy.decide(screen, 1, glass=None) == 'show'
+    screen.last_digest = 1
+    assert policy.decide(screen, 1, glass=2) == 'skip'
+    screen.skipped = 2
+    assert policy.decide(screen, 1, glass=2) == 'show'
+    assert policy.decide(Screen(drawn, 'b', priority=URGENT), None, glass=2) == 'show'
+
+
+def test_dwell_weight_and_limits():
+    policy = DwellPolicy(unchanged_factor=0.5, min_time=2, max_time=30)
+    assert policy.dwell(Screen(drawn, 'a', display_time=10)) == 10
+    assert policy.dwell(Screen(drawn, 'a', display_time=10), changed=False) == 5
+    assert policy.dwell(Screen(drawn, 'a', display_time=10, weight=2)) == 20
+    assert policy.dwell(Screen(drawn, 'a', display_time=10, weight=lambda screen: 5)) == 30
+    assert policy.dwell(Screen(drawn, 'a', display_time=1)) == 2
+
+
+def test_budget():
+    policy = DwellPolicy(refreshes_per_hour=60, burst=2)
+    now = time.monotonic()
+    policy.refreshed(now)
+    assert policy.nextRefresh(now) == now
+    policy.refreshed(now)
+    # the bucket is empty, one more refresh a minute from now
+    assert abs(policy.nextRefresh(now) - (now + 60)) < 0.01
+    assert policy.nextRefresh(now + 60) == now + 60
+
+
+def test_no_budget():
+    policy = DwellPolicy()
+    now = time.monotonic()
+    for _ in range(10):
+        policy.refreshed(now)
+    assert policy.nextRefresh(now) == now
+
+
+def test_digest_leaves_out_the_clock():
+    image = drawn('a')
+    other = image.copy()
+    ImageDraw.Draw(other).text((200, 5), '10:07', fill=0)
+    other.info['clock'] = ((190, 0, 249, 30), 12)
+    image.info['clock'] = other.info['clock']
+    assert contentDigest(image) == contentDigest(other)
+    assert contentDigest(image) != contentDigest(drawn('b'))
+
+
+class Scheduler:
+    def after(self, delay, func, *args):
+        pass
+
+    def at(self, when, func, *args):
+        pass
+
+
+def test_unchanged_screen_is_skipped_across_a_rebuild(panel):
+    scheduler = Scheduler()
+    for name in ('a', 'b'):
+        panel.addScreenToQueue(Screen(drawn, name))
+    for _ in range(2):
+        panel.rotate(scheduler)
+        panel.waitForRefresh()
+
+    # as refreshQueue() in display.py does every few minutes
+    panel.clearQueue()
+    screens = [Screen(drawn, name) for name in ('a', 'b')]
+    for screen in screens:
+        panel.addScreenToQueue(screen)
+    panel.rotate(scheduler)
+    assert screens[0].skipped == 1
+    assert screens[0].last_digest == contentDigest(drawn('a'))
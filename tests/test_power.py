@@ -0,0 +1,89 @@
+import time
+
+from displaymanager import PanelPower
+from lib.waveshare_epd import epdseq
+
+
+class EPD:
+    # records what PanelPower asks of a driver
+    def __init__(self) -> None:
+        self.calls = []
+
+    def init(self):
+        self.calls.append('init')
+
+    def sleep(self):
+        self.calls.append('sleep')
+
+
+class LightEPD(EPD):
+    def standby(self):
+        self.calls.append('standby')
+
+    def wake(self):
+        self.calls.append('wake')
+
+
+def rest(power, gap):
+    power.rest(time.monotonic() + gap)
+    return power.eink.calls
+
+
+def test_short_gap_stays_awake():
+    power = PanelPower(LightEPD())
+    assert rest(power, 0.5) == []
+    assert power.state is None
+
+
+def test_middle_gap_goes_light():
+    power = PanelPower(LightEPD(), ratio=10, deep_after=60)
+    assert rest(power, 5) == ['standby']
+    assert rest(power, 5) == ['standby']
+    assert power.state == epdseq.LIGHT
+
+
+def test_long_gap_goes_deep():
+    power = PanelPower(LightEPD(), ratio=10, deep_after=60)
+    assert rest(power, 120) == ['sleep']
+    assert rest(power, 120) == ['sleep']
+    assert power.state == epdseq.DEEP
+
+
+def test_deep_waits_for_a_gap_worth_the_wake():
+    power = PanelPower(LightEPD(), ratio=10, deep_after=60)
+    power.measuredWake(epdseq.DEEP, 10)
+    assert rest(power, 90) == ['standby']
+    assert rest(power, 110) == ['standby', 'sleep']
+
+
+def test_no_standby_no_light_rest():
+    power = PanelPower(EPD())
+    assert rest(power, 5) == []
+    assert rest(power, 120) == ['sleep']
+
+
+def test_wake_reports_the_level():
+    power = PanelPower(LightEPD())
+    assert power.wake() is None
+    rest(power, 5)
+    assert power.wake() == epdseq.LIGHT
+    rest(power, 120)
+    assert power.wake() == epdseq.DEEP
+    assert power.eink.calls == ['standby', 'wake', 'sleep', 'wake']
+    assert power.state is None
+    assert power.measured == {epdseq.LIGHT, epdseq.DEEP}
+
+
+def test_wake_without_driver_wake_uses_init():
+    power = PanelPower(EPD())
+    rest(power, 120)
+    power.wake()
+    assert power.eink.calls == ['sleep', 'init']
+
+
+def test_measured_wake_is_smoothed():
+    power = PanelPower(EPD())
+    power.measuredWake(epdseq.DEEP, 2.0)
+    assert power.cost[epdseq.DEEP] == 2.0
+    power.measuredWake(epdseq.DEEP, 1.0)
+    assert abs(power.cost[epdseq.DEEP] - 1.7) < 1e-9
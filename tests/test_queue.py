@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+from PIL import Image
+
+from displaymanager import HIGH, URGENT, Screen, ScreenQueue
+
+
+def blank(name):
+    return Image.new('1', (250, 122), 255)
+
+
+def order(queue, n):
+    return [queue.next().content_args[0] for _ in range(n)]
+
+
+def test_higher_priority_first_within_a_round():
+    queue = ScreenQueue()
+    queue.push(Screen(blank, 'a'))
+    queue.push(Screen(blank, 'b', priority=HIGH))
+    assert order(queue, 4) == ['b', 'a', 'b', 'a']
+
+
+def test_earlier_deadline_first():
+    now = datetime.now()
+    queue = ScreenQueue()
+    queue.push(Screen(blank, 'later', deadline=now + timedelta(minutes=10)))
+    queue.push(Screen(blank, 'sooner', deadline=now + timedelta(minutes=5)))
+    queue.push(Screen(blank, 'never'))
+    assert order(queue, 3) == ['sooner', 'later', 'never']
+
+
+def test_new_screen_joins_the_current_round():
+    queue = ScreenQueue()
+    queue.push(Screen(blank, 'a'))
+    queue.push(Screen(blank, 'b'))
+    assert order(queue, 1) == ['a']
+    queue.push(Screen(blank, 'c'))
+    assert order(queue, 4) == ['b', 'c', 'a', 'b']
+
+
+def test_urgent_and_deadline_screens_show_once():
+    queue = ScreenQueue()
+    queue.push(Screen(blank, 'a'))
+    queue.push(Screen(blank, 'alert', priority=URGENT))
+    queue.push(Screen(blank, 'due', deadline=datetime.now() + timedelta(minutes=5)))
+    assert order(queue, 4) == ['alert', 'due', 'a', 'a']
+    assert len(queue) == 1
+
+
+def test_expired_screens_are_dropped():
+    now = datetime.now()
+    queue = ScreenQueue()
+    queue.push(Screen(blank, 'gone', expires=now - timedelta(seconds=1)))
+    queue.push(Screen(blank, 'missed', deadline=now - timedelta(seconds=1)))
+    queue.push(Screen(blank, 'a'))
+    assert order(queue, 2) == ['a', 'a']
+    assert queue.next(now + timedelta(days=1)).content_args == ('a',)
+
+
+def test_empty_queue():
+    assert ScreenQueue().next() is None
+
+
+def test_same_key_replaces():
+    queue = ScreenQueue()
+    queue.push(Screen(blank, 'a', display_time=3))
+    queue.push(Screen(blank, 'b'))
+    queue.push(Screen(blank, 'a', display_time=9))
+    assert len(queue) == 2
+    assert [screen.display_time for screen in queue] == [9, 3]
+
+
+def test_remove_and_clear():
+    queue = ScreenQueue()
+    queue.push(Screen(blank, 'a'))
+    queue.push(Screen(blank, 'b'))
+    queue.push(Screen(blank, 'alert', priority=URGENT))
+    queue.remove(lambda screen: screen.content_args == ('b',))
+    assert sorted(screen.content_args[0] for screen in queue) == ['a', 'alert']
+    # a rebuild keeps what still waits for its one showing
+    queue.clear()
+    assert [screen.content_args[0] for screen in queue] == ['alert']
+
+
+class Scheduler:
+    def __init__(self) -> None:
+        self.booked = []
+
+    def after(self, delay, func, *args):
+        self.booked.append((delay, func))
+
+
+def test_urgent_screen_preempts(panel):
+    panel.scheduler = Scheduler()
+    panel.addScreenToQueue(Screen(blank, 'a'))
+    assert panel.scheduler.booked == []
+    panel.addScreenToQueue(Screen(blank, 'alert', priority=URGENT))
+    assert panel.scheduler.booked == [(0, panel._preempt)]
@@ -0,0 +1,73 @@
+from datetime import datetime
+
+from displaymanager import RefreshModes, RefreshPolicy, changedFraction
+from lib.waveshare_epd import load
+
+FULL = {'full': None}
+PARTIAL = {'full': None, 'partial': None}
+FAST = {'full': None, 'partial': None, 'fast': None}
+DAY = datetime(2026, 10, 19, 12, 0)
+NIGHT = datetime(2026, 10, 19, 23, 0)
+
+
+def changed(share, size=100):
+    # a frame of size bytes with share of its bits flipped from all white
+    ones = int(size * 8 * share)
+    return bytes([0x00] * (ones // 8) + [0xFF] * (size - ones // 8))
+
+
+def test_changed_fraction():
+    white = bytes([0xFF] * 100)
+    assert changedFraction(white, white) == 0
+    assert changedFraction(white, changed(0.1)) == 0.1
+    assert changedFraction(white, bytes(100)) == 1
+
+
+def test_first_frame_is_full():
+    assert RefreshPolicy().choose(FAST, None, changed(0), 0, now=DAY) == 'full'
+
+
+def test_by_share_changed():
+    policy = RefreshPolicy(partial_below=0.25, full_above=0.6)
+    white = changed(0)
+    assert policy.choose(FAST, white, changed(0.1), 0, now=DAY) == 'partial'
+    assert policy.choose(FAST, white, changed(0.5), 0, now=DAY) == 'fast'
+    assert policy.choose(FAST, white, changed(0.8), 0, now=DAY) == 'full'
+    # what the driver does not have falls through to full
+    assert policy.choose(FULL, white, changed(0.1), 0, now=DAY) == 'full'
+    assert policy.choose(PARTIAL, white, changed(0.5), 0, now=DAY) == 'full'
+
+
+def test_full_after_max_partials():
+    policy = RefreshPolicy(max_partials=5)
+    white = changed(0)
+    assert policy.choose(FAST, white, changed(0.1), 4, now=DAY) == 'partial'
+    assert policy.choose(FAST, white, changed(0.1), 5, now=DAY) == 'full'
+    # twice as many at night
+    assert policy.choose(FAST, white, changed(0.1), 9, now=NIGHT) == 'partial'
+    assert policy.choose(FAST, white, changed(0.1), 10, now=NIGHT) == 'full'
+
+
+def test_quiet_hours_across_midnight():
+    policy = RefreshPolicy(max_partials=5)
+    assert policy.limit(datetime(2026, 10, 19, 21, 59)) == 5
+    assert policy.limit(datetime(2026, 10, 19, 22, 0)) == 10
+    assert policy.limit(datetime(2026, 10, 20, 6, 29)) == 10
+    assert policy.limit(datetime(2026, 10, 20, 6, 30)) == 5
+
+
+def test_screen_hint_wins():
+    policy = RefreshPolicy()
+    white = changed(0)
+    assert policy.choose(FAST, white, changed(0.9), 0, hint=True, now=DAY) == 'partial'
+    assert policy.choose(FAST, white, changed(0), 0, hint=False, now=DAY) == 'full'
+    assert policy.choose(FULL, white, changed(0.9), 0, hint=True, now=DAY) == 'full'
+
+
+def test_modes_found_on_drivers(panel):
+    assert set(RefreshModes(panel.eink).methods) == {'full', 'partial'}
+    assert RefreshModes(panel.eink).base is not None
+    # older drivers switch waveforms through init()
+    epd2in13 = RefreshModes(load('epd2in13').EPD())
+    assert epd2in13.methods['partial'] == epd2in13.methods['full']
+    assert epd2in13._switches('partial')
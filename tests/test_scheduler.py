@@ -0,0 +1,63 @@
+import threading
+import time
+
+from displaymanager import Scheduler
+
+
+def running():
+    scheduler = Scheduler()
+    threading.Thread(target=scheduler.run, daemon=True).start()
+    return scheduler
+
+
+def test_jobs_run_in_time_order():
+    scheduler = running()
+    ran, done = [], threading.Event()
+    scheduler.after(0.06, ran.append, 'c')
+    scheduler.after(0.02, ran.append, 'a')
+    scheduler.after(0.04, ran.append, 'b')
+    scheduler.after(0.08, done.set)
+    assert done.wait(2)
+    assert ran == ['a', 'b', 'c']
+
+
+def test_every_repeats_until_cancelled():
+    scheduler = running()
+    ran = []
+    job = scheduler.every(0.01, ran.append, 1)
+    time.sleep(0.1)
+    job.cancel()
+    count = len(ran)
+    time.sleep(0.05)
+    assert count >= 3
+    assert len(ran) <= count + 1
+
+
+def test_every_waits_for_first():
+    scheduler = running()
+    ran = []
+    scheduler.every(0.01, ran.append, 1, first=10)
+    time.sleep(0.05)
+    assert ran == []
+
+
+def test_a_failing_job_does_not_stop_the_others(capsys):
+    scheduler = running()
+    done = threading.Event()
+
+    def fail():
+        raise ValueError('boom')
+
+    scheduler.after(0, fail)
+    scheduler.after(0.01, done.set)
+    assert done.wait(2)
+    assert 'boom' in capsys.readouterr().out
+
+
+def test_a_job_added_from_another_thread_wakes_the_scheduler():
+    scheduler = running()
+    done = threading.Event()
+    scheduler.after(60, done.set)
+    time.sleep(0.02)
+    threading.Thread(target=scheduler.after, args=(0, done.set)).start()
+    assert done.wait(2)
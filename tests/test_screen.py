@@ -0,0 +1,123 @@
+import time as _time
+
+from PIL import Image, ImageDraw
+
+import displaymanager
+from displaymanager import DwellPolicy, Screen, ScreenQueue, contentDigest, drawClock
+
+
+class Content:
+    # a content function that counts its renders
+    def __init__(self, clock=False) -> None:
+        self.renders = 0
+        self.clock = clock
+
+    def draw(self, text):
+        self.renders += 1
+        image = Image.new('1', (250, 122), 255)
+        ImageDraw.Draw(image).text((5, 60), text, fill=0)
+        if self.clock:
+            drawClock(image, 12)
+        return image
+
+
+class Clock:
+    # time for displaymanager with a wall clock the test sets
+    def __init__(self, now) -> None:
+        self.now = now
+
+    def __getattr__(self, name):
+        return getattr(_time, name)
+
+    def strftime(self, format, *args):
+        return self.now
+
+
+def test_render_reuses_a_fresh_image():
+    content = Content()
+    screen = Screen(content.draw, 'a', max_age=60)
+    assert screen.render() is screen.render()
+    assert content.renders == 1
+    every = Screen(content.draw, 'b')
+    every.render()
+    every.render()
+    assert content.renders == 3
+
+
+def test_rebuild_keeps_the_render():
+    content = Content()
+    queue = ScreenQueue()
+    first = Screen(content.draw, 'a', max_age=60)
+    queue.push(first)
+    queue.next().render()
+    queue.clear()
+    again = Screen(content.draw, 'a', max_age=60)
+    queue.push(again)
+    assert again.render() is first.image
+    assert again.last_updated == first.last_updated
+    assert content.renders == 1
+
+
+def test_other_content_under_the_same_key_is_rendered():
+    content = Content()
+    queue = ScreenQueue()
+    queue.push(Screen(content.draw, 'a', key='slot', max_age=60))
+    queue.next().render()
+    queue.push(Screen(content.draw, 'b', key='slot', max_age=60))
+    queue.next().render()
+    assert content.renders == 2
+
+
+def test_removed_screens_are_not_handed_on():
+    content = Content()
+    queue = ScreenQueue()
+    queue.push(Screen(content.draw, 'a', max_age=60))
+    queue.next().render()
+    queue.clear()
+    queue.remove(lambda screen: True)
+    queue.push(Screen(content.draw, 'a', max_age=60))
+    queue.next().render()
+    assert content.renders == 2
+
+
+def test_reused_render_gets_the_current_clock(monkeypatch, pillow9):
+    clock = Clock('10:00')
+    monkeypatch.setattr(displaymanager, 'time', clock)
+    screen = Screen(Content(clock=True).draw, 'a', max_age=600)
+    at_ten = screen.render()
+    clock.now = '10:07'
+    later = screen.render()
+    assert later is not screen.image
+    assert later.tobytes() != at_ten.tobytes()
+    assert contentDigest(later) == contentDigest(at_ten)
+
+
+class Scheduler:
+    def after(self, delay, func, *args):
+        pass
+
+    def at(self, when, func, *args):
+        pass
+
+
+def test_the_glass_holds_the_rendered_image(panel, monkeypatch, pillow9):
+    clock = Clock('10:00')
+    monkeypatch.setattr(displaymanager, 'time', clock)
+    panel.dwell = DwellPolicy(max_skips=0)
+    screens = [Screen(Content(clock=True).draw, name, max_age=600) for name in ('a', 'b')]
+    for screen in screens:
+        panel.addScreenToQueue(screen)
+    for _ in range(2):
+        panel.rotate(Scheduler())
+        panel.waitForRefresh()
+    clock.now = '10:07'
+    panel.rotate(Scheduler())
+    panel.waitForRefresh()
+    # a reused render, sent with the clock drawn again
+    assert screens[0].image.tobytes() != panel.shown.tobytes()
+    assert panel.shown.tobytes() == screens[0].render().tobytes()
+    assert bytes(panel.frame) == bytes(panel.pack(panel.shown))
+
+    clock.now = '10:09'
+    panel.showScreen(screens[1])
+    assert panel.shown.tobytes() == screens[1].render().tobytes()
@@ -0,0 +1,113 @@
+# The benchmark, metrics and record/replay on the virtual backend; see
+# conftest.py for EPD_BACKEND.
+
+import glob
+import json
+import os
+import time
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+import displaymanager
+import replay
+from displaymanager import DisplayManager, Recorder, Screen, WeatherTracker, readRecording
+from lib.waveshare_epd import epdbench, epdconfig, epdmetrics
+
+
+class Response:
+    def __init__(self, content) -> None:
+        self.status_code = 200
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode()
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class Upstream:
+    # answers the weather API and its icons, the same way every time
+    def get(self, url, params=None, **kwargs):
+        if 'onecall' in url:
+            now = time.time()
+            return Response(json.dumps({
+                'current': {'temp': 68.4, 'weather': [{'main': 'Clear', 'icon': '01d', 'description': 'clear sky'}]},
+                'daily': [{'temp': {'max': 75.0, 'min': 52.0}}],
+                'hourly': [{'temp': 60 + i, 'dt': now + 3600 * i, 'weather': [{'icon': '01d'}]} for i in range(8)],
+            }).encode())
+        if 'img/wn' in url:
+            icon = BytesIO()
+            Image.new('L', (50, 50), 128).save(icon, 'PNG')
+            return Response(icon.getvalue())
+        raise IOError(f'no upstream for {url}')
+
+
+@pytest.fixture
+def manager(monkeypatch, pillow9):
+    # replay.Replay swaps these module globals for its own, put them back
+    for name in ('requests', 'time', 'datetime', 'recorder'):
+        monkeypatch.setattr(displaymanager, name, getattr(displaymanager, name))
+    monkeypatch.setattr(displaymanager, 'requests', Upstream())
+    monkeypatch.setitem(displaymanager.startup_times, 'first screen', 0)
+    manager = DisplayManager()
+    yield manager
+    epdconfig.module_exit(force=True)
+
+
+def test_bench():
+    results = epdbench.run(['epd2in13_V3'], repeat=1)
+    operations = results['epd2in13_V3']
+    assert [operation for operation, r in operations.items() if 'error' in r] == []
+    assert operations['display solid portrait']['bytes'] > 0
+    assert epdbench.over_limits(results) == []
+    assert epdbench.compare(results, results) == []
+
+
+def test_metrics(manager):
+    weather = WeatherTracker(manager, 'KEY', 41.9, -87.6)
+    epdmetrics.reset()
+    epdmetrics.enable()
+    try:
+        for screen in (Screen(weather.weatherScreen), Screen(manager.textScreen, 'hello')):
+            manager.main.refreshScreen(screen)
+            manager.main.waitForRefresh()
+    finally:
+        epdmetrics.enable(False)
+    counters = {name: value for (name, labels), value in epdmetrics.counters.items()}
+    histograms = {name: h.count for (name, labels), h in epdmetrics.histograms.items()}
+    assert counters['refreshes'] > 0
+    assert counters['spi_bytes'] > 0
+    assert histograms['render'] > 0
+    assert histograms['spi'] > 0
+    assert histograms['busy'] > 0
+    assert 'epd_render_seconds_count{screen="textScreen"} 1' in epdmetrics.render()
+
+
+def test_record_replay(manager, tmp_path):
+    recorder = Recorder(str(tmp_path), segment_bytes=20000)
+    recorder.start(manager)
+    try:
+        weather = WeatherTracker(manager, 'KEY', 41.9, -87.6)
+        for screen in (Screen(weather.weatherScreen), Screen(manager.textScreen, 'hello'),
+                       Screen(weather.tempChartScreen)):
+            manager.main.refreshScreen(screen)
+            manager.main.waitForRefresh()
+    finally:
+        recorder.stop()
+    paths = glob.glob(os.path.join(str(tmp_path), 'session-*.jsonl.gz'))
+    records = list(readRecording(paths))
+    assert 'KEY' not in json.dumps(records)
+    assert [r['kind'] for r in records].count('frame') == 3
+
+    run = replay.Replay(readRecording(paths))
+    run.run()
+    assert run.mismatches == []
+    assert run.requests.missing == 0
+    assert not run.skipped
+    results = run.results()
+    assert results['render WeatherTracker.weatherScreen']['n'] == 1
+    assert sum(r['n'] for key, r in results.items() if key.startswith('frame ')) == 3